@@ -87,6 +87,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than shared-cache memory, so concurrent tests get
+        # SQLite's busy timeout instead of immediate table-lock errors
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -138,6 +141,9 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Tests write media (rendered QR codes) to a temporary MEDIA_ROOT
+TEST_RUNNER = 'insuraloop.test_runner.TestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -146,6 +152,84 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Add this near the bottom of the file
 SITE_URL = 'http://localhost:8000'  # Change in production
 
+# Write-behind counters for referral link clicks/visits/conversions.
+# Use BACKEND 'cache' with a shared cache (e.g. memcached or redis) so every
+# worker on the host buffers into the same place.
+REFERRAL_COUNTERS = {
+    'BACKEND': 'local',
+    'CACHE_ALIAS': 'default',
+    'FLUSH_INTERVAL': 5.0,  # seconds; a background thread in each process flushes this often
+    'FLUSH_THRESHOLD': 100,  # pending increments
+}
+
+# Raw click log (ReferralClickEvent). Clicks are buffered per process and
+# written in batches; manage.py rollup_click_events builds the daily rows
+# and deletes raw events older than RETENTION_DAYS.
+REFERRAL_CLICK_EVENTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5.0,  # seconds
+    'FLUSH_THRESHOLD': 1000,  # buffered clicks
+    'BATCH_SIZE': 500,  # rows per INSERT
+    'MAX_PENDING': 50000,  # buffered clicks kept while flushes fail
+    'RETENTION_DAYS': 90,
+}
+
+# Cached code -> link resolution for the landing and lead form views.
+# Unknown codes are cached for MISS_TIMEOUT so probes skip the database.
+# Use a shared cache alias in production so invalidations reach every worker;
+# with the per-process default (LocMemCache) entries live at most LOCAL_TIMEOUT.
+REFERRAL_LINK_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,  # seconds
+    'MISS_TIMEOUT': 30,  # seconds
+    'LOCAL_TIMEOUT': 5,  # seconds
+}
+
+# Cache of AI lead assessments keyed by a hash of the prompt (lead_validation/ai_cache.py).
+# Each process keeps MAX_ENTRIES in memory in front of a table shared by all workers;
+# manage.py purge_ai_cache deletes expired rows.
+AI_ASSESSMENT_CACHE = {
+    'ENABLED': True,
+    'TIMEOUT': 7 * 24 * 3600,  # seconds
+    'MAX_ENTRIES': 10000,
+}
+
+# Client layer for the AI calls (lead_validation/ai_client.py): a per-process
+# concurrency limit, a deadline per call, a circuit breaker that fails fast to
+# the rule pre-screen's score while the API is unhealthy, and pooled keep-alive
+# connections. Staff can read its state at /ai-client-stats/.
+AI_CLIENT = {
+    'MAX_CONCURRENCY': 16,
+    'TIMEOUT': 20.0,  # seconds per call, including the wait for a slot
+    'CONNECT_TIMEOUT': 3.0,
+    'MAX_RETRIES': 0,
+    'FAILURE_THRESHOLD': 5,  # upstream failures in a row
+    'RESET_TIMEOUT': 30.0,  # seconds before a trial call
+    'MAX_CONNECTIONS': 32,
+    'KEEPALIVE_EXPIRY': 30.0,
+}
+
+# Batched AI assessment (lead_validation/ai_batch.py): up to MAX_SIZE leads per
+# request. revalidate_leads batches each chunk's ambiguous leads; with several
+# workers, run_validation_workers waits up to LINGER seconds to fill a batch.
+AI_BATCH = {
+    'MAX_SIZE': 10,  # 1 disables batching
+    'LINGER': 0.05,  # seconds
+    'IN_FLIGHT': 4,
+    'TIMEOUT': 60.0,  # seconds per batched call
+}
+
+# Rule-based pre-screen in front of the AI assessment (lead_validation/prescreen.py).
+# Leads the rule validators settle (risk >= REJECT_RISK, a duplicate above
+# DUPLICATE_CONFIDENCE and, if set, risk <= ACCEPT_RISK) are scored without
+# calling the AI; manage.py prescreen_report shows the calls avoided.
+LEAD_PRESCREEN = {
+    'ENABLED': True,
+    'REJECT_RISK': 80,
+    'ACCEPT_RISK': None,  # opt-in; 10 (BASE_RISK) would settle every lead without rule findings
+    'DUPLICATE_CONFIDENCE': 80,
+}
+
 # Authentication redirects
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = 'referral_system:my_links'  # Change from 'home' to a URL that exists
@@ -184,5 +268,9 @@ CSRF_COOKIE_HTTPONLY = False  # False allows JavaScript to access the CSRF token
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 print(f"OPENAI API KEY IN SETTINGS: {'CONFIGURED' if OPENAI_API_KEY else 'MISSING'}")
 
+# Optional OpenAI-compatible endpoint, e.g. the local fake server used for
+# load testing (manage.py run_fake_ai_server)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', '')
+
 # For testing, you can hardcode the key, but use environment variables in production
 # OPENAI_API_KEY = 'sk-your-key-here'
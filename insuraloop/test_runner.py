@@ -0,0 +1,22 @@
+import tempfile
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the suite with MEDIA_ROOT in a temporary directory: every new
+    ReferralLink pre-renders its QR code (referral_system.signals), which
+    would otherwise land in the real media folder.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._media_root = tempfile.TemporaryDirectory(prefix='insuraloop-media-')
+        self._media_settings = override_settings(MEDIA_ROOT=self._media_root.name)
+        self._media_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._media_settings.disable()
+        self._media_root.cleanup()
+        super().teardown_test_environment(**kwargs)
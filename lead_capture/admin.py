@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Lead
+from .models import Lead, AgentNotificationSetting, LeadNotification
 
 @admin.register(Lead)
 class LeadAdmin(admin.ModelAdmin):
@@ -7,3 +7,15 @@ class LeadAdmin(admin.ModelAdmin):
     list_filter = ('status', 'insurance_type', 'created_at')
     search_fields = ('name', 'email', 'phone')
     date_hierarchy = 'created_at'
+
+@admin.register(AgentNotificationSetting)
+class AgentNotificationSettingAdmin(admin.ModelAdmin):
+    list_display = ('user', 'digest_enabled', 'digest_window_minutes')
+    list_filter = ('digest_enabled',)
+    search_fields = ('user__username', 'user__email')
+
+@admin.register(LeadNotification)
+class LeadNotificationAdmin(admin.ModelAdmin):
+    list_display = ('lead', 'agent', 'status', 'attempts', 'sent_in_digest', 'created_at', 'sent_at')
+    list_filter = ('status', 'sent_in_digest')
+    raw_id_fields = ('lead', 'agent')
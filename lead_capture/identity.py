@@ -0,0 +1,74 @@
+# Normalized identity keys stored on Lead. Duplicate checks compare these
+# with plain equality so they can use indexes instead of iexact/endswith scans.
+import re
+
+# Domains that deliver to the same mailbox as another domain
+EMAIL_DOMAIN_ALIASES = {
+    'googlemail.com': 'gmail.com',
+}
+
+# Providers that ignore dots in the local part
+DOTLESS_EMAIL_DOMAINS = frozenset({'gmail.com'})
+
+# Providers that deliver user+tag@domain to user@domain
+PLUS_TAG_EMAIL_DOMAINS = frozenset({
+    'gmail.com', 'outlook.com', 'hotmail.com', 'live.com', 'msn.com',
+    'icloud.com', 'me.com', 'mac.com', 'fastmail.com', 'protonmail.com', 'proton.me',
+})
+
+_NON_DIGITS = re.compile(r'\D')
+_NAME_JUNK = re.compile(r"[^\w\s'-]")
+
+def normalize_email(email):
+    """Case-folded, provider-aware canonical form of an email address"""
+    if not email:
+        return ''
+    email = email.strip().casefold()
+    if email.count('@') != 1:
+        return email
+    local, domain = email.split('@')
+    domain = EMAIL_DOMAIN_ALIASES.get(domain, domain)
+    if domain in PLUS_TAG_EMAIL_DOMAINS:
+        local = local.split('+', 1)[0]
+    if domain in DOTLESS_EMAIL_DOMAINS:
+        local = local.replace('.', '')
+    return f"{local}@{domain}"
+
+def normalize_phone(phone):
+    """E.164 form of a phone number, assuming US numbers unless a + prefix is given"""
+    if not phone:
+        return ''
+    digits = _NON_DIGITS.sub('', phone)
+    if not digits:
+        return ''
+    if phone.strip().startswith('+'):
+        return f"+{digits}"[:16]
+    if len(digits) == 10:
+        return f"+1{digits}"
+    if len(digits) == 11 and digits.startswith('1'):
+        return f"+{digits}"
+    return f"+{digits}"[:16]
+
+def normalize_zip(zip_code):
+    """5-digit ZIP (ZIP+4 suffixes are dropped)"""
+    if not zip_code:
+        return ''
+    return zip_code.strip()[:5]
+
+def name_zip_key(name, zip_code):
+    """Case-folded, whitespace-collapsed name joined with the 5-digit ZIP"""
+    zip5 = normalize_zip(zip_code)
+    if not name or not zip5:
+        return ''
+    name = ' '.join(_NAME_JUNK.sub('', name.casefold()).split())
+    if not name:
+        return ''
+    return f"{name}|{zip5}"
+
+def identity_keys(email, phone, name, zip_code):
+    """All identity keys for a lead as a dict matching the Lead field names"""
+    return {
+        'email_normalized': normalize_email(email),
+        'phone_e164': normalize_phone(phone),
+        'name_zip_key': name_zip_key(name, zip_code),
+    }
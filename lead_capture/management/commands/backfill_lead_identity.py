@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lead_capture.identity import identity_keys
+from lead_capture.models import Lead
+
+class Command(BaseCommand):
+    help = 'Fills the normalized identity columns (email, phone, name+ZIP) on existing leads in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Leads read and updated per transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every lead, not only leads with no normalized email')
+        parser.add_argument('--start-id', type=int, default=0,
+                            help='Resume after this lead ID')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = options['start_id']
+        updated = 0
+        started = time.monotonic()
+
+        base = Lead.objects.all()
+        if not options['all']:
+            base = base.filter(email_normalized='')
+
+        while True:
+            # Walk the primary key so every chunk is an indexed range scan
+            chunk = list(
+                base.filter(id__gt=last_id).order_by('id')
+                .only('id', 'email', 'phone', 'name', 'zip_code', *Lead.IDENTITY_FIELDS)[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            for lead in chunk:
+                for field, value in identity_keys(lead.email, lead.phone, lead.name, lead.zip_code).items():
+                    setattr(lead, field, value)
+            with transaction.atomic():
+                Lead.objects.bulk_update(chunk, Lead.IDENTITY_FIELDS)
+
+            last_id = chunk[-1].id
+            updated += len(chunk)
+            self.stdout.write(f'Backfilled {updated} leads (last ID {last_id})')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Backfilled identity keys for {updated} leads in {elapsed:.1f}s'))
@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand
+from django.core.mail import get_connection
+from lead_capture.notifications import send_notifications_forever, send_pending_notifications
+
+class Command(BaseCommand):
+    help = (
+        'Delivers queued new lead notifications over one pooled SMTP connection per batch. '
+        'To benchmark throughput, run a local debugging server '
+        '(python -m aiosmtpd -n -l localhost:1025) and pass --smtp-host/--smtp-port.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Maximum outbox entries processed per batch')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between polls in --loop mode')
+        parser.add_argument('--smtp-host', help='Send through this SMTP host instead of EMAIL_BACKEND')
+        parser.add_argument('--smtp-port', type=int, default=25)
+
+    def handle(self, *args, **options):
+        connection_factory = None
+        if options['smtp_host']:
+            def connection_factory():
+                return get_connection(
+                    'django.core.mail.backends.smtp.EmailBackend',
+                    host=options['smtp_host'],
+                    port=options['smtp_port'],
+                )
+
+        if options['loop']:
+            send_notifications_forever(
+                batch_size=options['batch_size'],
+                interval=options['interval'],
+                stdout=self.stdout,
+                connection_factory=connection_factory,
+            )
+            return
+
+        total = 0
+        started = time.monotonic()
+        while True:
+            connection = connection_factory() if connection_factory else None
+            claimed, sent = send_pending_notifications(batch_size=options['batch_size'], connection=connection)
+            total += sent
+            # Failed rows are back in the outbox and count an attempt each time, so this ends
+            if not claimed:
+                break
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Sent {total} emails in {elapsed:.2f}s ({rate:.1f} emails/s)'))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_capture', '0002_lead_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='email_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=254),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='name_zip_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=270),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_capture', '0003_lead_identity_keys'),
+        ('referral_system', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['agent', 'updated_at', 'id'], name='lead_agent_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['referral_link', 'updated_at', 'id'], name='lead_link_updated_idx'),
+        ),
+    ]
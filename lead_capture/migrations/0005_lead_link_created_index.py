@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_capture', '0004_lead_export_indexes'),
+        ('referral_system', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['referral_link', 'created_at', 'id'], name='lead_link_created_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+from lead_capture.identity import identity_keys
+
+CHUNK_SIZE = 2000
+
+
+def backfill_identity_keys(apps, schema_editor):
+    """
+    Fill the identity keys of leads created before 0003 added them, so the
+    duplicate checks, which compare only the keys, also match those leads.
+    manage.py backfill_lead_identity --all recomputes them after the
+    normalization rules change.
+    """
+    Lead = apps.get_model('lead_capture', 'Lead')
+    fields = ['email_normalized', 'phone_e164', 'name_zip_key']
+    pending = Lead.objects.filter(email_normalized='', phone_e164='')
+    last_id = 0
+    while True:
+        chunk = list(
+            pending.filter(id__gt=last_id).order_by('id')
+            .only('id', 'email', 'phone', 'name', 'zip_code', *fields)[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for lead in chunk:
+            for field, value in identity_keys(lead.email, lead.phone, lead.name, lead.zip_code).items():
+                setattr(lead, field, value)
+        Lead.objects.bulk_update(chunk, fields)
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_capture', '0006_lead_notification_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_identity_keys, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from referral_system.models import ReferralLink
 from django.contrib.auth.models import User
+from .identity import identity_keys
 
 class Lead(models.Model):
     """Information about a potential customer (lead)"""
@@ -70,6 +71,11 @@ class Lead(models.Model):
     user_agent = models.TextField(blank=True, null=True)
     is_duplicate = models.BooleanField(default=False)
     
+    # Normalized identity keys for indexed duplicate detection (see identity.py)
+    email_normalized = models.CharField(max_length=254, blank=True, default='', db_index=True)
+    phone_e164 = models.CharField(max_length=16, blank=True, default='', db_index=True)
+    name_zip_key = models.CharField(max_length=270, blank=True, default='', db_index=True)
+    
     # Lead Validation fields
     validation_score = models.IntegerField(default=0, help_text="Overall quality score (0-100)")
     validation_details = models.JSONField(blank=True, null=True, help_text="Detailed validation results")
@@ -97,21 +103,61 @@ class Lead(models.Model):
     referral_link = models.ForeignKey(ReferralLink, on_delete=models.SET_NULL, null=True, related_name='leads')
     agent = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='leads')
     
+    class Meta:
+        indexes = [
+            # Lead exports page through an agent's or a link's leads by (updated_at, id)
+            models.Index(fields=['agent', 'updated_at', 'id'], name='lead_agent_updated_idx'),
+            models.Index(fields=['referral_link', 'updated_at', 'id'], name='lead_link_updated_idx'),
+            # Dashboard lists page newest first by (created_at, id)
+            models.Index(fields=['referral_link', 'created_at', 'id'], name='lead_link_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.name} - {self.get_insurance_type_display()} ({self.get_status_display()})"
     
+    # Fields the identity keys are derived from
+    IDENTITY_SOURCE_FIELDS = {'email', 'phone', 'name', 'zip_code'}
+    IDENTITY_FIELDS = ['email_normalized', 'phone_e164', 'name_zip_key']
+    
+    def refresh_identity_keys(self):
+        """Recompute the normalized identity columns from the raw fields"""
+        for field, value in identity_keys(self.email, self.phone, self.name, self.zip_code).items():
+            setattr(self, field, value)
+    
+    # Fields the referral stats rollup is keyed on (referral_system.stats)
+    STATS_FIELDS = ('agent_id', 'referral_link_id', 'status', 'validation_score')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stats fields as loaded so a save can update the rollup by delta"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stats = instance.stats_snapshot()
+        return instance
+    
+    def stats_snapshot(self):
+        """(agent_id, referral_link_id, status, validation_score), or None if any is deferred"""
+        if any(field not in self.__dict__ for field in self.STATS_FIELDS):
+            return None
+        return tuple(self.__dict__[field] for field in self.STATS_FIELDS)
+    
     def save(self, *args, **kwargs):
         """Override save method to set default values or perform other actions"""
-        # Debug ZIP code
-        print(f"SAVING LEAD IN MODEL - ZIP CODE: '{self.zip_code}'")
+        self.refresh_identity_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Partial saves still bump updated_at, which incremental exports page on
+            update_fields = set(update_fields) | {'updated_at'}
+            if self.IDENTITY_SOURCE_FIELDS.intersection(update_fields):
+                update_fields |= set(self.IDENTITY_FIELDS)
+            kwargs['update_fields'] = update_fields
         
         # If this is a new lead, set the agent from the referral link
-        if not self.pk and self.referral_link and not self.agent:
-            self.agent = self.referral_link.user
+        if not self.pk and self.referral_link_id and not self.agent_id:
+            self.agent_id = self.referral_link.user_id
             
         # If this is a new lead, set the reward amount
-        if not self.pk and self.referral_link and not self.reward_amount:
-            self.reward_amount = self.referral_link.get_reward_amount()
+        if not self.pk and self.referral_link_id and not self.reward_amount:
+            self.reward_amount = self.referral_link.get_reward_amount(self.state)
             
         super().save(*args, **kwargs)
         
@@ -124,3 +170,46 @@ class Lead(models.Model):
             return "Medium"
         else:
             return "Low"
+
+
+class AgentNotificationSetting(models.Model):
+    """Per-agent preferences for new lead notifications"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_settings')
+    digest_enabled = models.BooleanField(default=False,
+                                         help_text="Collapse bursts of new leads into a single digest email")
+    digest_window_minutes = models.PositiveIntegerField(default=15,
+                                                        help_text="How long to collect leads before sending a digest")
+
+    def __str__(self):
+        return f"Notification Settings for {self.user.username}"
+
+
+class LeadNotification(models.Model):
+    """Outbox entry for a new lead email, written in the same transaction as the lead"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='notifications')
+    agent = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lead_notifications')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    
+    # Set while a sender holds the row (see notifications.claim_notifications)
+    claim_token = models.CharField(max_length=32, blank=True, default='', db_index=True)
+    claimed_until = models.DateTimeField(blank=True, null=True)
+    sent_in_digest = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='lead_notification_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification for Lead {self.lead_id} to {self.agent_id} ({self.status})"
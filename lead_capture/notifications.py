@@ -0,0 +1,215 @@
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Min, Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from .models import AgentNotificationSetting, LeadNotification
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# A claim older than this belongs to a sender that died mid-batch
+CLAIM_SECONDS = 300
+
+def _dashboard_url():
+    return f"{settings.BASE_URL}{reverse('referral_system:my_links')}"
+
+def build_lead_email(lead, agent):
+    """Render the new lead email for one lead"""
+    insurance_type = lead.get_insurance_type_display() or "Insurance Lead"
+    context = {
+        'lead': lead,
+        'agent': agent,
+        'agent_name': agent.get_full_name() or agent.username,
+        'lead_name': lead.name or "Not provided",
+        'lead_email': lead.email or "Not provided",
+        'lead_phone': lead.phone or "Not provided",
+        'insurance_type': insurance_type,
+        'dashboard_url': _dashboard_url(),
+        'date_submitted': lead.created_at.strftime("%B %d, %Y at %I:%M %p") if lead.created_at else "Just now",
+        'referral_source': lead.referral_link.name if lead.referral_link else "Direct Referral",
+    }
+    message = EmailMultiAlternatives(
+        subject=f"New Lead: {lead.name or 'New Lead'} - {insurance_type}",
+        body=render_to_string('lead_capture/email/new_lead_notification.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[agent.email],
+    )
+    message.attach_alternative(render_to_string('lead_capture/email/new_lead_notification.html', context), 'text/html')
+    return message
+
+def build_digest_email(agent, leads):
+    """Render one email summarising several new leads for the same agent"""
+    context = {
+        'agent': agent,
+        'agent_name': agent.get_full_name() or agent.username,
+        'leads': leads,
+        'dashboard_url': _dashboard_url(),
+    }
+    message = EmailMultiAlternatives(
+        subject=f"{len(leads)} New Leads",
+        body=render_to_string('lead_capture/email/new_lead_digest.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[agent.email],
+    )
+    message.attach_alternative(render_to_string('lead_capture/email/new_lead_digest.html', context), 'text/html')
+    return message
+
+def _digest_windows(agent_ids):
+    """Return {agent_id: window} for agents that opted into digests"""
+    return {
+        setting.user_id: timedelta(minutes=setting.digest_window_minutes)
+        for setting in AgentNotificationSetting.objects.filter(user_id__in=agent_ids, digest_enabled=True)
+    }
+
+def _held_agent_ids(now):
+    """Digest agents whose oldest pending lead is still inside their window"""
+    window_field = 'agent__notification_settings__digest_window_minutes'
+    oldest_pending = (
+        LeadNotification.objects.filter(status='pending', agent__notification_settings__digest_enabled=True)
+        .values('agent_id', window_field)
+        .annotate(oldest=Min('created_at'))
+        .order_by()
+    )
+    return [
+        row['agent_id'] for row in oldest_pending
+        if now - row['oldest'] < timedelta(minutes=row[window_field])
+    ]
+
+def claim_notifications(batch_size, now=None):
+    """
+    Claim up to `batch_size` outbox rows for this sender, oldest first.
+
+    Rows held for a digest are left out of the query, so they never fill the
+    batch ahead of rows that are due. A claim is a conditional UPDATE tagged
+    with a fresh token (like lead_validation.queue.lease_jobs), so concurrent
+    senders never get the same row; it counts as an attempt, and a claim left
+    behind by a sender that died is picked up again once it expires.
+    """
+    now = now or timezone.now()
+    expired = Q(status='sending', claimed_until__lt=now)
+    gave_up = LeadNotification.objects.filter(expired, attempts__gte=MAX_ATTEMPTS).update(
+        status='failed', claim_token='', claimed_until=None, last_error='Claim expired on the last attempt',
+    )
+    if gave_up:
+        logger.error(f"{gave_up} lead notifications failed permanently after their last claim expired")
+
+    ready = (Q(status='pending') & ~Q(agent_id__in=_held_agent_ids(now))) | (expired & Q(attempts__lt=MAX_ATTEMPTS))
+    candidate_ids = list(LeadNotification.objects.filter(ready).order_by('id').values_list('id', flat=True)[:batch_size])
+    if not candidate_ids:
+        return []
+
+    token = uuid.uuid4().hex
+    LeadNotification.objects.filter(ready, id__in=candidate_ids).update(
+        status='sending',
+        claim_token=token,
+        claimed_until=now + timedelta(seconds=CLAIM_SECONDS),
+        attempts=F('attempts') + 1,
+    )
+    return list(
+        LeadNotification.objects.filter(claim_token=token, status='sending')
+        .select_related('lead', 'lead__referral_link', 'agent')
+        .order_by('id')
+    )
+
+def _claimed(notification_ids, token):
+    return LeadNotification.objects.filter(id__in=notification_ids, claim_token=token, status='sending')
+
+def _release(notification_ids, token):
+    """Hand claimed rows back without counting the attempt"""
+    _claimed(notification_ids, token).update(
+        status='pending', claim_token='', claimed_until=None, attempts=F('attempts') - 1,
+    )
+
+def _record_failure(notification_ids, token, error):
+    """Return claimed rows to pending, or fail them once they used up their attempts"""
+    released = {'claim_token': '', 'claimed_until': None, 'last_error': str(error)}
+    _claimed(notification_ids, token).filter(attempts__gte=MAX_ATTEMPTS).update(status='failed', **released)
+    _claimed(notification_ids, token).update(status='pending', **released)
+
+def send_pending_notifications(batch_size=100, connection=None):
+    """
+    Deliver pending outbox entries over a single SMTP connection.
+
+    Agents with digest mode enabled get one email per burst: their pending
+    leads are held until the oldest one is older than the digest window,
+    then sent together. Returns (outbox rows claimed, emails sent): a digest
+    covers several rows and failed rows go back to the outbox, so only
+    a batch that claims nothing means the outbox is drained.
+    """
+    now = timezone.now()
+    pending = claim_notifications(batch_size, now)
+    if not pending:
+        return 0, 0
+    token = pending[0].claim_token
+
+    by_agent = defaultdict(list)
+    for notification in pending:
+        by_agent[notification.agent_id].append(notification)
+    digest_windows = _digest_windows(by_agent.keys())
+
+    # Each outgoing email paired with the outbox rows it covers
+    outgoing = []
+    for agent_id, notifications in by_agent.items():
+        agent = notifications[0].agent
+        if not agent.email:
+            _record_failure([n.id for n in notifications], token, "Agent has no email address")
+            continue
+
+        window = digest_windows.get(agent_id)
+        if window is None:
+            for notification in notifications:
+                outgoing.append((build_lead_email(notification.lead, agent), [notification.id], False))
+        elif now - notifications[0].created_at >= window:
+            leads = [n.lead for n in notifications]
+            message = build_lead_email(leads[0], agent) if len(leads) == 1 else build_digest_email(agent, leads)
+            outgoing.append((message, [n.id for n in notifications], len(leads) > 1))
+        else:
+            # The agent turned digests on, or a burst started, after the claim query
+            _release([n.id for n in notifications], token)
+
+    if not outgoing:
+        return len(pending), 0
+
+    connection = connection or get_connection(fail_silently=False)
+    sent = 0
+    try:
+        connection.open()
+        for message, notification_ids, is_digest in outgoing:
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                logger.error(f"Error sending lead notification to {message.to}: {str(e)}")
+                _record_failure(notification_ids, token, e)
+                continue
+            _claimed(notification_ids, token).update(
+                status='sent', sent_at=timezone.now(), sent_in_digest=is_digest, claim_token='', claimed_until=None,
+            )
+            sent += 1
+    except Exception as e:
+        logger.error(f"Error opening email connection: {str(e)}")
+        # Rows not sent yet; the ones already handled are no longer claimed
+        _record_failure([n.id for n in pending], token, e)
+    finally:
+        connection.close()
+
+    return len(pending), sent
+
+def send_notifications_forever(batch_size=100, interval=5.0, stdout=None, connection_factory=None):
+    """Poll the outbox and report throughput per batch"""
+    while True:
+        started = time.monotonic()
+        connection = connection_factory() if connection_factory else None
+        claimed, sent = send_pending_notifications(batch_size=batch_size, connection=connection)
+        elapsed = time.monotonic() - started
+        if sent and stdout:
+            stdout.write(f"Sent {sent} emails in {elapsed:.2f}s ({sent / elapsed:.1f} emails/s)")
+        if claimed < batch_size:
+            time.sleep(interval)
@@ -0,0 +1,77 @@
+import logging
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+from referral_system.models import ReferralLink
+from referral_system.rates import resolve_rate
+from referral_system.stats import apply_agent_delta
+from lead_validation.near_duplicates import index_lead
+from lead_validation.queue import enqueue_validation
+from .identity import normalize_email
+from .models import Lead
+
+logger = logging.getLogger(__name__)
+
+
+class InactiveReferralLink(Exception):
+    """The referral link was deactivated or deleted while the lead was being submitted"""
+
+
+def submit_lead(link, lead):
+    """
+    Save a new lead from a referral link as one atomic unit.
+
+    Inside a single transaction this
+      1. appends a note to an existing lead with the same email instead of
+         creating a duplicate,
+      2. inserts the lead (its post_save signals write the notification outbox
+         row and count the lead in the agent's and link's stats),
+      3. stores its near-duplicate bucket keys and queues the validation job,
+      4. credits the link's conversions, paid conversions and earnings in one
+         conditional UPDATE, which only matches while the link is active,
+         and adds the same amounts to the agent's stats row.
+    The notification email and AI validation run in their own workers and only
+    see the rows once the transaction commits.
+
+    Returns (lead, created). Raises InactiveReferralLink (and rolls back) if
+    the link stopped being active.
+    """
+    # The rate table is compiled in-process, so this normally costs no query
+    payment_amount = resolve_rate(link.user_id, lead.state or link.target_state, lead.insurance_type)
+    lead.referral_link = link
+    lead.agent_id = link.user_id
+
+    with transaction.atomic():
+        existing_id = (
+            Lead.objects.filter(email_normalized=normalize_email(lead.email))
+            .values_list('id', flat=True).first()
+        )
+        if existing_id:
+            note = f"\n[DUPLICATE SUBMISSION: {timezone.now()}]"
+            Lead.objects.filter(pk=existing_id).update(
+                notes=Concat(Coalesce('notes', Value('')), Value(note)),
+                updated_at=timezone.now(),
+            )
+            return Lead(pk=existing_id), False
+
+        lead.save()
+        # Findable by near-duplicate checks from the moment it commits
+        index_lead(lead, replace=False)
+        enqueue_validation(lead.id, check_existing=False)
+
+        credited = ReferralLink.objects.filter(pk=link.pk, is_active=True).update(
+            conversions=F('conversions') + 1,
+            paid_conversions=F('paid_conversions') + 1,
+            earnings=F('earnings') + payment_amount,
+        )
+        if not credited:
+            raise InactiveReferralLink(link.code)
+        apply_agent_delta(link.user_id, {
+            'conversions': 1, 'paid_conversions': 1, 'earnings': payment_amount,
+        })
+
+        transaction.on_commit(
+            lambda: logger.info(f"Lead {lead.id} submitted via link {link.code} (+{payment_amount})")
+        )
+    return lead, True
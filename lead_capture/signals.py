@@ -1,44 +1,48 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.urls import reverse
-from django.conf import settings
-from .models import Lead
+from referral_system.stats import lead_changed, rebuild_agent_stats, rebuild_link_stats
+from .models import Lead, LeadNotification
 
 @receiver(post_save, sender=Lead)
 def notify_agent_of_new_lead(sender, instance, created, **kwargs):
-    """Send an email notification to the agent when a new lead is created"""
-    if created:
-        lead = instance
-        agent = lead.agent
-        
-        # Generate the dashboard URL
-        dashboard_url = f"{settings.BASE_URL}{reverse('referral_system:my_links')}"
-        
-        # Create the context for the email template with default values for empty fields
-        context = {
-            'agent_name': agent.get_full_name() or agent.username,
-            'lead_name': lead.name or "Not provided",
-            'lead_email': lead.email or "Not provided", 
-            'lead_phone': lead.phone or "Not provided",
-            'insurance_type': lead.get_insurance_type_display() if hasattr(lead, 'get_insurance_type_display') else lead.insurance_type or "Not specified",
-            'dashboard_url': dashboard_url,
-            'date_submitted': lead.created_at.strftime("%B %d, %Y at %I:%M %p") if lead.created_at else "Just now",
-            'referral_source': lead.referral_link.name if lead.referral_link else "Direct Referral",
-        }
-        
-        # Render the email content from a template
-        email_subject = f"New Lead: {lead.name or 'New Lead'} - {lead.get_insurance_type_display() if hasattr(lead, 'get_insurance_type_display') else lead.insurance_type or 'Insurance Lead'}"
-        email_html = render_to_string('lead_capture/email/new_lead_notification.html', context)
-        email_plain = render_to_string('lead_capture/email/new_lead_notification.txt', context)
-        
-        # Send the email
-        send_mail(
-            subject=email_subject,
-            message=email_plain,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[agent.email],
-            html_message=email_html,
-            fail_silently=False,
-        ) 
\ No newline at end of file
+    """
+    Queue an email notification to the agent when a new lead is created.
+    The outbox row is written in the lead's transaction; delivery happens in
+    manage.py send_lead_notifications so SMTP never slows down or breaks a
+    submission.
+    """
+    if created and instance.agent_id:
+        LeadNotification.objects.create(lead=instance, agent_id=instance.agent_id)
+
+_STATS_UPDATE_FIELDS = {'agent', 'agent_id', 'referral_link', 'referral_link_id', 'status', 'validation_score'}
+
+@receiver(post_save, sender=Lead)
+def update_referral_stats(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep AgentStats/LinkStats in step with the lead, in the lead's transaction.
+    Only the difference between the loaded and saved status, quality band and
+    owner is applied, so most saves cost no extra query.
+    """
+    if update_fields is not None and not _STATS_UPDATE_FIELDS.intersection(update_fields):
+        return
+    after = instance.stats_snapshot()
+    before = None if created else getattr(instance, '_loaded_stats', None)
+    if after is None or (before is None and not created):
+        # Not loaded from the database (or fields deferred): recount the stored owners instead
+        agent_id, link_id = Lead.objects.filter(pk=instance.pk).values_list('agent_id', 'referral_link_id').get()
+        if agent_id:
+            rebuild_agent_stats(agent_id)
+        if link_id:
+            rebuild_link_stats(link_id)
+        after = None
+    elif before != after:
+        lead_changed(before, after)
+    instance._loaded_stats = after
+
+@receiver(post_delete, sender=Lead)
+def remove_from_referral_stats(sender, instance, **kwargs):
+    """Take a deleted lead out of its agent's and link's stats"""
+    before = getattr(instance, '_loaded_stats', None) or instance.stats_snapshot()
+    if before:
+        # Never create rows here: the agent or link may be part of the same cascade delete
+        lead_changed(before, None, create_missing=False)
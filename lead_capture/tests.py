@@ -1,3 +1,254 @@
-from django.test import TestCase
+import importlib
+import io
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from lead_validation.models import ValidationJob
+from lead_validation.utils import DUPLICATE_MATCH_LIMIT, check_for_duplicate_lead
+from referral_system.clicks import reset_click_buffer
+from referral_system.counters import reset_counters
+from referral_system.models import PaymentRate, ReferralClickEvent, ReferralLink
+from referral_system.rates import get_rate_table, invalidate_rate_table
+from referral_system.stats import reconcile_stats
+from .identity import normalize_email
+from .models import AgentNotificationSetting, Lead, LeadNotification
+from .notifications import MAX_ATTEMPTS, claim_notifications, send_pending_notifications
+from .services import submit_lead
+from .views import step4_confirmation
 
-# Create your tests here.
+
+class LeadSubmissionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='secret')
+        cls.link = ReferralLink.objects.create(user=cls.agent, name='Spring', code='spring1',
+                                               referral_type='customer', insurance_type='auto')
+        PaymentRate.objects.create(state='', insurance_type='auto', rate_amount=Decimal('40.00'))
+        # Stats rows exist for any agent with activity; creating them isn't what is measured
+        reconcile_stats()
+
+    def setUp(self):
+        # Compile the rate table up front so its one-off load isn't counted
+        invalidate_rate_table()
+        get_rate_table()
+        self.url = reverse('lead_capture:lead_form', args=[self.link.code])
+        self.form = {'name': 'Dana Reyes', 'email': 'dana.reyes@example.com',
+                     'phone': '555-201-3344', 'zip_code': '10001', 'insurance_type': 'auto'}
+
+    def test_submission_query_count(self):
+        # link lookup, savepoint, duplicate check, lead insert, notification
+        # outbox insert, agent and link stats updates, similarity key insert,
+        # validation job insert, link credit update, agent stats credit
+        # update, release
+        with self.assertNumQueries(12):
+            response = self.client.post(self.url, self.form)
+
+        lead = Lead.objects.get()
+        self.assertRedirects(response, reverse('lead_capture:thank_you', args=[lead.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(lead.agent_id, self.agent.id)
+        self.assertTrue(LeadNotification.objects.filter(lead=lead).exists())
+        self.assertTrue(ValidationJob.objects.filter(lead=lead).exists())
+
+        self.link.refresh_from_db()
+        self.assertEqual(self.link.conversions, 1)
+        self.assertEqual(self.link.paid_conversions, 1)
+        self.assertEqual(self.link.earnings, Decimal('40.00'))
+
+        stats = self.agent.referral_stats
+        self.assertEqual((stats.leads_total, stats.leads_new, stats.leads_low), (1, 1, 1))
+        self.assertEqual((stats.conversions, stats.earnings), (1, Decimal('40.00')))
+        self.assertEqual(self.link.stats.leads_total, 1)
+
+        # Status changes and scoring move the lead between columns
+        lead.status = 'quoted'
+        lead.validation_score = 85
+        lead.save()
+        stats.refresh_from_db()
+        self.assertEqual((stats.leads_new, stats.leads_quoted), (0, 1))
+        self.assertEqual((stats.leads_low, stats.leads_high), (0, 1))
+        self.assertEqual(reconcile_stats(fix=False), ([], []))
+
+    def test_duplicate_submission_is_not_credited(self):
+        self.client.post(self.url, self.form)
+        with self.assertNumQueries(5):
+            self.client.post(self.url, dict(self.form, email='Dana.Reyes@Example.com'))
+
+        lead = Lead.objects.get()
+        self.assertIn('DUPLICATE SUBMISSION', lead.notes)
+        self.link.refresh_from_db()
+        self.assertEqual(self.link.paid_conversions, 1)
+
+    def test_multi_step_confirmation_submits_once(self):
+        # The step views are not routed; call the last one with a filled-in session
+        def confirm(email):
+            request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+            SessionMiddleware(lambda request: None).process_request(request)
+            request.session.update({'insurance_type': 'auto', 'name': 'Dana Reyes', 'email': email,
+                                    'phone': '(212) 867-2093', 'zip_code': '10001', 'state': 'NY'})
+            request._messages = FallbackStorage(request)
+            return step4_confirmation(request, self.link.code)
+
+        response = confirm('dana.reyes@example.com')
+        lead = Lead.objects.get()
+        self.assertEqual(response.url, reverse('lead_capture:thank_you', args=[lead.id]))
+        self.assertEqual(ValidationJob.objects.filter(lead=lead).count(), 1)
+
+        confirm('Dana.Reyes@Example.com')
+        self.assertEqual(Lead.objects.count(), 1)
+        self.link.refresh_from_db()
+        self.assertEqual((self.link.conversions, self.link.earnings), (1, Decimal('40.00')))
+        self.assertEqual(self.agent.referral_stats.earnings, Decimal('40.00'))
+
+
+class LeadIdentityTests(TestCase):
+    """Duplicate checks compare provider-aware identity keys, for old leads too"""
+
+    def test_normalize_email(self):
+        for email, expected in [
+            ('John.Doe+quotes@Gmail.com', 'johndoe@gmail.com'),
+            (' j.o.h.n.doe@googlemail.com ', 'johndoe@gmail.com'),
+            ('john.doe+quotes@outlook.com', 'john.doe@outlook.com'),
+            ('john.doe+quotes@example.com', 'john.doe+quotes@example.com'),
+            ('not-an-address', 'not-an-address'),
+            ('', ''),
+        ]:
+            self.assertEqual(normalize_email(email), expected, email)
+
+    def test_gmail_variants_are_duplicates(self):
+        agent = User.objects.create_user('agent')
+        link = ReferralLink.objects.create(user=agent, code='ident1')
+        lead, created = submit_lead(link, Lead(name='John Doe', email='johndoe@gmail.com', phone='3128672093',
+                                               insurance_type='auto'))
+        again, created_again = submit_lead(link, Lead(name='John Doe', email='John.Doe+quotes@googlemail.com',
+                                                      phone='3128670000', insurance_type='auto'))
+        self.assertEqual((created, created_again, again.pk), (True, False, lead.pk))
+
+    def test_email_match_beats_crowded_name_zip(self):
+        crowd = [Lead(name='John Doe', email=f'john.doe{n}@example.com', phone=f'3128{n:06d}', zip_code='60614',
+                      insurance_type='auto') for n in range(DUPLICATE_MATCH_LIMIT + 5)]
+        for lead in crowd:
+            lead.refresh_identity_keys()
+        Lead.objects.bulk_create(crowd)
+        original = Lead.objects.create(name='John Doe', email='jd@example.com', phone='6465550100',
+                                       zip_code='60614', insurance_type='auto')
+        is_duplicate, confidence, matches, fields = check_for_duplicate_lead(
+            {'name': 'John Doe', 'email': 'JD@example.com', 'phone': '2125550100', 'zip_code': '60614'})
+        self.assertEqual((is_duplicate, confidence, [lead.id for lead in matches], fields),
+                         (True, 95, [original.id], ['email']))
+
+    def test_migration_backfills_old_leads(self):
+        lead = Lead.objects.create(name='Old Lead', email='Old.Lead+x@gmail.com', phone='(312) 867-2093',
+                                   zip_code='60614-1234', insurance_type='auto')
+        Lead.objects.filter(pk=lead.pk).update(email_normalized='', phone_e164='', name_zip_key='')
+        migration = importlib.import_module('lead_capture.migrations.0007_backfill_lead_identity')
+        migration.backfill_identity_keys(apps, None)
+        self.assertEqual(Lead.objects.filter(pk=lead.pk).values_list(*Lead.IDENTITY_FIELDS).get(),
+                         ('oldlead@gmail.com', '+13128672093', 'old lead|60614'))
+
+
+@override_settings(REFERRAL_COUNTERS={'FLUSH_THRESHOLD': 1}, REFERRAL_CLICK_EVENTS={'FLUSH_THRESHOLD': 1})
+class AsyncLeadCaptureTests(TestCase):
+    """The ASGI form view writes its clicks when the buffers flush"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='secret')
+        cls.link = ReferralLink.objects.create(user=cls.agent, code='async1')
+
+    def setUp(self):
+        cache.clear()
+        for reset in (reset_counters, reset_click_buffer):
+            reset()
+            self.addCleanup(reset)
+
+    async def test_form_view_flushes_clicks(self):
+        response = await self.async_client.get(reverse('lead_capture:lead_form_async', args=[self.link.code]))
+        self.assertEqual(response.status_code, 200)
+        await self.link.arefresh_from_db()
+        self.assertEqual(self.link.clicks, 1)
+        self.assertEqual(await ReferralClickEvent.objects.filter(link=self.link).acount(), 1)
+
+
+class LeadNotificationTests(TestCase):
+    """The outbox sends each row once, collapses digests and counts failures"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', email='agent@example.com')
+        cls.digest_agent = User.objects.create_user('digester', email='digest@example.com')
+        AgentNotificationSetting.objects.create(user=cls.digest_agent, digest_enabled=True, digest_window_minutes=15)
+
+    def create_leads(self, agent, count):
+        for n in range(count):
+            Lead.objects.create(agent=agent, name=f'{agent.username} lead {n}', email=f'{agent.username}{n}@example.com',
+                                phone=f'21255501{n:02d}', insurance_type='auto')
+
+    def age_outbox(self, agent, minutes):
+        LeadNotification.objects.filter(agent=agent).update(created_at=timezone.now() - timedelta(minutes=minutes))
+
+    def test_held_digests_do_not_block_the_batch(self):
+        self.create_leads(self.digest_agent, 3)
+        self.create_leads(self.agent, 1)
+        self.assertEqual(send_pending_notifications(batch_size=2), (1, 1))
+        self.assertEqual([message.to for message in mail.outbox], [['agent@example.com']])
+        held = LeadNotification.objects.filter(agent=self.digest_agent)
+        self.assertEqual(set(held.values_list('status', 'attempts')), {('pending', 0)})
+
+    def test_due_digest_is_one_email(self):
+        self.create_leads(self.digest_agent, 3)
+        self.age_outbox(self.digest_agent, 20)
+        self.assertEqual(send_pending_notifications(), (3, 1))
+        self.assertEqual(mail.outbox[0].subject, '3 New Leads')
+        self.assertEqual(set(LeadNotification.objects.values_list('status', 'sent_in_digest')), {('sent', True)})
+
+    def test_command_drains_the_outbox(self):
+        # The first batch is one digest for two rows, which used to end the run
+        self.create_leads(self.digest_agent, 3)
+        self.age_outbox(self.digest_agent, 20)
+        self.create_leads(self.agent, 2)
+        call_command('send_lead_notifications', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(set(LeadNotification.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_claimed_rows_are_sent_once(self):
+        self.create_leads(self.agent, 2)
+        claimed = claim_notifications(10)
+        self.assertEqual(len(claimed), 2)
+        # Another sender finds nothing to do while the claim holds
+        self.assertEqual(send_pending_notifications(), (0, 0))
+
+        # The first sender died; its claim expires and the rows are sent on a second attempt
+        LeadNotification.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_pending_notifications(), (2, 2))
+        self.assertEqual(set(LeadNotification.objects.values_list('status', 'attempts')), {('sent', 2)})
+
+    def test_connection_failures_count_attempts(self):
+        self.create_leads(self.agent, 1)
+        broken = mock.Mock()
+        broken.open.side_effect = ConnectionRefusedError('smtp down')
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.assertEqual(send_pending_notifications(connection=broken), (1, 0))
+            notification = LeadNotification.objects.get()
+            self.assertEqual(notification.attempts, attempt)
+        self.assertEqual((notification.status, notification.last_error, notification.claim_token),
+                         ('failed', 'smtp down', ''))
+        self.assertEqual(send_pending_notifications(), (0, 0))
+
+    def test_send_failure_only_fails_its_rows(self):
+        self.create_leads(self.agent, 2)
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [RuntimeError('rejected'), 1]
+        self.assertEqual(send_pending_notifications(connection=connection), (2, 1))
+        self.assertEqual(list(LeadNotification.objects.order_by('id').values_list('status', 'attempts')),
+                         [('pending', 1), ('sent', 1)])
@@ -5,6 +5,7 @@ app_name = 'lead_capture'
 
 urlpatterns = [
     path('submit/<str:code>/', views.lead_capture, name='lead_form'),
+    path('submit-async/<str:code>/', views.lead_capture_async, name='lead_form_async'),
     path('thank-you/<int:lead_id>/', views.thank_you, name='thank_you'),
     path('test-email/<int:lead_id>/', views.test_email, name='test_email'),
 ] 
\ No newline at end of file
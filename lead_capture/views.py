@@ -1,164 +1,129 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib import messages
-from referral_system.models import ReferralLink, PaymentRate
+from referral_system.clicks import record_click_event
+from referral_system.counters import record_click
+from referral_system.models import ReferralLink
+from referral_system.resolution import aresolve_active_or_404, resolve_active_or_404
 from .forms import LeadCaptureForm
 from .models import Lead
-from django.http import HttpResponse
+from .services import InactiveReferralLink, submit_lead
+from django.http import Http404, HttpResponse
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 import json
 # Import the validation functions
 from lead_validation.validators import validate_email_address, validate_phone_number, validate_location, validate_name
-from lead_validation.utils import validate_and_store_lead_data
-from django.utils import timezone
-from threading import Thread
 import logging
 
 logger = logging.getLogger(__name__)
 
-@require_http_methods(["GET", "POST"])
-def lead_capture(request, code):
-    """Capture leads from referral links"""
-    # Get the referral link or 404
-    link = get_object_or_404(ReferralLink, code=code, is_active=True)
+def _build_lead_from_post(request, link):
+    """
+    Build an unsaved Lead from a lead form submission.
+    Returns None when required fields are missing.
+    """
+    # Extract form data
+    name = request.POST.get('name')
+    email = request.POST.get('email')
+    phone = request.POST.get('phone')
     
-    # For GET requests, increment the click counter
-    if request.method == 'GET':
-        link.increment_clicks()
+    # Fix: Get the last non-empty ZIP code value
+    zip_codes = request.POST.getlist('zip_code')
+    zip_code = next((code for code in reversed(zip_codes) if code), '')
     
-    # For POST requests, process the form submission
-    if request.method == 'POST':
-        # Extract form data
-        name = request.POST.get('name')
-        email = request.POST.get('email')
-        phone = request.POST.get('phone')
+    insurance_type = request.POST.get('insurance_type')
+    preferred_contact = request.POST.get('preferred_contact', 'phone')
+    
+    # Field names only: the values are a visitor's personal details
+    logger.debug(f"Lead form for link {link.code}: fields {sorted(request.POST.keys())}, "
+                 f"{len(zip_codes)} ZIP code inputs, ZIP code {'set' if zip_code else 'missing'}")
+    
+    # Validate required fields
+    if not (name and email and phone):
+        return None
+    
+    # Create the lead from form data (WITHOUT validation for now)
+    lead = Lead(
+        referral_link=link,
+        agent_id=link.user_id,
+        name=name,
+        email=email,
+        phone=phone,
+        insurance_type=insurance_type,
+        zip_code=zip_code,
         
-        # Fix: Get the last non-empty ZIP code value
-        zip_codes = request.POST.getlist('zip_code')
-        zip_code = next((code for code in reversed(zip_codes) if code), '')
+        # Basic information
+        address=request.POST.get('address', ''),
+        notes=request.POST.get('notes', ''),
         
-        print(f"ZIP CODE LIST: {zip_codes}")
-        print(f"SELECTED ZIP CODE: '{zip_code}'")
+        # Contact preferences
+        preferred_contact_method=preferred_contact,
+        preferred_time=request.POST.get('preferred_time', ''),
         
-        insurance_type = request.POST.get('insurance_type')
-        preferred_contact = request.POST.get('preferred_contact', 'phone')
+        # Tracking information
+        ip_address=request.META.get('REMOTE_ADDR', None),
+        user_agent=request.META.get('HTTP_USER_AGENT', None),
+    )
+    
+    # Add insurance type specific fields
+    if insurance_type == 'auto':
+        lead.vehicle_vin = request.POST.get('vehicle_vin', '')
+        lead.vehicle_year = request.POST.get('vehicle_year', None)
+        lead.vehicle_make = request.POST.get('vehicle_make', '')
+        lead.vehicle_model = request.POST.get('vehicle_model', '')
+        lead.date_of_birth = request.POST.get('date_of_birth', None)
+        lead.current_insurer = request.POST.get('current_insurer', '')
+        lead.vehicle_usage = request.POST.get('vehicle_usage', '')
+        lead.annual_mileage = request.POST.get('annual_mileage', None)
         
-        # Debug - print what we're receiving
-        print(f"FORM DATA: name={name}, email={email}, phone={phone}")
-        print(f"ZIP CODE: '{zip_code}'")  # Print with quotes to see if it's empty or whitespace
-        print(f"REQUEST POST DATA: {request.POST}")  # Print all POST data
+    elif insurance_type == 'home':
+        lead.property_type = request.POST.get('property_type', '')
+        lead.ownership_status = request.POST.get('ownership_status', '')
+        lead.year_built = request.POST.get('year_built', None)
+        lead.square_footage = request.POST.get('square_footage', None)
+        lead.current_insurer = request.POST.get('current_insurer', '')
+        lead.num_bedrooms = request.POST.get('num_bedrooms', None)
+        lead.num_bathrooms = request.POST.get('num_bathrooms', None)
         
-        # Validate required fields
-        if not (name and email and phone):
+    elif insurance_type == 'business':
+        lead.business_name = request.POST.get('business_name', '')
+        lead.business_address = request.POST.get('business_address', '')
+        lead.industry = request.POST.get('industry', '')
+        lead.num_employees = request.POST.get('num_employees', None)
+        lead.annual_revenue = request.POST.get('annual_revenue', '')
+        lead.current_insurer = request.POST.get('current_insurer', '')
+    
+    return lead
+
+def _record_landing(link_id, request):
+    """Count a form view; either buffer may flush to the database, so async views run this in a thread"""
+    record_click(link_id)
+    record_click_event(link_id, request)
+
+@require_http_methods(["GET", "POST"])
+def lead_capture(request, code):
+    """Capture leads from referral links"""
+    # For GET requests, increment the click counter. The code is resolved
+    # from the cache, so showing the form costs no query.
+    if request.method == 'GET':
+        resolved = resolve_active_or_404(code)
+        _record_landing(resolved.id, request)
+    
+    # For POST requests, process the form submission (it needs the full link row)
+    if request.method == 'POST':
+        link = get_object_or_404(ReferralLink, code=code, is_active=True)
+        lead = _build_lead_from_post(request, link)
+        if lead is None:
             messages.error(request, 'Please fill in all required fields.')
             return render(request, 'lead_capture/lead_form.html', {'code': code})
         
-        # Check if a duplicate lead exists with the same email
-        existing_lead = Lead.objects.filter(email__iexact=email).first()
-        if existing_lead:
-            # Use existing lead instead of creating a new one
-            lead = existing_lead
-            # Maybe update some fields or create a note about the duplicate submission
-            lead.notes = f"{lead.notes or ''}\n[DUPLICATE SUBMISSION: {timezone.now()}]"
-            lead.save(update_fields=['notes'])
-            
-            # Redirect to thank you page with the existing lead ID
-            return redirect('lead_capture:thank_you', lead_id=lead.id)
-        
-        # Create the lead from form data (WITHOUT validation for now)
-        lead = Lead(
-            referral_link=link,
-            agent=link.user,
-            name=name,
-            email=email,
-            phone=phone,
-            insurance_type=insurance_type,
-            zip_code=zip_code,
-            
-            # Basic information
-            address=request.POST.get('address', ''),
-            notes=request.POST.get('notes', ''),
-            
-            # Contact preferences
-            preferred_contact_method=preferred_contact,
-            preferred_time=request.POST.get('preferred_time', ''),
-            
-            # Tracking information
-            ip_address=request.META.get('REMOTE_ADDR', None),
-            user_agent=request.META.get('HTTP_USER_AGENT', None),
-        )
-        
-        # Add insurance type specific fields
-        if insurance_type == 'auto':
-            lead.vehicle_vin = request.POST.get('vehicle_vin', '')
-            lead.vehicle_year = request.POST.get('vehicle_year', None)
-            lead.vehicle_make = request.POST.get('vehicle_make', '')
-            lead.vehicle_model = request.POST.get('vehicle_model', '')
-            lead.date_of_birth = request.POST.get('date_of_birth', None)
-            lead.current_insurer = request.POST.get('current_insurer', '')
-            lead.vehicle_usage = request.POST.get('vehicle_usage', '')
-            lead.annual_mileage = request.POST.get('annual_mileage', None)
-            
-        elif insurance_type == 'home':
-            lead.property_type = request.POST.get('property_type', '')
-            lead.ownership_status = request.POST.get('ownership_status', '')
-            lead.year_built = request.POST.get('year_built', None)
-            lead.square_footage = request.POST.get('square_footage', None)
-            lead.current_insurer = request.POST.get('current_insurer', '')
-            lead.num_bedrooms = request.POST.get('num_bedrooms', None)
-            lead.num_bathrooms = request.POST.get('num_bathrooms', None)
-            
-        elif insurance_type == 'business':
-            lead.business_name = request.POST.get('business_name', '')
-            lead.business_address = request.POST.get('business_address', '')
-            lead.industry = request.POST.get('industry', '')
-            lead.num_employees = request.POST.get('num_employees', None)
-            lead.annual_revenue = request.POST.get('annual_revenue', '')
-            lead.current_insurer = request.POST.get('current_insurer', '')
-        
-        # Save the lead
-        lead.save()
-        
-        # Start validation in a separate thread
-        thread = Thread(target=validate_lead_async, args=(lead.id,))
-        thread.daemon = True  # Make thread daemon so it doesn't block program exit
-        thread.start()
-        
-        # Record the conversion for the referral link
-        link.increment_conversions()
-        
-        # Calculate payment based on state
-        lead_state = lead.state
-        
+        # Duplicate check, insert, validation job and link credit in one transaction
         try:
-            # First try to get a rate for the specific state and insurance type
-            payment_rate = PaymentRate.objects.get(
-                state=lead_state,
-                insurance_type=lead.insurance_type,
-                is_active=True
-            )
-        except PaymentRate.DoesNotExist:
-            try:
-                # If no state-specific rate, get the nationwide rate for this insurance type
-                payment_rate = PaymentRate.objects.get(
-                    state='',  # Empty string means nationwide
-                    insurance_type=lead.insurance_type,
-                    is_active=True
-                )
-            except PaymentRate.DoesNotExist:
-                # If all else fails, use a default rate
-                from decimal import Decimal
-                payment_amount = Decimal('25.00')
-            else:
-                payment_amount = payment_rate.rate_amount
-        else:
-            payment_amount = payment_rate.rate_amount
-            
-        # Update link earnings
-        link.earnings += payment_amount
-        link.paid_conversions += 1
-        link.save(update_fields=['earnings', 'paid_conversions'])
+            lead, _ = submit_lead(link, lead)
+        except InactiveReferralLink:
+            raise Http404("No ReferralLink matches the given query.")
         
         # Redirect to thank you page
         return redirect('lead_capture:thank_you', lead_id=lead.id)
@@ -166,11 +131,40 @@ def lead_capture(request, code):
     # GET request - display the form
     return render(request, 'lead_capture/lead_form.html', {'code': code})
 
+@require_http_methods(["GET", "POST"])
+async def lead_capture_async(request, code):
+    """
+    Async variant of lead_capture for ASGI deployments. Lookups go through
+    the async ORM; the submission itself is the same atomic submit_lead.
+    """
+    if request.method == 'GET':
+        resolved = await aresolve_active_or_404(code)
+        await sync_to_async(_record_landing)(resolved.id, request)
+        return await sync_to_async(render)(request, 'lead_capture/lead_form.html', {'code': code})
+    
+    try:
+        link = await ReferralLink.objects.aget(code=code, is_active=True)
+    except ReferralLink.DoesNotExist:
+        raise Http404("No ReferralLink matches the given query.")
+    
+    lead = _build_lead_from_post(request, link)
+    if lead is None:
+        messages.error(request, 'Please fill in all required fields.')
+        return await sync_to_async(render)(request, 'lead_capture/lead_form.html', {'code': code})
+    
+    # Transactions can't span awaits, so the submission runs as one sync unit
+    try:
+        lead, _ = await sync_to_async(submit_lead)(link, lead)
+    except InactiveReferralLink:
+        raise Http404("No ReferralLink matches the given query.")
+    
+    return redirect('lead_capture:thank_you', lead_id=lead.id)
+
 @require_http_methods(["GET", "POST"])
 def step2_basic_info(request, code):
     """Second step - basic information based on insurance type"""
-    # Get the referral link or 404
-    link = get_object_or_404(ReferralLink, code=code, is_active=True)
+    # 404 unless the code belongs to an active link (cached, see resolution.py)
+    link = resolve_active_or_404(code)
     
     # Get insurance type from session
     insurance_type = request.session.get('insurance_type')
@@ -192,8 +186,8 @@ def step2_basic_info(request, code):
 @require_http_methods(["GET", "POST"])
 def step3_contact_info(request, code):
     """Third step - contact information"""
-    # Get the referral link or 404
-    link = get_object_or_404(ReferralLink, code=code, is_active=True)
+    # 404 unless the code belongs to an active link (cached, see resolution.py)
+    link = resolve_active_or_404(code)
     
     # Get insurance type from session
     insurance_type = request.session.get('insurance_type')
@@ -216,8 +210,8 @@ def step3_contact_info(request, code):
 @require_http_methods(["GET", "POST"])
 def step4_confirmation(request, code):
     """Final step - review and confirm submission"""
-    # Get the referral link or 404
-    link = get_object_or_404(ReferralLink, code=code, is_active=True)
+    # 404 unless the code belongs to an active link (cached, see resolution.py)
+    link = resolve_active_or_404(code)
     
     # Get insurance type from session
     insurance_type = request.session.get('insurance_type')
@@ -264,8 +258,8 @@ def step4_confirmation(request, code):
         
         # Create the lead from session data (passing validation)
         lead = Lead(
-            referral_link=link,
-            agent=link.user,
+            referral_link_id=link.id,
+            agent_id=link.user_id,
             insurance_type=insurance_type,
             
             # Basic info
@@ -308,20 +302,13 @@ def step4_confirmation(request, code):
             lead.num_employees = request.session.get('num_employees', None)
             lead.annual_revenue = request.session.get('annual_revenue', '')
             
-        # Save the lead
-        lead.save()
-        
-        # Schedule validation to happen asynchronously
-        thread = Thread(target=validate_lead_async, args=(lead.id,))
-        thread.start()
-        
-        # Verify validation was saved
-        updated_lead = Lead.objects.get(id=lead.id)
-        print(f"After validation - Lead ID: {updated_lead.id}, Score: {updated_lead.validation_score}")
-        print(f"Validation details: {updated_lead.validation_details}")
-        
-        # Record the conversion for the referral link
-        link.increment_conversions()
+        # Duplicate check, insert, validation job and link credit in one
+        # transaction, as for the single-page form (it needs the full link row)
+        link = get_object_or_404(ReferralLink, code=code, is_active=True)
+        try:
+            lead, _ = submit_lead(link, lead)
+        except InactiveReferralLink:
+            raise Http404("No ReferralLink matches the given query.")
         
         # Clear the session data
         for key in list(request.session.keys()):
@@ -371,22 +358,8 @@ def test_email(request, lead_id):
         return HttpResponse(f"Error: The assigned agent ({lead.agent.username}) doesn't have an email address. "
                             f"Please add an email address to the agent's profile.")
     
-    # Import and call the signal function directly
-    from .signals import notify_agent_of_new_lead
-    notify_agent_of_new_lead(sender=Lead, instance=lead, created=True)
+    # Build the same email the outbox sender uses and deliver it immediately
+    from .notifications import build_lead_email
+    build_lead_email(lead, lead.agent).send(fail_silently=False)
     
     return HttpResponse(f"{message} Test email sent to {lead.agent.email} for lead: {lead.name}!")
-
-# Helper function for async validation
-def validate_lead_async(lead_id):
-    """Run lead validation in a separate thread"""
-    try:
-        from lead_validation.utils import validate_and_store_lead_data
-        from lead_capture.models import Lead
-        
-        lead = Lead.objects.get(id=lead_id)
-        logger.info(f"Starting async validation for lead {lead_id} (insurance type: {lead.insurance_type})")
-        validate_and_store_lead_data(lead)
-        logger.info(f"Completed async validation for lead {lead_id}")
-    except Exception as e:
-        logger.error(f"Error in async validation for lead {lead_id}: {str(e)}")
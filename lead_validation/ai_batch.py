@@ -0,0 +1,159 @@
+"""
+Batched AI assessment.
+
+The assessment prompt is mostly fixed instructions and the JSON format, so
+asking about several leads in one request (ai_validator.build_batch_prompt)
+pays for that overhead, and the round trip, once per batch instead of once
+per lead. Every lead in a batch carries a Lead ID; the reply is checked per
+lead and leads it leaves out or garbles are asked about on their own.
+
+There are two ways batches fill:
+- revalidate_leads hands the ambiguous leads of a chunk to
+  analyze_leads_with_ai directly (utils.validate_and_store_leads)
+- run_validation_workers processes one lead per thread, so it starts an
+  AIBatcher: each thread's request waits at most LINGER seconds for others
+  to join its batch before the batch is sent
+
+AI_BATCH['MAX_SIZE'] = 1 turns batching off.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AI_BATCH_SETTINGS = {
+    'MAX_SIZE': 10,   # Leads per AI request
+    'LINGER': 0.05,   # Seconds a lead waits for others to fill its batch
+    'IN_FLIGHT': 4,   # Batches the AIBatcher sends concurrently
+    'TIMEOUT': 60.0,  # Deadline for a batched call, which answers for every lead in it
+}
+
+
+def get_ai_batch_settings():
+    """Merge AI_BATCH from settings over the defaults"""
+    options = dict(DEFAULT_AI_BATCH_SETTINGS)
+    options.update(getattr(settings, 'AI_BATCH', {}))
+    return options
+
+
+class AIBatcher:
+    """
+    Collects analyze_lead_with_ai calls from concurrent threads into batches.
+    A batch is sent when it holds max_size leads, or `linger` seconds after
+    its first lead arrived; up to in_flight batches are sent at once.
+    """
+
+    def __init__(self, max_size, linger, in_flight):
+        self.max_size = max(1, max_size)
+        self.linger = linger
+        self._queue = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=max(1, in_flight), thread_name_prefix='ai-batch')
+        self._lock = threading.Lock()
+        self.counts = {'batches': 0, 'leads': 0}
+        self._collector = threading.Thread(target=self._collect, name='ai-batcher', daemon=True)
+        self._collector.start()
+
+    def assess(self, lead_data, refresh=False):
+        """Assess one lead as part of a batch; blocks until its batch is answered"""
+        future = Future()
+        self._queue.put((lead_data, refresh, future))
+        return future.result()
+
+    def _collect(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.linger
+            stopping = False
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._senders.submit(self._send, batch)
+            if stopping:
+                return
+
+    def _send(self, batch):
+        from .ai_validator import analyze_leads_with_ai
+
+        with self._lock:
+            self.counts['batches'] += 1
+            self.counts['leads'] += len(batch)
+        try:
+            for refresh in (False, True):
+                items = [item for item in batch if item[1] == refresh]
+                if not items:
+                    continue
+                try:
+                    results = analyze_leads_with_ai([lead_data for lead_data, _, _ in items], refresh=refresh,
+                                                    batch_size=self.max_size)
+                except Exception as e:
+                    logger.error(f"Error in batched AI validation of {len(items)} leads: {str(e)}")
+                    for _, _, future in items:
+                        future.set_exception(e)
+                else:
+                    for (_, _, future), result in zip(items, results):
+                        future.set_result(result)
+        finally:
+            # Sender threads do cache lookups; don't leak their connections
+            connection.close()
+
+    def stop(self):
+        """Send what is queued, wait for it to be answered and stop the threads"""
+        self._queue.put(None)
+        self._collector.join()
+        self._senders.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        counts['mean_batch_size'] = counts['leads'] / counts['batches'] if counts['batches'] else 0.0
+        return counts
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def enable_ai_batching(max_size=None, linger=None):
+    """Start this process's AIBatcher (settings from AI_BATCH unless given)"""
+    global _batcher
+    options = get_ai_batch_settings()
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = AIBatcher(
+                options['MAX_SIZE'] if max_size is None else max_size,
+                options['LINGER'] if linger is None else linger,
+                options['IN_FLIGHT'],
+            )
+        return _batcher
+
+
+def disable_ai_batching():
+    """Stop the AIBatcher once queued leads are answered"""
+    global _batcher
+    with _batcher_lock:
+        batcher, _batcher = _batcher, None
+    if batcher is not None:
+        batcher.stop()
+
+
+def get_ai_batcher():
+    """The running AIBatcher, or None when validation calls the AI lead by lead"""
+    return _batcher
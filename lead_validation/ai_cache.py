@@ -0,0 +1,218 @@
+"""
+Cache of AI lead assessments, keyed by a hash of what the model is shown.
+
+Revalidating an unchanged lead, a repeated form submission or an identical
+API payload renders the same prompt, so the model's earlier answer is
+reused. The key covers the prompt fields (ai_validator.prompt_fields), the
+model and PROMPT_VERSION; fields the prompt does not show (user agent,
+state, ...) do not split the cache. Entries live in a size-bounded LRU in
+each process, backed by the AIAssessmentCache table that every worker
+shares. Failed assessments are never cached.
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AI_CACHE_SETTINGS = {
+    'ENABLED': True,
+    'TIMEOUT': 7 * 24 * 3600,  # Seconds an assessment is reused
+    'MAX_ENTRIES': 10000,      # Assessments kept in each process's LRU
+}
+
+
+def get_ai_cache_settings():
+    """Merge AI_ASSESSMENT_CACHE from settings over the defaults"""
+    options = dict(DEFAULT_AI_CACHE_SETTINGS)
+    options.update(getattr(settings, 'AI_ASSESSMENT_CACHE', {}))
+    return options
+
+
+def assessment_key(lead_data):
+    """Canonical hash of the prompt fields, the model and the prompt version"""
+    from .ai_validator import AI_MODEL, PROMPT_VERSION, prompt_fields
+
+    canonical = json.dumps({
+        'model': AI_MODEL,
+        'prompt_version': PROMPT_VERSION,
+        'fields': prompt_fields(lead_data),
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def is_cacheable(assessment):
+    """Only real model answers are cached, not the fallbacks used when the call fails"""
+    return isinstance(assessment, dict) and 'error' not in assessment
+
+
+class AssessmentCache:
+    """In-process LRU with expiry in front of the AIAssessmentCache table"""
+
+    STATS = ('memory_hits', 'database_hits', 'misses', 'refreshes')
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expiry as epoch seconds, assessment)
+        self.counts = dict.fromkeys(self.STATS, 0)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _remember(self, key, assessment, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, assessment)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get(self, key):
+        """Return (assessment, source) with source 'memory' or 'database', or (None, None)"""
+        from .models import AIAssessmentCache
+
+        assessment = self._local(key)
+        if assessment is not None:
+            self._count('memory_hits')
+            return copy.deepcopy(assessment), 'memory'
+
+        try:
+            row = AIAssessmentCache.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+        except Exception as e:
+            logger.warning(f"AI assessment cache lookup failed: {e}")
+            row = None
+        if row is None:
+            self._count('misses')
+            return None, None
+
+        self._remember(key, row.assessment, row.expires_at.timestamp())
+        self._count('database_hits')
+        return copy.deepcopy(row.assessment), 'database'
+
+    def set(self, key, assessment):
+        """Store a fresh assessment locally and in the shared table"""
+        from .ai_validator import AI_MODEL, PROMPT_VERSION
+        from .models import AIAssessmentCache
+
+        if not is_cacheable(assessment):
+            return
+        assessment = copy.deepcopy(assessment)
+        expires_at = timezone.now() + timedelta(seconds=self.timeout)
+        self._remember(key, assessment, expires_at.timestamp())
+        try:
+            AIAssessmentCache.objects.update_or_create(key=key, defaults={
+                'assessment': assessment,
+                'model': AI_MODEL,
+                'prompt_version': PROMPT_VERSION,
+                'expires_at': expires_at,
+            })
+        except IntegrityError:
+            # Another worker stored the same prompt's assessment first
+            pass
+        except Exception as e:
+            logger.warning(f"Could not store AI assessment {key[:12]}: {e}")
+
+    def refresh(self, key):
+        """Drop the local copy of a key whose assessment is about to be redone"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self.counts['refreshes'] += 1
+
+    def stats(self):
+        """Counters since start or reset, plus hit_rate and the number of local entries"""
+        with self._lock:
+            counts = dict(self.counts)
+            counts['entries'] = len(self._entries)
+        lookups = counts['memory_hits'] + counts['database_hits'] + counts['misses']
+        counts['hit_rate'] = (counts['memory_hits'] + counts['database_hits']) / lookups if lookups else 0.0
+        return counts
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_assessment_cache():
+    """Process-wide AssessmentCache, or None when AI_ASSESSMENT_CACHE is disabled"""
+    global _cache
+    options = get_ai_cache_settings()
+    if not options['ENABLED']:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AssessmentCache(options['MAX_ENTRIES'], options['TIMEOUT'])
+    return _cache
+
+
+def reset_assessment_cache():
+    """Drop this process's LRU and counters (the shared table is left alone)"""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def ai_cache_stats():
+    cache = get_assessment_cache()
+    return cache.stats() if cache else {'enabled': False}
+
+
+def lookup(lead_data, refresh=False):
+    """
+    Return (key, assessment, info) for a lead. assessment is None on a miss,
+    or when refresh is set. info is what gets recorded in the assessment:
+    {'status': 'hit'|'miss'|'refresh', 'source', 'key', 'hit_rate'}.
+    key is None when the cache is disabled.
+    """
+    cache = get_assessment_cache()
+    if cache is None:
+        return None, None, {'status': 'disabled'}
+
+    key = assessment_key(lead_data)
+    if refresh:
+        cache.refresh(key)
+        assessment, source, status = None, None, 'refresh'
+    else:
+        assessment, source = cache.get(key)
+        status = 'hit' if assessment is not None else 'miss'
+    return key, assessment, {
+        'status': status,
+        'source': source,
+        'key': key[:16],
+        'hit_rate': round(cache.stats()['hit_rate'], 4),
+    }
+
+
+def store(key, assessment):
+    cache = get_assessment_cache()
+    if cache is not None and key is not None:
+        cache.set(key, assessment)
+
+
+def purge_expired():
+    """Delete expired rows from the shared table; returns the number deleted"""
+    from .models import AIAssessmentCache
+    deleted, _ = AIAssessmentCache.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
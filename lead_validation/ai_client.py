@@ -0,0 +1,385 @@
+"""
+Client layer for the AI assessment calls.
+
+Every chat completion goes through one AIClient per process, which adds:
+- a concurrency limit: at most MAX_CONCURRENCY calls in flight, shared with
+  other processes when revalidate_leads hands in its semaphore
+- a deadline per call (TIMEOUT seconds, including the wait for a slot), so a
+  slow upstream cannot hold a validation thread indefinitely
+- a circuit breaker: after FAILURE_THRESHOLD upstream failures in a row,
+  calls fail immediately for RESET_TIMEOUT seconds, after which one trial
+  call decides whether to close it again. Callers fall back to the rule
+  pre-screen's score (see prescreen.py)
+- pooled keep-alive connections, instead of a new TLS handshake per call
+
+ai_client_stats() reports the breaker state, counters and latency
+percentiles; fake_ai_server.py can inject latency and errors to exercise it.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+
+import openai
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AI_CLIENT_SETTINGS = {
+    'MAX_CONCURRENCY': 16,     # AI calls in flight per process
+    'TIMEOUT': 20.0,           # Seconds per call, including the wait for a slot
+    'CONNECT_TIMEOUT': 3.0,    # Seconds to open a connection
+    'MAX_RETRIES': 0,          # SDK retries, within the deadline
+    'FAILURE_THRESHOLD': 5,    # Upstream failures in a row that open the circuit
+    'RESET_TIMEOUT': 30.0,     # Seconds the circuit stays open before a trial call
+    'MAX_CONNECTIONS': 32,     # Pooled connections to the API
+    'KEEPALIVE_EXPIRY': 30.0,  # Seconds an idle pooled connection is kept
+    'LATENCY_WINDOW': 1000,    # Recent successful calls the percentiles are taken over
+}
+
+
+def get_ai_client_settings():
+    """Merge AI_CLIENT from settings over the defaults"""
+    options = dict(DEFAULT_AI_CLIENT_SETTINGS)
+    options.update(getattr(settings, 'AI_CLIENT', {}))
+    return options
+
+
+class AIUnavailable(Exception):
+    """The call was not attempted; the caller should use its fallback"""
+
+
+class CircuitOpen(AIUnavailable):
+    pass
+
+
+class NoSlotAvailable(AIUnavailable):
+    pass
+
+
+# Errors that say the upstream is unhealthy; anything else (a bad request,
+# an unparseable reply) does not count against the circuit
+UPSTREAM_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,  # the async deadline
+)
+
+
+def is_upstream_failure(error):
+    if isinstance(error, UPSTREAM_ERRORS):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` failures in a row -> half open after `reset_timeout`"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def _half_open_due(self):
+        return self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout
+
+    def is_open(self):
+        """Cheap check before waiting for a slot: True while calls are being refused"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            return not (self._half_open_due() or (self.state == self.HALF_OPEN and not self._trial_in_flight))
+
+    def allow(self):
+        """Whether a call may go ahead; in half-open state only one trial call at a time"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self._half_open_due():
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.warning("AI circuit closed: trial call succeeded")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+                logger.warning(f"AI circuit opened after {self.failures} failures in a row; "
+                               f"failing fast for {self.reset_timeout}s")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self.times_opened += 1
+
+    def release_trial(self):
+        """The allowed call never reached the upstream; let another one try"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'retry_in': retry_in,
+            }
+
+
+class LatencyWindow:
+    """Durations of the most recent calls, for percentiles"""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentiles(self, points=(50, 90, 99)):
+        """{'p50': ms, ...} by nearest rank, or None values with no samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {f'p{point}': None for point in points}
+        return {
+            f'p{point}': round(samples[min(len(samples) - 1, max(0, -(-len(samples) * point // 100) - 1))] * 1000, 1)
+            for point in points
+        }
+
+
+class AIClient:
+    """Chat completions with a concurrency limit, deadlines, a circuit breaker and pooled connections"""
+
+    COUNTERS = ('calls', 'successes', 'failures', 'timeouts', 'rejected_open', 'rejected_busy')
+
+    def __init__(self, options):
+        self.options = options
+        self.slots = threading.BoundedSemaphore(options['MAX_CONCURRENCY'])
+        self.breaker = CircuitBreaker(options['FAILURE_THRESHOLD'], options['RESET_TIMEOUT'])
+        self.latencies = LatencyWindow(options['LATENCY_WINDOW'])
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.in_flight = 0
+        self._client = None
+        self._async_client = None
+        self._async_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+    def _count(self, name, in_flight=0):
+        with self._lock:
+            self.counts[name] += 1
+            self.in_flight += in_flight
+
+    def share_slots(self, semaphore):
+        """Use `semaphore` (e.g. a multiprocessing one shared by worker processes) as the limit"""
+        self.slots = semaphore
+
+    def _timeout(self, seconds):
+        return openai.Timeout(seconds, connect=min(seconds, self.options['CONNECT_TIMEOUT']))
+
+    def _limits(self):
+        # Built from the SDK's own default so the matching HTTP library is used
+        return type(openai.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=self.options['MAX_CONNECTIONS'],
+            max_keepalive_connections=self.options['MAX_CONNECTIONS'],
+            keepalive_expiry=self.options['KEEPALIVE_EXPIRY'],
+        )
+
+    def _client_kwargs(self):
+        return {
+            'api_key': openai.api_key,
+            'base_url': getattr(settings, 'OPENAI_BASE_URL', None) or None,
+            'timeout': self._timeout(self.options['TIMEOUT']),
+            'max_retries': self.options['MAX_RETRIES'],
+        }
+
+    def client(self):
+        """Shared OpenAI client whose connection pool keeps connections alive between calls"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(
+                        http_client=openai.DefaultHttpxClient(limits=self._limits(),
+                                                              timeout=self._timeout(self.options['TIMEOUT'])),
+                        **self._client_kwargs(),
+                    )
+        return self._client
+
+    def async_client(self):
+        """Shared AsyncOpenAI client, so concurrent requests reuse its connection pool"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = openai.AsyncOpenAI(
+                        http_client=openai.DefaultAsyncHttpxClient(limits=self._limits(),
+                                                                   timeout=self._timeout(self.options['TIMEOUT'])),
+                        **self._client_kwargs(),
+                    )
+        return self._async_client
+
+    def _admit(self):
+        if self.breaker.is_open():
+            self._count('rejected_open')
+            raise CircuitOpen("AI circuit open; using fallback")
+
+    def _start(self):
+        """After a slot is held: claim the breaker's permission or give the slot back"""
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            raise CircuitOpen("AI circuit open; using fallback")
+        self._count('calls', in_flight=1)
+        return time.monotonic()
+
+    def _abandon(self):
+        """The call was cancelled from outside; it says nothing about the upstream"""
+        with self._lock:
+            self.in_flight -= 1
+        self.breaker.release_trial()
+
+    def _finish(self, started, error=None):
+        with self._lock:
+            self.in_flight -= 1
+        if error is None:
+            self.breaker.record_success()
+            self.latencies.add(time.monotonic() - started)
+            self._count('successes')
+        elif is_upstream_failure(error):
+            self.breaker.record_failure()
+            self._count('timeouts' if isinstance(error, (openai.APITimeoutError, TimeoutError)) else 'failures')
+        else:
+            # The upstream answered; the request itself was at fault
+            self.breaker.record_success()
+            self._count('failures')
+
+    def complete(self, timeout=None, **kwargs):
+        """
+        chat.completions.create within the deadline (`timeout` seconds, default
+        TIMEOUT); raises AIUnavailable when not attempted
+        """
+        timeout = timeout or self.options['TIMEOUT']
+        deadline = time.monotonic() + timeout
+        self._admit()
+        if not self.slots.acquire(timeout=timeout):
+            self._count('rejected_busy')
+            raise NoSlotAvailable(f"No AI call slot within {timeout}s")
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count('rejected_busy')
+                raise NoSlotAvailable("Deadline passed while waiting for an AI call slot")
+            started = self._start()
+            try:
+                response = self.client().chat.completions.create(**kwargs, timeout=self._timeout(remaining))
+            except Exception as e:
+                self._finish(started, e)
+                raise
+            except BaseException:
+                self._abandon()
+                raise
+            self._finish(started)
+            return response
+        finally:
+            self.slots.release()
+
+    def _loop_slots(self):
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = asyncio.Semaphore(self.options['MAX_CONCURRENCY'])
+        return slots
+
+    async def acomplete(self, **kwargs):
+        """
+        Async complete. The slot limit applies per event loop; the deadline
+        covers the whole call, including reading the reply.
+        """
+        deadline = asyncio.get_running_loop().time() + self.options['TIMEOUT']
+        self._admit()
+        slots = self._loop_slots()
+        try:
+            async with asyncio.timeout_at(deadline):
+                await slots.acquire()
+        except TimeoutError:
+            self._count('rejected_busy')
+            raise NoSlotAvailable(f"No AI call slot within {self.options['TIMEOUT']}s")
+        try:
+            started = self._start()
+            try:
+                async with asyncio.timeout_at(deadline):
+                    response = await self.async_client().chat.completions.create(**kwargs)
+            except Exception as e:
+                self._finish(started, e)
+                raise
+            except BaseException:
+                self._abandon()
+                raise
+            self._finish(started)
+            return response
+        finally:
+            slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats['in_flight'] = self.in_flight
+        stats['circuit'] = self.breaker.snapshot()
+        stats['latency_ms'] = self.latencies.percentiles()
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ai_client():
+    """Process-wide AIClient built from AI_CLIENT"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AIClient(get_ai_client_settings())
+    return _client
+
+
+def reset_ai_client():
+    """Forget the process's client (and its breaker, counters and connections)"""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def limit_ai_concurrency(semaphore):
+    """Make every AI call in this process hold `semaphore` (revalidate_leads shares one across workers)"""
+    get_ai_client().share_slots(semaphore)
+
+
+def ai_client_stats():
+    """Breaker state, counters and latency percentiles for this process"""
+    return get_ai_client().stats()
@@ -1,204 +1,431 @@
 import openai
 import os
+import copy
 import json
 import logging
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from . import ai_cache
+from .ai_batch import get_ai_batch_settings
+from .ai_client import AIUnavailable, get_ai_client, is_upstream_failure
 
 logger = logging.getLogger(__name__)
 
 # Configure OpenAI API
 openai.api_key = getattr(settings, 'OPENAI_API_KEY', os.getenv('OPENAI_API_KEY'))
+if getattr(settings, 'OPENAI_BASE_URL', None):
+    openai.base_url = settings.OPENAI_BASE_URL
 
-def analyze_lead_with_ai(lead_data):
+AI_MODEL = "gpt-4o"  # Use the best available model
+
+# Error of the assessment returned when no API key is configured
+AI_NOT_CONFIGURED = "AI validation unavailable"
+
+# Bump when SYSTEM_PROMPT or build_lead_prompt changes, so cached assessments
+# made with the old prompt are not reused (see ai_cache.py)
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = "You are a fraud detection expert that analyzes lead data for insurance companies. You only respond with valid JSON that exactly matches the requested format."
+
+# Lead fields build_lead_prompt reads, common and per insurance type
+PROMPT_FIELDS = ('name', 'email', 'phone', 'zip_code', 'address', 'ip_address', 'insurance_type', 'notes')
+INSURANCE_PROMPT_FIELDS = {
+    'auto': ('vehicle_vin', 'vehicle_year', 'vehicle_make', 'vehicle_model', 'vehicle_usage',
+             'annual_mileage', 'date_of_birth', 'current_insurer'),
+    'home': ('property_type', 'ownership_status', 'year_built', 'square_footage', 'num_bedrooms',
+             'num_bathrooms', 'current_insurer'),
+    'business': ('business_name', 'business_address', 'industry', 'num_employees', 'annual_revenue',
+                 'current_insurer'),
+}
+
+def prompt_fields(lead_data):
+    """The lead fields that go into the prompt, formatted as the prompt shows them"""
+    fields = PROMPT_FIELDS + INSURANCE_PROMPT_FIELDS.get(lead_data.get('insurance_type', ''), ())
+    return {field: str(lead_data.get(field, 'Not provided')) for field in fields}
+
+# Assessment format requested for each lead
+ASSESSMENT_FORMAT = """{
+      "duplicate_check": {
+        "is_duplicate": boolean,
+        "confidence": number from 0-100,
+        "matching_lead_ids": [],
+        "matching_fields": []
+      },
+
+      "ai_assessment": {
+        "risk_score": number from 0-100 (higher = more risky),
+        "assessment": "low_risk", "medium_risk", or "high_risk",
+        "confidence": number from 0-100,
+        "issues": [list of specific issues detected],
+        "ai_model": "gpt-4o"
+      },
+
+      "email": {
+        "valid": boolean,
+        "issue": string or null,
+        "domain_risk": "low", "medium", or "high"
+      },
+
+      "phone": {
+        "valid": boolean,
+        "country_code": string or null,
+        "formatted": string or null
+      },
+
+      "name": {
+        "valid": boolean,
+        "name_parts": {
+          "first_name": string,
+          "last_name": string
+        }
+      },
+
+      "location": {
+        "valid": boolean,
+        "derived_state": string or null,
+        "matches_ip_location": boolean
+      },
+
+      "cross_field": {
+        "consistent": boolean,
+        "issues": [list of inconsistencies between fields]
+      }
+    }"""
+
+REVIEW_GUIDANCE = """Be especially vigilant for:
+    - Disposable emails
+    - Keyboard pattern emails (qwerty, asdf, etc.)
+    - Suspicious naming patterns
+    - Fake phone numbers
+    - Mismatched location info
+    - Mismatches between fields (e.g., email name vs provided name)
+    - Common fraud patterns
+    - Inconsistencies in the provided insurance details"""
+
+def lead_details(lead_data):
+    """The lead's fields as they appear in the prompt, including insurance-specific details"""
+    insurance_type = lead_data.get('insurance_type', '')
+    
+    details = f"""
+    Name: {lead_data.get('name', 'Not provided')}
+    Email: {lead_data.get('email', 'Not provided')}
+    Phone: {lead_data.get('phone', 'Not provided')}
+    ZIP Code: {lead_data.get('zip_code', 'Not provided')}
+    Address: {lead_data.get('address', 'Not provided')}
+    IP Address: {lead_data.get('ip_address', 'Not provided')}
+    Insurance Type: {insurance_type}
+    Notes: {lead_data.get('notes', 'Not provided')}
+    """
+
+    # Add insurance-specific fields to the prompt
+    if insurance_type == 'auto':
+        auto_details = f"""
+        Auto Insurance Details:
+        Vehicle VIN: {lead_data.get('vehicle_vin', 'Not provided')}
+        Vehicle Year: {lead_data.get('vehicle_year', 'Not provided')}
+        Vehicle Make: {lead_data.get('vehicle_make', 'Not provided')}
+        Vehicle Model: {lead_data.get('vehicle_model', 'Not provided')}
+        Vehicle Usage: {lead_data.get('vehicle_usage', 'Not provided')}
+        Annual Mileage: {lead_data.get('annual_mileage', 'Not provided')}
+        Date of Birth: {lead_data.get('date_of_birth', 'Not provided')}
+        Current Insurer: {lead_data.get('current_insurer', 'Not provided')}
+        """
+        details += auto_details
+
+    elif insurance_type == 'home':
+        home_details = f"""
+        Home Insurance Details:
+        Property Type: {lead_data.get('property_type', 'Not provided')}
+        Ownership Status: {lead_data.get('ownership_status', 'Not provided')}
+        Year Built: {lead_data.get('year_built', 'Not provided')}
+        Square Footage: {lead_data.get('square_footage', 'Not provided')}
+        Bedrooms: {lead_data.get('num_bedrooms', 'Not provided')}
+        Bathrooms: {lead_data.get('num_bathrooms', 'Not provided')}
+        Current Insurer: {lead_data.get('current_insurer', 'Not provided')}
+        """
+        details += home_details
+
+    elif insurance_type == 'business':
+        business_details = f"""
+        Business Insurance Details:
+        Business Name: {lead_data.get('business_name', 'Not provided')}
+        Business Address: {lead_data.get('business_address', 'Not provided')}
+        Industry: {lead_data.get('industry', 'Not provided')}
+        Number of Employees: {lead_data.get('num_employees', 'Not provided')}
+        Annual Revenue: {lead_data.get('annual_revenue', 'Not provided')}
+        Current Insurer: {lead_data.get('current_insurer', 'Not provided')}
+        """
+        details += business_details
+
+    return details
+
+def build_lead_prompt(lead_data):
+    """Build the user prompt for a lead, including insurance-specific details"""
+    base_prompt = """
+    Analyze this lead information for potential fraud or validity issues:
+""" + lead_details(lead_data)
+
+    # Add the standard JSON request format
+    prompt = base_prompt + f"""
+
+    Analyze the lead data and provide a comprehensive assessment in the following JSON format:
+
+    {ASSESSMENT_FORMAT}
+
+    {REVIEW_GUIDANCE}
+
+    Format the response as valid JSON only.
+    """
+    return prompt
+
+def build_batch_prompt(batch):
+    """User prompt assessing several leads in one request; batch is a list of (lead ID, lead_data)"""
+    sections = ''.join(f"""
+    Lead ID: {lead_id}
+""" + lead_details(lead_data) for lead_id, lead_data in batch)
+
+    return f"""
+    Analyze each of the following {len(batch)} leads independently for potential fraud or validity issues.
+    Each lead starts with its Lead ID; judge every lead on its own details only.
+""" + sections + f"""
+
+    Respond with a JSON object of the form {{"results": [...]}} holding exactly one entry per Lead ID.
+    Each entry is the lead's assessment in the following JSON format, plus a "lead_id" field with its Lead ID:
+
+    {ASSESSMENT_FORMAT}
+
+    {REVIEW_GUIDANCE}
+
+    Format the response as valid JSON only.
+    """
+
+def parse_ai_response(content):
+    """Parse the model's JSON reply into our assessment format"""
+    result = json.loads(content)
+    
+    # Ensure result is a valid dictionary before returning
+    if not isinstance(result, dict):
+        logger.error(f"AI returned non-dictionary result: {result}")
+        return {
+            "error": "AI validation returned invalid format",
+            "risk_score": 50,
+            "issues": ["AI validation format error"],
+            "assessment": "medium_risk",
+            "confidence": 0
+        }
+    
+    return _normalize(result)
+
+def _normalize(result):
+    # Add timestamp and model info
+    result['ai_model'] = AI_MODEL
+    
+    # Add field to indicate this is the AI result, not DB duplicate check
+    if "duplicate_check" in result:
+        # Rename the field to avoid confusion with our database check
+        result["ai_duplicate_assessment"] = result.pop("duplicate_check")
+    
+    return result
+
+def _risk_score(entry):
+    """The entry's risk score, top-level or under ai_assessment, or None"""
+    nested = entry.get('ai_assessment')
+    score = entry.get('risk_score', nested.get('risk_score') if isinstance(nested, dict) else None)
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100:
+        return None
+    return score
+
+def parse_batch_response(content, lead_ids):
+    """
+    Parse the model's reply to build_batch_prompt into {lead ID: assessment}.
+    Entries for unknown or repeated lead IDs, and entries without a usable
+    risk score, are left out so the caller can ask for those leads again.
+    """
+    reply = json.loads(content)
+    entries = reply.get('results') if isinstance(reply, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError("AI batch reply has no results list")
+
+    wanted = set(lead_ids)
+    assessments = {}
+    repeated = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        lead_id = str(entry.pop('lead_id', ''))
+        if lead_id not in wanted or _risk_score(entry) is None:
+            logger.warning(f"Ignoring AI batch entry for lead ID {lead_id!r}")
+        elif lead_id in assessments:
+            repeated.add(lead_id)
+        else:
+            assessments[lead_id] = _normalize(entry)
+    for lead_id in repeated:
+        # Two answers for one lead: trust neither
+        logger.warning(f"AI batch reply assessed lead ID {lead_id!r} more than once")
+        del assessments[lead_id]
+    return assessments
+
+def ai_failure_result(error):
+    """Fallback assessment used when the AI call fails"""
+    return {
+        "error": f"AI validation failed: {str(error)}",
+        "risk_score": 50,  # Neutral score when AI fails
+        "issues": ["AI validation unavailable - using fallback rules"],
+        "assessment": "medium_risk",
+        "confidence": 0
+    }
+
+def _request_kwargs(lead_data):
+    return _chat_kwargs(build_lead_prompt(lead_data))
+
+def _chat_kwargs(prompt):
+    return {
+        'model': AI_MODEL,
+        'messages': [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0,  # Low temperature for consistent results
+        'response_format': {"type": "json_object"},
+    }
+
+def analyze_lead_with_ai(lead_data, refresh=False):
     """
     Use OpenAI API to analyze lead data for potential fraud
     Returns a dict with risk assessment
+    
+    An assessment cached for the same prompt is reused unless refresh is set
+    (see ai_cache.py); the returned dict's 'cache' entry says which happened.
     """
-    print("AI VALIDATOR STARTING - analyzing lead data...")
-    insurance_type = lead_data.get('insurance_type', '')
-    print(f"Processing insurance type: {insurance_type}")
-    print(f"Lead data keys: {list(lead_data.keys())}")
+    logger.debug(f"AI validation of a {lead_data.get('insurance_type', '')} lead")
+    
+    key, cached, cache_info = ai_cache.lookup(lead_data, refresh=refresh)
+    if cached is not None:
+        cached['cache'] = cache_info
+        return cached
     
     if not openai.api_key:
-        print("ERROR: OpenAI API key not configured!")
         logger.error("OpenAI API key not configured")
-        return {"error": "AI validation unavailable", "score": 0, "details": []}
+        return {"error": AI_NOT_CONFIGURED, "score": 0, "details": []}
+    
+    result = _assess_one(lead_data)
+    if 'error' in result:
+        return result
     
+    ai_cache.store(key, result)
+    result['cache'] = cache_info
+    return result
+
+def _assess_one(lead_data):
+    """Ask the model about one lead; returns the assessment or ai_failure_result"""
     try:
-        print(f"Using OpenAI API key: {openai.api_key[:5]}...{openai.api_key[-4:] if len(openai.api_key) > 8 else ''}")
-        
-        # Prepare the prompt with additional fields based on insurance type
-        
-        base_prompt = f"""
-        Analyze this lead information for potential fraud or validity issues:
-        
-        Name: {lead_data.get('name', 'Not provided')}
-        Email: {lead_data.get('email', 'Not provided')}
-        Phone: {lead_data.get('phone', 'Not provided')}
-        ZIP Code: {lead_data.get('zip_code', 'Not provided')}
-        Address: {lead_data.get('address', 'Not provided')}
-        IP Address: {lead_data.get('ip_address', 'Not provided')}
-        Insurance Type: {insurance_type}
-        Notes: {lead_data.get('notes', 'Not provided')}
-        """
-        
-        # Add insurance-specific fields to the prompt
-        if insurance_type == 'auto':
-            auto_details = f"""
-            Auto Insurance Details:
-            Vehicle VIN: {lead_data.get('vehicle_vin', 'Not provided')}
-            Vehicle Year: {lead_data.get('vehicle_year', 'Not provided')}
-            Vehicle Make: {lead_data.get('vehicle_make', 'Not provided')}
-            Vehicle Model: {lead_data.get('vehicle_model', 'Not provided')}
-            Vehicle Usage: {lead_data.get('vehicle_usage', 'Not provided')}
-            Annual Mileage: {lead_data.get('annual_mileage', 'Not provided')}
-            Date of Birth: {lead_data.get('date_of_birth', 'Not provided')}
-            Current Insurer: {lead_data.get('current_insurer', 'Not provided')}
-            """
-            base_prompt += auto_details
-            
-        elif insurance_type == 'home':
-            home_details = f"""
-            Home Insurance Details:
-            Property Type: {lead_data.get('property_type', 'Not provided')}
-            Ownership Status: {lead_data.get('ownership_status', 'Not provided')}
-            Year Built: {lead_data.get('year_built', 'Not provided')}
-            Square Footage: {lead_data.get('square_footage', 'Not provided')}
-            Bedrooms: {lead_data.get('num_bedrooms', 'Not provided')}
-            Bathrooms: {lead_data.get('num_bathrooms', 'Not provided')}
-            Current Insurer: {lead_data.get('current_insurer', 'Not provided')}
-            """
-            base_prompt += home_details
-            
-        elif insurance_type == 'business':
-            business_details = f"""
-            Business Insurance Details:
-            Business Name: {lead_data.get('business_name', 'Not provided')}
-            Business Address: {lead_data.get('business_address', 'Not provided')}
-            Industry: {lead_data.get('industry', 'Not provided')}
-            Number of Employees: {lead_data.get('num_employees', 'Not provided')}
-            Annual Revenue: {lead_data.get('annual_revenue', 'Not provided')}
-            Current Insurer: {lead_data.get('current_insurer', 'Not provided')}
-            """
-            base_prompt += business_details
-        
-        # Add the standard JSON request format
-        prompt = base_prompt + """
-        
-        Analyze the lead data and provide a comprehensive assessment in the following JSON format:
-        
-        {
-          "duplicate_check": {
-            "is_duplicate": boolean,
-            "confidence": number from 0-100,
-            "matching_lead_ids": [],
-            "matching_fields": []
-          },
-          
-          "ai_assessment": {
-            "risk_score": number from 0-100 (higher = more risky),
-            "assessment": "low_risk", "medium_risk", or "high_risk",
-            "confidence": number from 0-100,
-            "issues": [list of specific issues detected],
-            "ai_model": "gpt-4o"
-          },
-          
-          "email": {
-            "valid": boolean,
-            "issue": string or null,
-            "domain_risk": "low", "medium", or "high"
-          },
-          
-          "phone": {
-            "valid": boolean,
-            "country_code": string or null,
-            "formatted": string or null
-          },
-          
-          "name": {
-            "valid": boolean,
-            "name_parts": {
-              "first_name": string,
-              "last_name": string
-            }
-          },
-          
-          "location": {
-            "valid": boolean,
-            "derived_state": string or null,
-            "matches_ip_location": boolean
-          },
-          
-          "cross_field": {
-            "consistent": boolean,
-            "issues": [list of inconsistencies between fields]
-          }
-        }
-        
-        Be especially vigilant for:
-        - Disposable emails
-        - Keyboard pattern emails (qwerty, asdf, etc.)
-        - Suspicious naming patterns
-        - Fake phone numbers
-        - Mismatched location info
-        - Mismatches between fields (e.g., email name vs provided name)
-        - Common fraud patterns
-        - Inconsistencies in the provided insurance details
-        
-        Format the response as valid JSON only.
-        """
-        
-        print("Calling OpenAI API...")
-        
-        # Call OpenAI API
-        response = openai.chat.completions.create(
-            model="gpt-4o",  # Use the best available model
-            messages=[
-                {"role": "system", "content": "You are a fraud detection expert that analyzes lead data for insurance companies. You only respond with valid JSON that exactly matches the requested format."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,  # Low temperature for consistent results
-            response_format={"type": "json_object"}
-        )
-        
-        print("OpenAI API response received!")
-        
-        # Parse the response
-        result = json.loads(response.choices[0].message.content)
-        
-        # Add timestamp and model info
-        result['ai_model'] = "gpt-4o"
-        
-        # Add field to indicate this is the AI result, not DB duplicate check
-        if "duplicate_check" in result:
-            # Rename the field to avoid confusion with our database check
-            result["ai_duplicate_assessment"] = result.pop("duplicate_check")
-            print("Renamed AI duplicate_check to ai_duplicate_assessment")
-        
-        print("AI VALIDATION RESULT:")
-        print(json.dumps(result, indent=2))
-        
-        # Ensure result is a valid dictionary before returning
-        if isinstance(result, dict):
-            return result
+        # Call OpenAI API (with a deadline, and not at all while the circuit is open)
+        response = get_ai_client().complete(**_request_kwargs(lead_data))
+        return parse_ai_response(response.choices[0].message.content)
+    
+    except AIUnavailable as e:
+        logger.warning(f"Skipping AI validation: {str(e)}")
+        return ai_failure_result(e)
+    except Exception as e:
+        logger.error(f"Error using OpenAI API: {str(e)}")
+        return ai_failure_result(e)
+
+def _assess_batch(batch):
+    """
+    Ask the model about several leads in one request. Returns one assessment
+    per lead, in order; leads the reply leaves out or garbles are asked
+    about one at a time.
+    """
+    if len(batch) == 1:
+        return [_assess_one(batch[0])]
+
+    lead_ids = [f'L{number}' for number in range(1, len(batch) + 1)]
+    try:
+        response = get_ai_client().complete(timeout=get_ai_batch_settings()['TIMEOUT'],
+                                            **_chat_kwargs(build_batch_prompt(list(zip(lead_ids, batch)))))
+        assessments = parse_batch_response(response.choices[0].message.content, lead_ids)
+    except AIUnavailable as e:
+        logger.warning(f"Skipping AI validation of {len(batch)} leads: {str(e)}")
+        return [ai_failure_result(e) for _ in batch]
+    except Exception as e:
+        if is_upstream_failure(e):
+            logger.error(f"Error using OpenAI API for {len(batch)} leads: {str(e)}")
+            return [ai_failure_result(e) for _ in batch]
+        logger.error(f"Unusable AI batch reply for {len(batch)} leads: {str(e)}")
+        assessments = {}
+
+    missing = len(batch) - len(assessments)
+    if missing:
+        logger.warning(f"AI batch reply lacked {missing} of {len(batch)} leads; asking for them one at a time")
+    return [assessments.get(lead_id) or _assess_one(lead_data) for lead_id, lead_data in zip(lead_ids, batch)]
+
+def analyze_leads_with_ai(leads, refresh=False, batch_size=None):
+    """
+    analyze_lead_with_ai for several leads at once. Leads without a cached
+    assessment are packed into requests of up to batch_size leads (default
+    AI_BATCH['MAX_SIZE']); identical prompts are asked about once. Returns one assessment per
+    lead, in order; each fresh one records its request's size under 'batch'.
+    """
+    results = [None] * len(leads)
+    pending = {}  # cache key (the lead's position when the cache is off) -> [(position, cache info)]
+    for position, lead_data in enumerate(leads):
+        key, cached, cache_info = ai_cache.lookup(lead_data, refresh=refresh)
+        if cached is not None:
+            cached['cache'] = cache_info
+            results[position] = cached
         else:
-            logger.error(f"AI returned non-dictionary result: {result}")
-            return {
-                "error": "AI validation returned invalid format",
-                "risk_score": 50,
-                "issues": ["AI validation format error"],
-                "assessment": "medium_risk",
-                "confidence": 0
-            }
+            pending.setdefault(key or position, []).append((position, cache_info))
+    if not pending:
+        return results
+
+    if not openai.api_key:
+        logger.error("OpenAI API key not configured")
+        for entries in pending.values():
+            for position, _ in entries:
+                results[position] = {"error": AI_NOT_CONFIGURED, "score": 0, "details": []}
+        return results
+
+    groups = list(pending.items())
+    size = max(1, batch_size or get_ai_batch_settings()['MAX_SIZE'])
+    for start in range(0, len(groups), size):
+        chunk = groups[start:start + size]
+        assessments = _assess_batch([leads[entries[0][0]] for _, entries in chunk])
+        for (key, entries), assessment in zip(chunk, assessments):
+            failed = 'error' in assessment
+            if not failed and isinstance(key, str):
+                ai_cache.store(key, assessment)
+            for position, cache_info in entries:
+                result = copy.deepcopy(assessment)
+                if not failed:
+                    result['cache'] = cache_info
+                    result['batch'] = {'size': len(chunk)}
+                results[position] = result
+    return results
+
+async def analyze_lead_with_ai_async(lead_data, refresh=False):
+    """
+    Async version of analyze_lead_with_ai for ASGI views.
+    Awaiting the model does not tie up a worker thread.
+    """
+    key, cached, cache_info = await sync_to_async(ai_cache.lookup)(lead_data, refresh=refresh)
+    if cached is not None:
+        cached['cache'] = cache_info
+        return cached
+    
+    if not openai.api_key:
+        logger.error("OpenAI API key not configured")
+        return {"error": AI_NOT_CONFIGURED, "score": 0, "details": []}
     
+    try:
+        response = await get_ai_client().acomplete(**_request_kwargs(lead_data))
+        result = parse_ai_response(response.choices[0].message.content)
+    except AIUnavailable as e:
+        logger.warning(f"Skipping AI validation: {str(e)}")
+        return ai_failure_result(e)
     except Exception as e:
-        print(f"ERROR IN AI VALIDATION: {str(e)}")
         logger.error(f"Error using OpenAI API: {str(e)}")
-        # Return fallback assessment
-        return {
-            "error": f"AI validation failed: {str(e)}",
-            "risk_score": 50,  # Neutral score when AI fails
-            "issues": ["AI validation unavailable - using fallback rules"],
-            "assessment": "medium_risk",
-            "confidence": 0
-        } 
\ No newline at end of file
+        return ai_failure_result(e)
+    
+    await sync_to_async(ai_cache.store)(key, result)
+    result['cache'] = cache_info
+    return result
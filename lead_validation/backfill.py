@@ -0,0 +1,233 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Lead IDs fetched per keyset page when building chunks
+ID_PAGE_SIZE = 5000
+
+
+def revalidation_queryset(since=None, until=None, min_score=None, max_score=None, insurance_type=None,
+                          unvalidated=False):
+    """Leads matching the backfill filters; dates are inclusive creation dates"""
+    from lead_capture.models import Lead
+
+    leads = Lead.objects.all()
+    if since:
+        leads = leads.filter(created_at__date__gte=since)
+    if until:
+        leads = leads.filter(created_at__date__lte=until)
+    if min_score is not None:
+        leads = leads.filter(validation_score__gte=min_score)
+    if max_score is not None:
+        leads = leads.filter(validation_score__lte=max_score)
+    if insurance_type:
+        leads = leads.filter(insurance_type=insurance_type)
+    if unvalidated:
+        leads = leads.filter(validation_timestamp__isnull=True)
+    return leads
+
+
+def default_run_name(filters):
+    """Stable name for a set of filters, so rerunning the same command resumes its run"""
+    digest = hashlib.sha256(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return f'revalidate-{digest[:12]}'
+
+
+def iter_id_chunks(leads, after_id, chunk_size):
+    """
+    Lead IDs above after_id, in ascending chunks. IDs are read in keyset
+    pages, so no cursor or read transaction stays open while workers write.
+    """
+    ids = leads.order_by().values_list('id', flat=True)
+    chunk = []
+    while True:
+        page = list(ids.filter(id__gt=after_id).order_by('id')[:ID_PAGE_SIZE])
+        if not page:
+            break
+        for lead_id in page:
+            chunk.append(lead_id)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        after_id = page[-1]
+    if chunk:
+        yield chunk
+
+
+def default_workers():
+    """
+    Worker processes when --workers is not given. SQLite allows one writer
+    at a time, so concurrent workers there mostly wait on each other's locks
+    (and fail once the busy timeout runs out); it gets a single worker.
+    """
+    if connection.vendor == 'sqlite':
+        return 1
+    return os.cpu_count() or 1
+
+
+def init_worker(ai_slots):
+    """Pool initializer: set up Django in the new process and share the AI call limit"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    from .ai_client import limit_ai_concurrency
+    limit_ai_concurrency(ai_slots)
+
+
+def revalidate_chunk(lead_ids, refresh_ai=False):
+    """
+    Revalidate one chunk of leads (in a worker process), with the AI calls
+    for its ambiguous leads batched. Returns (processed, failed)
+    """
+    from lead_capture.models import Lead
+    from .utils import validate_and_store_lead_data, validate_and_store_leads
+
+    leads = list(Lead.objects.filter(id__in=lead_ids).order_by('id'))
+    try:
+        results = validate_and_store_leads(leads, refresh_ai=refresh_ai)
+    except Exception as e:
+        # Find the failing leads by going through the chunk one lead at a time
+        logger.warning(f"Batched revalidation of leads {lead_ids[0]}-{lead_ids[-1]} failed ({str(e)}); "
+                       f"retrying them one by one")
+    else:
+        # Leads whose result could not be stored keep their old validation
+        failed = sum(1 for result in results if 'error' in result)
+        return len(results) - failed, failed
+
+    processed = failed = 0
+    for lead in leads:
+        try:
+            result = validate_and_store_lead_data(lead, refresh_ai=refresh_ai)
+        except Exception as e:
+            failed += 1
+            logger.error(f"Error revalidating lead {lead.id}: {str(e)}")
+            continue
+        if 'error' in result:
+            failed += 1
+        else:
+            processed += 1
+    return processed, failed
+
+
+class Watermark:
+    """
+    Highest lead ID below which every submitted chunk has finished. Chunks
+    finish out of order, so only a finished prefix of them moves it.
+    """
+
+    def __init__(self, start):
+        self.value = start
+        self._pending = deque()
+
+    def add(self, last_id, future):
+        self._pending.append((last_id, future))
+
+    def advance(self):
+        while self._pending and self._pending[0][1].done():
+            self.value = self._pending.popleft()[0]
+        return self.value
+
+
+class InlineExecutor:
+    """
+    Runs each chunk as it is submitted, in this process; stands in for a pool
+    of one. Like init_worker, it holds this process's AI calls to `ai_slots`
+    while it is in use.
+    """
+
+    def __init__(self, ai_slots=None):
+        self.ai_slots = ai_slots
+        self._previous_slots = None
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+    def __enter__(self):
+        if self.ai_slots is not None:
+            from .ai_client import get_ai_client
+            client = get_ai_client()
+            self._previous_slots = client.slots
+            client.share_slots(self.ai_slots)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._previous_slots is not None:
+            from .ai_client import get_ai_client
+            get_ai_client().share_slots(self._previous_slots)
+            self._previous_slots = None
+        return False
+
+
+def revalidate(run, leads, workers=None, chunk_size=100, ai_concurrency=4, on_progress=None, refresh_ai=False):
+    """
+    Revalidate the leads after run.last_lead_id in a process pool, saving
+    the checkpoint on `run` as chunks finish. At most ai_concurrency AI calls
+    are in flight across all workers. Leads after the checkpoint may be
+    revalidated again on resume; revalidation is idempotent. refresh_ai
+    re-asks the model for leads whose assessment is cached. With a single
+    worker (the default on SQLite, see default_workers) chunks run in this
+    process. on_progress(run, processed, elapsed) is called after every chunk.
+    """
+    workers = workers or default_workers()
+    if workers == 1:
+        pool = InlineExecutor(threading.BoundedSemaphore(ai_concurrency))
+    else:
+        context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                   initargs=(context.BoundedSemaphore(ai_concurrency),))
+    watermark = Watermark(run.last_lead_id)
+    started = time.monotonic()
+    processed = 0
+
+    def record(done):
+        nonlocal processed
+        for future in done:
+            chunk_processed, chunk_failed = future.result()
+            processed += chunk_processed
+            run.processed += chunk_processed
+            run.failed += chunk_failed
+        run.last_lead_id = watermark.advance()
+        run.save(update_fields=['last_lead_id', 'processed', 'failed', 'updated_at'])
+        if on_progress:
+            on_progress(run, processed, time.monotonic() - started)
+
+    with pool:
+        in_flight = set()
+        try:
+            for chunk in iter_id_chunks(leads, run.last_lead_id, chunk_size):
+                future = pool.submit(revalidate_chunk, chunk, refresh_ai)
+                watermark.add(chunk[-1], future)
+                in_flight.add(future)
+                # Keep a bounded number of chunks queued; IDs are read as the pool drains
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    record(done)
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                record(done)
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    run.completed_at = timezone.now()
+    run.save(update_fields=['completed_at', 'updated_at'])
+    return processed
@@ -0,0 +1,200 @@
+"""
+Columnar versions of the rule validators, for rescoring historical leads.
+
+Each function takes a column of values (list, NumPy array or pandas
+Series) and returns a dict of boolean NumPy arrays, one per flag of the
+matching validators.py result. Phone and ZIP checks run on code-point
+matrices, so their cost does not depend on the interpreter. Email and
+name checks need the pattern automaton, so they run the scalar validator
+once per distinct value and broadcast the result.
+"""
+import numpy as np
+from . import validators
+
+PHONE_COLUMNS = ('valid', 'format_valid', 'suspicious_pattern', 'high_risk_area_code', 'voip_number',
+                 'toll_free', 'overall', 'suspicious')
+LOCATION_COLUMNS = ('valid', 'format_valid', 'high_risk_zip', 'state_mismatch', 'suspicious')
+EMAIL_COLUMNS = ('valid', 'format_valid', 'disposable', 'suspicious_pattern', 'high_risk_tld', 'overall',
+                 'suspicious')
+NAME_COLUMNS = ('valid', 'format_valid', 'suspicious_pattern', 'fake_name', 'celebrity_name')
+
+_HIGH_FRAUD_AREA_CODES = np.array(sorted(int(code) for code in validators.HIGH_FRAUD_AREA_CODES))
+_VOIP_AREA_CODES = np.array(sorted(int(code) for code in validators.VOIP_AREA_CODES))
+_TOLL_FREE_AREA_CODES = np.array(sorted(int(code) for code in validators.TOLL_FREE_AREA_CODES))
+_OBVIOUS_FAKE_PHONES = np.array(sorted(int(phone) for phone in validators.OBVIOUS_FAKE_PHONES), dtype=np.int64)
+_HIGH_FRAUD_ZIP_CODES = np.array(sorted(int(zip5) for zip5 in validators.HIGH_FRAUD_ZIP_CODES))
+
+_PLACE_VALUES = 10 ** np.arange(9, -1, -1, dtype=np.int64)
+
+
+def _as_text(values):
+    """1-D unicode array; None, NaN and other non-strings become '' (missing)"""
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        return values.ravel()
+    return np.array([value if isinstance(value, str) else '' for value in values], dtype=str)
+
+
+def _code_points(text, min_width):
+    """(rows, width) uint32 matrix of the characters, zero-padded to at least min_width"""
+    width = max(text.dtype.itemsize // 4, 1)
+    points = np.ascontiguousarray(text).view(np.uint32).reshape(len(text), width)
+    if width < min_width:
+        points = np.pad(points, ((0, 0), (0, min_width - width)))
+    return points
+
+
+def _min_count(length, threshold):
+    """Fewest occurrences c with c / length >= threshold, as _detect_repetitive_chars compares"""
+    return next((count for count in range(1, length + 1) if count / length >= threshold), length + 1)
+
+
+def _repetitive(digits, threshold):
+    """_detect_repetitive_chars for rows of equal-length digit strings"""
+    length = digits.shape[1]
+    # Most common digit: in a sorted row, `needed` equal digits sit side by side
+    needed = _min_count(length, threshold)
+    ordered = np.sort(digits, axis=1)
+    if needed <= 1:
+        repetitive = np.ones(len(digits), dtype=bool)
+    elif needed > length:
+        repetitive = np.zeros(len(digits), dtype=bool)
+    else:
+        repetitive = (ordered[:, needed - 1:] == ordered[:, :length - needed + 1]).any(axis=1)
+
+    # Repeating patterns: the row's first p * (length // p) digits have period p
+    for pattern_len in range(1, min(5, length // 2)):
+        covered = pattern_len * (length // pattern_len)
+        repetitive |= (digits[:, pattern_len:covered] == digits[:, :covered - pattern_len]).all(axis=1)
+    return repetitive
+
+
+def _runs_of(steps, step, run):
+    """Rows where `run` consecutive differences all equal `step`"""
+    matches = steps == step
+    found = matches[:, :matches.shape[1] - run + 1].copy()
+    for offset in range(1, run):
+        found &= matches[:, offset:matches.shape[1] - run + 1 + offset]
+    return found.any(axis=1)
+
+
+def validate_phone_numbers(phones):
+    """Columnar validate_phone_number"""
+    text = _as_text(phones)
+    points = _code_points(text, 11)
+    is_digit = (points >= 48) & (points <= 57)
+    count = is_digit.sum(axis=1)
+
+    # Left-align each row's first 11 digits (more than 11 is invalid anyway)
+    position = np.cumsum(is_digit, axis=1) - 1
+    rows, cols = np.nonzero(is_digit & (position < 11))
+    digits = np.zeros((len(text), 11), dtype=np.int8)
+    digits[rows, position[rows, cols]] = points[rows, cols] - 48
+
+    with_country_code = count == 11
+    format_valid = (count == 10) | (with_country_code & (digits[:, 0] == 1))
+    # Normalize to 10 digits
+    digits = np.where(with_country_code[:, None], digits[:, 1:], digits[:, :10])
+
+    area_code = digits[:, 0].astype(np.int32) * 100 + digits[:, 1] * 10 + digits[:, 2]
+    number = digits.astype(np.int64) @ _PLACE_VALUES
+
+    steps = np.diff(digits, axis=1)
+    suspicious_pattern = format_valid & (
+        np.isin(number, _OBVIOUS_FAKE_PHONES)
+        | _runs_of(steps, 1, 3) | _runs_of(steps, -1, 3)  # 4 sequential digits
+        | _repetitive(digits, 0.4)
+    )
+    high_risk_area_code = format_valid & np.isin(area_code, _HIGH_FRAUD_AREA_CODES)
+    voip_number = format_valid & np.isin(area_code, _VOIP_AREA_CODES)
+    valid = format_valid & ~suspicious_pattern
+    return {
+        'valid': valid,
+        'format_valid': format_valid,
+        'suspicious_pattern': suspicious_pattern,
+        'high_risk_area_code': high_risk_area_code,
+        'voip_number': voip_number,
+        'toll_free': format_valid & np.isin(area_code, _TOLL_FREE_AREA_CODES),
+        'overall': valid,
+        'suspicious': valid & (high_risk_area_code | voip_number),
+    }
+
+
+def _state_mismatch(prefix, states):
+    """Whether each row's state is outside its ZIP prefix's states ('' = no state given)"""
+    unique, inverse = np.unique(states, return_inverse=True)
+    # expected[p, i]: unique[i] belongs to ZIP prefix p (upper-cased in Python, as validate_location does)
+    expected = np.zeros((10, len(unique)), dtype=bool)
+    for index, state in enumerate(unique):
+        state = state.upper()
+        for zip_prefix, prefix_states in validators.ZIP_PREFIX_STATES.items():
+            expected[zip_prefix, index] = state in prefix_states
+    return (states != '') & ~expected[prefix, inverse.ravel()]
+
+
+def validate_locations(zip_codes, states=None):
+    """Columnar validate_location; `states` is an optional column of the same length"""
+    text = _as_text(zip_codes)
+    points = _code_points(text, 10)
+    is_digit = (points >= 48) & (points <= 57)
+    length = np.char.str_len(text)
+
+    first_five = is_digit[:, :5].all(axis=1)
+    format_valid = ((length == 5) & first_five) | (
+        (length == 10) & first_five & (points[:, 5] == 45) & is_digit[:, 6:10].all(axis=1))
+
+    digits = np.where(is_digit[:, :5], points[:, :5] - 48, 0).astype(np.int32)
+    zip5 = digits @ np.array([10000, 1000, 100, 10, 1], dtype=np.int32)
+    high_risk_zip = format_valid & np.isin(zip5, _HIGH_FRAUD_ZIP_CODES)
+
+    state_text = _as_text(states) if states is not None else np.full(len(text), '', dtype='<U1')
+    state_mismatch = format_valid & _state_mismatch(digits[:, 0], state_text)
+    valid = format_valid & ~state_mismatch
+    result = {
+        'valid': valid,
+        'format_valid': format_valid,
+        'high_risk_zip': high_risk_zip,
+        'state_mismatch': state_mismatch,
+        'suspicious': valid & high_risk_zip,
+    }
+
+    # The ZIP regex's \d and $ also accept non-ASCII digits and a trailing
+    # newline; the few such values go through the scalar validator
+    unusual = np.nonzero((points > 127).any(axis=1) | (points == 10).any(axis=1))[0]
+    for row in unusual:
+        scalar = validators.validate_location(str(text[row]), str(state_text[row]) or None)
+        for column in LOCATION_COLUMNS:
+            result[column][row] = scalar.get(column, False)
+    return result
+
+
+def _per_distinct_value(values, validate, columns):
+    """Run a scalar validator once per distinct value and broadcast its flags"""
+    text = _as_text(values)
+    unique, inverse = np.unique(text, return_inverse=True)
+    flags = np.zeros((len(columns), len(unique)), dtype=bool)
+    for index, value in enumerate(unique.tolist()):
+        result = validate(value)
+        for column_index, column in enumerate(columns):
+            flags[column_index, index] = result.get(column, False)
+    inverse = inverse.ravel()
+    return {column: flags[column_index][inverse] for column_index, column in enumerate(columns)}
+
+
+def validate_email_addresses(emails):
+    """Columnar validate_email_address"""
+    return _per_distinct_value(emails, validators.validate_email_address, EMAIL_COLUMNS)
+
+
+def validate_names(names):
+    """Columnar validate_name"""
+    return _per_distinct_value(names, validators.validate_name, NAME_COLUMNS)
+
+
+def validate_leads(emails, phones, names, zip_codes, states=None):
+    """All four rule validators over lead columns: {'email': {...}, 'phone': ..., 'name': ..., 'location': ...}"""
+    return {
+        'email': validate_email_addresses(emails),
+        'phone': validate_phone_numbers(phones),
+        'name': validate_names(names),
+        'location': validate_locations(zip_codes, states),
+    }
@@ -0,0 +1,152 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Canned assessment returned for every lead
+FAKE_ASSESSMENT = {
+    "risk_score": 20,
+    "assessment": "low_risk",
+    "confidence": 90,
+    "issues": [],
+    "email": {"valid": True, "issue": None, "domain_risk": "low"},
+    "phone": {"valid": True, "country_code": "US", "formatted": None},
+    "cross_field": {"consistent": True, "issues": []},
+}
+
+
+# Batched prompts (ai_validator.build_batch_prompt) label each lead like this
+LEAD_ID_PATTERN = re.compile(r'^\s*Lead ID: (\S+)\s*$', re.MULTILINE)
+
+
+def fake_reply(request):
+    """The canned assessment, or one per Lead ID for a batched prompt"""
+    prompt = ''.join(message.get('content') or '' for message in request.get('messages', [])
+                     if message.get('role') == 'user')
+    lead_ids = LEAD_ID_PATTERN.findall(prompt)
+    if not lead_ids:
+        return FAKE_ASSESSMENT
+    return {"results": [dict(FAKE_ASSESSMENT, lead_id=lead_id) for lead_id in lead_ids]}
+
+
+def chat_completion_payload(content, model='gpt-4o'):
+    """An OpenAI-style chat completion response wrapping `content`"""
+    return {
+        "id": f"chatcmpl-fake-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class FakeAIHandler(BaseHTTPRequestHandler):
+    """Answers POST .../chat/completions after the server's configured latency"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # One handler per connection, so this counts connections, not requests
+        self.server.count_connection()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if not self.path.rstrip('/').endswith('chat/completions'):
+            self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        try:
+            request = json.loads(body or b'{}')
+            model = request.get('model', 'gpt-4o')
+        except (ValueError, AttributeError):
+            self._reply(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        latency, fail = self.server.next_outcome()
+        time.sleep(latency)
+        self.server.count_request(failed=fail)
+        if fail:
+            self._reply(self.server.error_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+        self._reply(200, chat_completion_payload(json.dumps(fake_reply(request)), model))
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out or was cancelled while the reply was delayed
+            logger.debug(f"Client {self.client_address[0]} disconnected before the {status} reply")
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class FakeAIServer(ThreadingHTTPServer):
+    """
+    Minimal OpenAI-compatible chat completions server for load tests; it
+    answers batched prompts with one assessment per Lead ID.
+    Each request sleeps `latency` seconds (plus up to `jitter` more) in its
+    own thread, so it behaves like a slow upstream model without limiting
+    concurrency itself. A share `error_rate` of requests is answered with
+    `error_status` instead. All four can be changed while it runs, e.g. to
+    simulate an outage and a recovery.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=1.0, jitter=0.0, error_rate=0.0, error_status=500, seed=None):
+        super().__init__(address, FakeAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests_served = 0
+        self.errors_served = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._count_lock = threading.Lock()
+
+    def next_outcome(self):
+        """(seconds to wait, whether to fail) for the next request"""
+        with self._count_lock:
+            return (self.latency + self._random.uniform(0, self.jitter),
+                    self._random.random() < self.error_rate)
+
+    def count_request(self, failed=False):
+        with self._count_lock:
+            self.requests_served += 1
+            self.errors_served += failed
+
+    def count_connection(self):
+        with self._count_lock:
+            self.connections += 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+
+def start_fake_ai_server(host='127.0.0.1', port=0, latency=1.0, **options):
+    """Start a FakeAIServer in a background thread and return it (see FakeAIServer for options)"""
+    server = FakeAIServer((host, port), latency=latency, **options)
+    thread = threading.Thread(target=server.serve_forever, name='fake-ai-server', daemon=True)
+    thread.start()
+    return server
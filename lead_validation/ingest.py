@@ -0,0 +1,376 @@
+import codecs
+import json
+import logging
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email, validate_ipv46_address
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from lead_capture.identity import identity_keys
+from lead_capture.models import Lead, LeadNotification
+from referral_system.models import ReferralLink
+from referral_system.rates import resolve_rate
+from referral_system.stats import apply_agent_delta, apply_link_delta, lead_counts
+from .models import LeadSimilarityKey, ValidationJob
+from .near_duplicates import similarity_keys
+
+logger = logging.getLogger(__name__)
+
+# Rows are parsed lazily and written one chunk (one transaction) at a time
+INGEST_CHUNK_SIZE = 1000
+
+# Hard cap on rows per request
+MAX_ROWS_PER_REQUEST = 50000
+
+READ_SIZE = 64 * 1024
+
+REQUIRED_FIELDS = ('name', 'email', 'phone', 'insurance_type')
+
+# Lead fields a partner may set; everything else (status, scores, rewards,
+# identity keys, ownership) is controlled by the server
+INGEST_FIELDS = (
+    'name', 'email', 'phone', 'state', 'zip_code', 'address', 'insurance_type',
+    'vehicle_vin', 'vehicle_year', 'vehicle_make', 'vehicle_model', 'vehicle_usage',
+    'annual_mileage', 'date_of_birth', 'current_insurer',
+    'property_type', 'ownership_status', 'year_built', 'square_footage', 'num_bedrooms', 'num_bathrooms',
+    'business_name', 'business_address', 'industry', 'num_employees', 'annual_revenue',
+    'notes', 'preferred_contact_method', 'preferred_time', 'ip_address', 'user_agent',
+)
+
+
+class IngestError(Exception):
+    """The request body could not be parsed"""
+
+
+def _compile_fields():
+    compiled = []
+    for name in INGEST_FIELDS:
+        field = Lead._meta.get_field(name)
+        choices = frozenset(value for value, _ in field.choices) if field.choices else None
+        is_text = isinstance(field, (models.CharField, models.TextField)) and \
+            not isinstance(field, models.GenericIPAddressField)
+        compiled.append((name, field, is_text, choices))
+    return compiled
+
+_FIELDS = _compile_fields()
+
+
+def clean_row(row):
+    """Return (field values, errors) for one incoming lead"""
+    if not isinstance(row, dict):
+        return None, ['Each lead must be a JSON object']
+
+    values, errors = {}, []
+    for name, field, is_text, choices in _FIELDS:
+        value = row.get(name)
+        if value is None or value == '':
+            if name in REQUIRED_FIELDS:
+                errors.append(f'{name}: required')
+            continue
+        if is_text:
+            value = str(value).strip()
+            if field.max_length and len(value) > field.max_length:
+                errors.append(f'{name}: longer than {field.max_length} characters')
+                continue
+        else:
+            try:
+                value = field.to_python(value)
+            except ValidationError as e:
+                errors.append(f'{name}: {"; ".join(e.messages)}')
+                continue
+        if choices is not None and value not in choices:
+            errors.append(f'{name}: must be one of {", ".join(sorted(choices))}')
+            continue
+        values[name] = value
+
+    if 'email' in values:
+        try:
+            validate_email(values['email'])
+        except ValidationError:
+            errors.append('email: invalid address')
+    if 'ip_address' in values:
+        try:
+            validate_ipv46_address(values['ip_address'])
+        except ValidationError:
+            errors.append('ip_address: invalid address')
+    return values, errors
+
+
+def iter_ndjson(stream):
+    """Yield one decoded value (or a ValueError) per non-blank line"""
+    for line in iter(stream.readline, b''):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+def _text_chunks(stream):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(data)
+
+
+def iter_json_array(stream):
+    """
+    Yield the elements of a top-level JSON array without reading the whole
+    body into memory. Raises IngestError if the body is not a well-formed array.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+    state = 'start'  # start -> first -> (value -> separator)* -> done
+
+    for text in _text_chunks(stream):
+        buffer = buffer[pos:] + text
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos >= len(buffer):
+                break
+
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise IngestError('Expected a JSON array of leads')
+                state, pos = 'first', pos + 1
+            elif state == 'separator':
+                if char not in ',]':
+                    raise IngestError(f'Expected "," or "]" in JSON array, found {char!r}')
+                state, pos = ('value', pos + 1) if char == ',' else ('done', pos + 1)
+            elif state == 'first' and char == ']':
+                state, pos = 'done', pos + 1
+            elif state in ('first', 'value'):
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # element continues in the next chunk
+                if end == len(buffer) and not isinstance(value, (dict, list)):
+                    break  # a scalar may be cut off at the chunk boundary
+                yield value
+                state, pos = 'separator', end
+            else:
+                raise IngestError('Unexpected data after the JSON array')
+
+    if state != 'done':
+        raise IngestError('Malformed or truncated JSON array')
+
+
+def _existing_ids(field, keys):
+    """Map identity key -> existing lead id, one query per chunk"""
+    keys = [key for key in keys if key]
+    if not keys:
+        return {}
+    return dict(Lead.objects.filter(**{f'{field}__in': keys}).values_list(field, 'id'))
+
+
+# Field types whose Python values need backend adaptation before executemany
+_ADAPTED_TYPES = frozenset({'DateTimeField', 'DateField', 'TimeField', 'DecimalField', 'JSONField', 'UUIDField'})
+
+
+class RowInserter:
+    """
+    Multi-row INSERT for one model through the DB-API executemany.
+
+    bulk_create builds a model instance and runs every field through the
+    query compiler for every row, and SQLite caps it at 999 parameters per
+    statement (about 20 Lead rows). Partner batches are wide and large, so
+    rows are plain dicts here: missing columns take the field default and
+    `constants` (timestamps, owner) are adapted once per call. No signals
+    are sent and primary keys are not returned.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in self.fields),
+            ', '.join(['%s'] * len(self.fields)),
+        )
+
+    def insert(self, rows, constants=None):
+        constants = constants or {}
+        columns = []
+        for field in self.fields:
+            # Foreign keys take the column type of the field they point to
+            column_field = field.target_field if field.is_relation else field
+            adapted = column_field.get_internal_type() in _ADAPTED_TYPES
+            if field.attname in constants:
+                columns.append((None, field.get_db_prep_save(constants[field.attname], connection), False))
+            else:
+                default = field.get_default() if field.has_default() else None
+                if default is not None:
+                    default = field.get_db_prep_save(default, connection)
+                columns.append((field.attname, default, adapted and field))
+
+        records = []
+        for row in rows:
+            record = []
+            for attname, default, adapt in columns:
+                if attname is None or attname not in row:
+                    record.append(default)
+                    continue
+                value = row[attname]
+                if adapt and value is not None:
+                    value = adapt.get_db_prep_save(value, connection)
+                record.append(value)
+            records.append(record)
+
+        with connection.cursor() as cursor:
+            cursor.executemany(self.sql, records)
+        return len(records)
+
+
+class BulkIngest:
+    """
+    Ingests partner leads for one agent (optionally through one of their links).
+
+    Each chunk of rows costs a fixed number of queries: two set-based
+    duplicate probes, then in one transaction the lead INSERT, an id
+    lookup, the notification outbox INSERT, the near-duplicate key INSERT,
+    the validation job INSERT, the agent stats UPDATE and, for a referral
+    link, the link credit and link stats UPDATEs. The link is credited only while it is active; if it
+    was deactivated mid-request the chunk rolls back and IngestError stops
+    the run.
+    """
+
+    def __init__(self, agent, referral_link=None, ip_address=None, chunk_size=INGEST_CHUNK_SIZE):
+        self.agent_id = referral_link.user_id if referral_link else agent.id
+        self.referral_link = referral_link
+        self.ip_address = ip_address
+        self.chunk_size = chunk_size
+        self.results = []
+        self.counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+        self._seen_emails = {}
+        self._seen_phones = {}
+        self._leads = RowInserter(Lead)
+        self._notifications = RowInserter(LeadNotification)
+        self._similarity_keys = RowInserter(LeadSimilarityKey)
+        self._jobs = RowInserter(ValidationJob)
+
+    def run(self, rows):
+        """Consume an iterable of decoded rows (ValueError items mark unparsable rows)"""
+        chunk = []
+        try:
+            for index, row in enumerate(rows):
+                if index >= MAX_ROWS_PER_REQUEST:
+                    raise IngestError(f'At most {MAX_ROWS_PER_REQUEST} leads per request')
+                chunk.append((index, row))
+                if len(chunk) >= self.chunk_size:
+                    self._ingest_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self._ingest_chunk(chunk)
+        finally:
+            # Chunks written before a parse error stay committed and are reported
+            self.results.sort(key=lambda result: result['row'])
+        return self.results
+
+    def _result(self, index, status, **extra):
+        self.counts[status] += 1
+        self.results.append({'row': index, 'status': status, **extra})
+
+    def _ingest_chunk(self, chunk):
+        candidates = []
+        for index, row in chunk:
+            if isinstance(row, ValueError):
+                self._result(index, 'invalid', errors=[f'Invalid JSON: {row}'])
+                continue
+            values, errors = clean_row(row)
+            if errors:
+                self._result(index, 'invalid', errors=errors)
+                continue
+            values.setdefault('ip_address', self.ip_address)
+            values.update(identity_keys(values['email'], values['phone'], values['name'], values.get('zip_code')))
+            candidates.append((index, values))
+
+        existing_emails = _existing_ids('email_normalized', [values['email_normalized'] for _, values in candidates])
+        existing_phones = _existing_ids('phone_e164', [values['phone_e164'] for _, values in candidates])
+
+        new_rows = []
+        for index, values in candidates:
+            email, phone = values['email_normalized'], values['phone_e164']
+            if email in existing_emails or phone in existing_phones:
+                self._result(index, 'duplicate',
+                             lead_id=existing_emails.get(email) or existing_phones.get(phone))
+                continue
+            earlier_row = self._seen_emails.get(email) if email else None
+            if earlier_row is None and phone:
+                earlier_row = self._seen_phones.get(phone)
+            if earlier_row is not None:
+                self._result(index, 'duplicate', duplicate_of_row=earlier_row)
+                continue
+            if email:
+                self._seen_emails[email] = index
+            if phone:
+                self._seen_phones[phone] = index
+            new_rows.append((index, values))
+
+        if not new_rows:
+            return
+
+        earnings = 0
+        link = self.referral_link
+        if link:
+            rewards = {}
+            for _, values in new_rows:
+                # Same payout rules as a form submission (see lead_capture.services)
+                earnings += resolve_rate(link.user_id, values.get('state') or link.target_state, values['insurance_type'])
+                # ... and the referrer's reward Lead.save would set (none for agent links)
+                state = values.get('state')
+                if state not in rewards:
+                    rewards[state] = link.get_reward_amount(state)
+                values['reward_amount'] = rewards[state]
+
+        now = timezone.now()
+        owner = {'agent_id': self.agent_id, 'referral_link_id': link.pk if link else None}
+        with transaction.atomic():
+            self._leads.insert([values for _, values in new_rows],
+                               constants={**owner, 'created_at': now, 'updated_at': now})
+            # Emails are unique within the chunk, so they map the new rows back to their ids
+            lead_ids = dict(
+                Lead.objects.filter(email_normalized__in=[values['email_normalized'] for _, values in new_rows],
+                                    created_at=now, agent_id=self.agent_id)
+                .values_list('email_normalized', 'id')
+            )
+            ids = [lead_ids[values['email_normalized']] for _, values in new_rows]
+
+            # No post_save for raw inserts, so write the notification outbox rows here
+            self._notifications.insert([{'lead_id': lead_id} for lead_id in ids],
+                                       constants={'agent_id': self.agent_id, 'created_at': now})
+            # Bucket keys, so later submissions find these leads as near-duplicates
+            self._similarity_keys.insert([
+                {'lead_id': lead_id, 'key': key}
+                for (_, values), lead_id in zip(new_rows, ids) for key in similarity_keys(values)
+            ])
+            self._jobs.insert([{'lead_id': lead_id} for lead_id in ids], constants={
+                'priority': ValidationJob.PRIORITY_BACKFILL, 'available_at': now,
+                'created_at': now, 'updated_at': now,
+            })
+            # ... nor for the referral stats: every new lead is 'new' and unscored
+            counts = lead_counts(Lead._meta.get_field('status').default, 0, len(ids))
+            if link:
+                credited = ReferralLink.objects.filter(pk=link.pk, is_active=True).update(
+                    conversions=F('conversions') + len(ids),
+                    paid_conversions=F('paid_conversions') + len(ids),
+                    earnings=F('earnings') + earnings,
+                )
+                if not credited:
+                    # Rolls the chunk back; earlier chunks stay committed and reported
+                    raise IngestError(f'Referral link {link.code} is no longer active')
+                apply_link_delta(link.pk, counts)
+                counts.update({'conversions': len(ids), 'paid_conversions': len(ids), 'earnings': earnings})
+            apply_agent_delta(self.agent_id, counts)
+
+        for (index, _), lead_id in zip(new_rows, ids):
+            self._result(index, 'created', lead_id=lead_id)
@@ -0,0 +1,53 @@
+import random
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from lead_validation import batch, validators
+from .bench_validators import synthetic_lead
+
+class Command(BaseCommand):
+    help = 'Times the columnar rule validators (lead_validation/batch.py) on a synthetic lead table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--scalar-sample', type=int, default=20000,
+                            help='Leads timed through the scalar validators for comparison')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['rows'] <= 0:
+            raise CommandError('--rows must be positive')
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        emails, phones, names, zip_codes, states = (
+            np.array(column) for column in zip(*(synthetic_lead(rng) for _ in range(options['rows'])))
+        )
+        self.stdout.write(f'Generated {options["rows"]:,} leads in {time.perf_counter() - started:.1f}s')
+
+        total = 0.0
+        for name, run in [
+            ('phone', lambda: batch.validate_phone_numbers(phones)),
+            ('location', lambda: batch.validate_locations(zip_codes, states)),
+            ('email', lambda: batch.validate_email_addresses(emails)),
+            ('name', lambda: batch.validate_names(names)),
+        ]:
+            started = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - started
+            total += elapsed
+            self.stdout.write(f'{name:<9} {elapsed:6.2f}s  ({int(result["valid"].sum()):,} valid)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Batch: {total:.2f}s for {options["rows"]:,} leads ({options["rows"] / total:,.0f} leads/s)'))
+
+        sample = options['scalar_sample']
+        if sample > 0:
+            started = time.perf_counter()
+            for email, phone, name, zip_code, state in zip(emails[:sample].tolist(), phones[:sample].tolist(),
+                                                           names[:sample].tolist(), zip_codes[:sample].tolist(),
+                                                           states[:sample].tolist()):
+                validators.validate_email_address(email)
+                validators.validate_phone_number(phone)
+                validators.validate_location(zip_code, state)
+                validators.validate_name(name)
+            rate = min(sample, options['rows']) / (time.perf_counter() - started)
+            self.stdout.write(f'Scalar:  {rate:,.0f} leads/s (projected {options["rows"] / rate:.1f}s for the table)')
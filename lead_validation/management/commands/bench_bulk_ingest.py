@@ -0,0 +1,60 @@
+import io
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from lead_validation.ingest import BulkIngest, iter_json_array, iter_ndjson
+
+class _Rollback(Exception):
+    pass
+
+def synthetic_rows(count, offset):
+    for n in range(offset, offset + count):
+        yield {
+            'name': f'Bench Lead {n}',
+            'email': f'bench.lead{n}@example.org',
+            'phone': f'{3000000000 + n:010d}',
+            'zip_code': f'{10000 + n % 89999:05d}',
+            'insurance_type': 'auto',
+            'vehicle_year': 2015,
+        }
+
+class Command(BaseCommand):
+    help = (
+        'Measures bulk lead ingestion throughput (parsing, dedupe and inserts, without HTTP). '
+        'Everything is rolled back at the end; run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Leads per batch')
+        parser.add_argument('--batches', type=int, default=3)
+        parser.add_argument('--format', choices=['ndjson', 'json'], default='ndjson')
+
+    def handle(self, *args, **options):
+        if options['rows'] <= 0 or options['batches'] <= 0:
+            raise CommandError('--rows and --batches must be positive')
+
+        try:
+            with transaction.atomic():
+                agent = User.objects.create(username=f'bench-{time.time_ns()}')
+                for batch in range(options['batches']):
+                    rows = list(synthetic_rows(options['rows'], batch * options['rows']))
+                    if options['format'] == 'ndjson':
+                        body = '\n'.join(json.dumps(row) for row in rows).encode()
+                        parse = iter_ndjson
+                    else:
+                        body = json.dumps(rows).encode()
+                        parse = iter_json_array
+
+                    ingest = BulkIngest(agent)
+                    started = time.perf_counter()
+                    ingest.run(parse(io.BytesIO(body)))
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Batch {batch + 1}: {ingest.counts} in {elapsed:.2f}s '
+                        f'({options["rows"] / elapsed:.0f} leads/s)'
+                    ))
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write('Rolled back synthetic leads')
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from lead_capture.identity import identity_keys
+from lead_capture.models import Lead
+from lead_validation.utils import check_for_duplicate_lead
+
+FIRST_NAMES = ['james', 'mary', 'robert', 'patricia', 'john', 'jennifer', 'michael', 'linda', 'david', 'susan']
+LAST_NAMES = ['garcia', 'miller', 'davis', 'lopez', 'wilson', 'moore', 'taylor', 'thomas', 'white', 'harris']
+DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'example.org']
+
+class _Rollback(Exception):
+    pass
+
+def synthetic_lead(n):
+    first = FIRST_NAMES[n % len(FIRST_NAMES)]
+    last = LAST_NAMES[(n // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    data = {
+        'name': f"{first.title()} {last.title()}",
+        'email': f"{first}.{last}{n}@{DOMAINS[n % len(DOMAINS)]}",
+        'phone': f"{2000000000 + n:010d}",
+        'zip_code': f"{10000 + n % 89999:05d}",
+    }
+    return data
+
+class Command(BaseCommand):
+    help = (
+        'Measures duplicate-check latency as the Lead table grows. Synthetic leads are '
+        'inserted inside a transaction that is rolled back at the end; run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000,5000000',
+                            help='Comma-separated table sizes to measure at')
+        parser.add_argument('--probes', type=int, default=500,
+                            help='Duplicate checks timed at each size (half hit an existing lead)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        if options['probes'] <= 0:
+            raise CommandError('--probes must be positive')
+        if Lead.objects.exists():
+            self.stdout.write(self.style.WARNING('Lead table is not empty; results include existing rows'))
+
+        try:
+            with transaction.atomic():
+                agent = User.objects.create(username=f'bench-{time.time_ns()}')
+                inserted = 0
+                for size in sizes:
+                    inserted = self._grow(agent, inserted, size, options['batch_size'])
+                    self._measure(size, options['probes'])
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write('Rolled back synthetic leads')
+
+    def _grow(self, agent, start, size, batch_size):
+        started = time.monotonic()
+        for offset in range(start, size, batch_size):
+            leads = []
+            for n in range(offset, min(size, offset + batch_size)):
+                data = synthetic_lead(n)
+                leads.append(Lead(agent=agent, insurance_type='auto', **data,
+                                  **identity_keys(data['email'], data['phone'], data['name'], data['zip_code'])))
+            Lead.objects.bulk_create(leads)
+        self.stdout.write(f'Inserted up to {size} leads in {time.monotonic() - started:.1f}s')
+        return size
+
+    def _measure(self, size, probes):
+        timings = []
+        for i in range(probes):
+            if i % 2:
+                data = synthetic_lead(random.randrange(size))  # existing lead
+            else:
+                data = synthetic_lead(size + random.randrange(10 ** 6))  # new lead
+            started = time.perf_counter()
+            check_for_duplicate_lead(data)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(self.style.SUCCESS(
+            f'{size:>9} leads: mean {statistics.mean(timings):.3f} ms, '
+            f'p50 {statistics.median(timings):.3f} ms, p95 {p95:.3f} ms'
+        ))
@@ -0,0 +1,75 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+
+SAMPLE_LEAD = {
+    'name': 'Jordan Smith',
+    'email': 'jordan.smith@example.com',
+    'phone': '555-201-3344',
+    'zip_code': '10001',
+    'state': 'NY',
+    'address': '12 Main St',
+}
+
+class Command(BaseCommand):
+    help = (
+        'Fires concurrent lead validation requests at one or more running servers and reports '
+        'throughput and latency, to compare the WSGI endpoint with the async one. Typical setup:\n'
+        '  python manage.py run_fake_ai_server --latency 1.0\n'
+        '  export OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:8999/v1/\n'
+        '  gunicorn insuraloop.wsgi -w 4 -b :8000\n'
+        '  uvicorn insuraloop.asgi:application --workers 4 --port 8001\n'
+        '  python manage.py bench_validation_concurrency '
+        'http://127.0.0.1:8000/api/validate-lead/ http://127.0.0.1:8001/api/v2/validate-lead/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Validation endpoints to benchmark')
+        parser.add_argument('--concurrency', default='10,50,200',
+                            help='Comma-separated numbers of simultaneous clients')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests sent at each concurrency level')
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        if options['requests'] <= 0 or min(levels) <= 0:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        body = json.dumps(SAMPLE_LEAD).encode()
+        for url in options['urls']:
+            self.stdout.write(url)
+            for level in levels:
+                self._run(url, body, level, options['requests'], options['timeout'])
+
+    def _request(self, url, body, timeout):
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return ok, time.perf_counter() - started
+
+    def _run(self, url, body, concurrency, total, timeout):
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: self._request(url, body, timeout), range(total)))
+        elapsed = time.monotonic() - started
+
+        timings = sorted(latency * 1000 for ok, latency in results if ok)
+        errors = sum(1 for ok, _ in results if not ok)
+        if not timings:
+            self.stdout.write(self.style.ERROR(f'  c={concurrency:<4} all {total} requests failed'))
+            return
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        self.stdout.write(self.style.SUCCESS(
+            f'  c={concurrency:<4} {len(timings) / elapsed:7.1f} req/s, '
+            f'p50 {statistics.median(timings):.0f} ms, p95 {p95:.0f} ms, errors {errors}'
+        ))
@@ -0,0 +1,64 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from lead_validation import validators
+from lead_validation.test_support import legacy_validators
+
+FIRST_NAMES = ['james', 'mary', 'robert', 'patricia', 'john', 'jennifer', 'michael', 'linda', 'david', 'susan']
+LAST_NAMES = ['garcia', 'miller', 'davis', 'lopez', 'wilson', 'moore', 'taylor', 'thomas', 'white', 'harris']
+DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'example.org', 'mailinator.com', 'site.xyz']
+STATES = ['CA', 'NY', 'TX', 'FL', 'IL']
+
+def synthetic_lead(rng):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return (
+        f"{first}.{last}{rng.randrange(100)}@{rng.choice(DOMAINS)}",
+        f"({rng.randrange(200, 999)}) {rng.randrange(200, 999)}-{rng.randrange(10000):04d}",
+        f"{first.title()} {last.title()}",
+        f"{rng.randrange(100000):05d}",
+        rng.choice(STATES),
+    )
+
+def validate_lead(module, lead):
+    """Every rule validator a lead goes through, as in validate_and_store_lead_data"""
+    email, phone, name, zip_code, state = lead
+    return (
+        module.validate_email_address(email),
+        module.validate_phone_number(phone),
+        module.validate_location(zip_code, state),
+        module.validate_name(name),
+        module.validate_cross_fields(email, phone, name, zip_code),
+    )
+
+class Command(BaseCommand):
+    help = 'Compares per-lead latency of the compiled rule validators with the original list-scanning ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leads', type=int, default=20000, help='Synthetic leads per round')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['leads'] <= 0 or options['rounds'] <= 0:
+            raise CommandError('--leads and --rounds must be positive')
+        rng = random.Random(options['seed'])
+        leads = [synthetic_lead(rng) for _ in range(options['leads'])]
+
+        # Warm up (tldextract loads its suffix list on first use) and check the outputs agree
+        for lead in leads[:1000]:
+            if validate_lead(validators, lead) != validate_lead(legacy_validators, lead):
+                raise CommandError(f'Compiled validators disagree with the original for {lead!r}')
+
+        results = {}
+        for name, module in [('original', legacy_validators), ('compiled', validators)]:
+            timings = []
+            for _ in range(options['rounds']):
+                started = time.perf_counter()
+                for lead in leads:
+                    validate_lead(module, lead)
+                timings.append((time.perf_counter() - started) / len(leads) * 1e6)
+            results[name] = statistics.median(timings)
+            self.stdout.write(f'{name:<9} {results[name]:8.2f} us/lead  ({1e6 / results[name]:,.0f} leads/s)')
+
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {results["original"] / results["compiled"]:.1f}x'))
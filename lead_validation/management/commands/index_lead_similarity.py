@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lead_capture.models import Lead
+from lead_validation.models import LeadSimilarityKey
+from lead_validation.near_duplicates import similarity_keys
+
+class Command(BaseCommand):
+    help = 'Builds near-duplicate bucket keys for existing leads in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Leads indexed per transaction')
+        parser.add_argument('--start-id', type=int, default=0,
+                            help='Resume after this lead ID')
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        indexed = 0
+        started = time.monotonic()
+
+        while True:
+            chunk = list(
+                Lead.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'name', 'email', 'zip_code', 'address')[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+
+            keys = []
+            for lead in chunk:
+                data = {'name': lead.name, 'email': lead.email, 'zip_code': lead.zip_code, 'address': lead.address}
+                keys += [LeadSimilarityKey(lead_id=lead.id, key=key) for key in similarity_keys(data)]
+            with transaction.atomic():
+                LeadSimilarityKey.objects.filter(lead_id__in=[lead.id for lead in chunk]).delete()
+                LeadSimilarityKey.objects.bulk_create(keys)
+
+            last_id = chunk[-1].id
+            indexed += len(chunk)
+            self.stdout.write(f'Indexed {indexed} leads (last ID {last_id})')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} leads in {elapsed:.1f}s'))
@@ -0,0 +1,62 @@
+import statistics
+from collections import Counter
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from lead_validation.models import ValidationLog
+
+class Command(BaseCommand):
+    help = ('Summarizes which tier (rule pre-screen or AI) decided recent validations, '
+            'the share of AI calls avoided and the latency saved')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Validations logged in the last N days')
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError('--days must be positive')
+        since = timezone.now() - timedelta(days=options['days'])
+        logs = ValidationLog.objects.filter(created_at__gte=since).values_list('details', flat=True)
+
+        reasons = Counter()
+        rules_ms = []
+        ai_ms = []
+        cache_hits = 0
+        untiered = 0
+        for details in logs.iterator(chunk_size=2000):
+            tier = (details or {}).get('tier')
+            if not tier:
+                untiered += 1  # validated before the pre-screen existed
+                continue
+            reasons[tier['reason'] or 'ambiguous'] += 1
+            rules_ms.append(tier['rules_ms'])
+            if tier['ai_ms'] is not None:
+                if details.get('ai_assessment', {}).get('cache', {}).get('status') == 'hit':
+                    cache_hits += 1
+                elif tier['reason'] is None:
+                    # Only answered calls say how long the model takes
+                    ai_ms.append(tier['ai_ms'])
+
+        total = sum(reasons.values())
+        self.stdout.write(f'{total} validations in the last {options["days"]} days'
+                          + (f' ({untiered} older-format logs skipped)' if untiered else ''))
+        if not total:
+            return
+        for reason, count in reasons.most_common():
+            self.stdout.write(f'  {reason:<15} {count:>8}  {count / total:6.1%}')
+
+        # Leads the AI was never asked about; ai_unavailable ones were asked and failed
+        avoided = total - reasons['ambiguous'] - reasons['ai_unavailable']
+        self.stdout.write(f'AI calls avoided by the pre-screen: {avoided} ({avoided / total:.1%})')
+        if cache_hits:
+            self.stdout.write(f'Ambiguous leads answered from the AI assessment cache: {cache_hits}')
+        self.stdout.write(f'Rule tier: median {statistics.median(rules_ms):.3f} ms per lead')
+        if ai_ms:
+            median_ai_ms = statistics.median(ai_ms)
+            saved = avoided * median_ai_ms - sum(rules_ms)
+            self.stdout.write(f'AI tier: median {median_ai_ms:.0f} ms per call over {len(ai_ms)} calls')
+            self.stdout.write(self.style.SUCCESS(
+                f'Estimated latency saved: {saved / 1000:,.1f}s in total, '
+                f'{saved / total:,.0f} ms per lead on average'))
+        else:
+            self.stdout.write('No answered AI calls in the period to estimate the latency saved')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from lead_validation.ai_cache import purge_expired
+from lead_validation.models import AIAssessmentCache
+
+class Command(BaseCommand):
+    help = 'Deletes expired cached AI assessments (or all of them with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Delete every cached assessment; running workers keep their in-memory copies '
+                                 'until they restart')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            deleted, _ = AIAssessmentCache.objects.all().delete()
+        else:
+            deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} cached AI assessments'))
@@ -0,0 +1,96 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from lead_capture.models import Lead
+from lead_validation.backfill import default_run_name, default_workers, revalidate, revalidation_queryset
+from lead_validation.models import RevalidationRun
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}; use YYYY-MM-DD')
+
+class Command(BaseCommand):
+    help = (
+        'Revalidates leads in a process pool, checkpointing progress so an interrupted run '
+        'resumes where it stopped. Rerunning with the same filters (or --run name) resumes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only leads created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only leads created on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--min-score', type=int, help='Only leads scored at least this')
+        parser.add_argument('--max-score', type=int, help='Only leads scored at most this')
+        parser.add_argument('--insurance-type', choices=[value for value, _ in Lead.INSURANCE_TYPE_CHOICES])
+        parser.add_argument('--unvalidated', action='store_true', help='Only leads that were never validated')
+        parser.add_argument('--workers', type=int,
+                            help='Worker processes (default: one per CPU, or 1 on SQLite, which allows one writer)')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Leads per task')
+        parser.add_argument('--ai-concurrency', type=int, default=4,
+                            help='Maximum AI calls in flight across all workers')
+        parser.add_argument('--refresh-ai', action='store_true',
+                            help='Ask the model again instead of reusing cached AI assessments')
+        parser.add_argument('--run', help='Checkpoint name (defaults to one derived from the filters)')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start over')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the matching leads')
+
+    def handle(self, *args, **options):
+        if options['workers'] is None:
+            options['workers'] = default_workers()
+        if options['workers'] < 1 or options['chunk_size'] < 1 or options['ai_concurrency'] < 1:
+            raise CommandError('--workers, --chunk-size and --ai-concurrency must be positive')
+
+        filters = {
+            key: options[key] for key in ('since', 'until', 'min_score', 'max_score', 'insurance_type')
+            if options[key] is not None
+        }
+        if options['unvalidated']:
+            filters['unvalidated'] = True
+        leads = revalidation_queryset(
+            since=parse_date(filters['since']) if 'since' in filters else None,
+            until=parse_date(filters['until']) if 'until' in filters else None,
+            min_score=filters.get('min_score'),
+            max_score=filters.get('max_score'),
+            insurance_type=filters.get('insurance_type'),
+            unvalidated=filters.get('unvalidated', False),
+        )
+
+        name = options['run'] or default_run_name(filters)
+        run, created = RevalidationRun.objects.get_or_create(name=name, defaults={'filters': filters})
+        if not created and run.filters != filters:
+            raise CommandError(f'Run {name} was started with different filters: {run.filters}')
+        if options['restart'] and not created:
+            run.last_lead_id = run.processed = run.failed = 0
+            run.completed_at = None
+            run.save()
+        elif run.completed_at:
+            self.stdout.write(f'Run {name} already completed ({run.processed} leads); use --restart to run it again')
+            return
+        elif run.last_lead_id:
+            self.stdout.write(f'Resuming run {name} after lead {run.last_lead_id} ({run.processed} done so far)')
+
+        remaining = leads.filter(id__gt=run.last_lead_id).count()
+        self.stdout.write(f'{remaining} leads to revalidate (run {name})')
+        if options['dry_run'] or not remaining:
+            return
+
+        self.last_report = 0.0
+
+        def report(run, processed, elapsed):
+            if elapsed - self.last_report < 5 and processed < remaining:
+                return
+            self.last_report = elapsed
+            rate = processed / elapsed if elapsed else 0
+            eta = (remaining - processed) / rate if rate else 0
+            self.stdout.write(
+                f'{processed}/{remaining} leads ({rate:.1f}/s, ETA {eta:.0f}s), '
+                f'{run.failed} failed, checkpoint at lead {run.last_lead_id}'
+            )
+
+        try:
+            processed = revalidate(run, leads, workers=options['workers'], chunk_size=options['chunk_size'],
+                                   ai_concurrency=options['ai_concurrency'], on_progress=report,
+                                   refresh_ai=options['refresh_ai'])
+        except KeyboardInterrupt:
+            raise CommandError(f'Interrupted at lead {run.last_lead_id}; rerun the same command to resume')
+        self.stdout.write(self.style.SUCCESS(f'Revalidated {processed} leads ({run.failed} failed in total)'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from lead_validation.fake_ai_server import FakeAIServer
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local OpenAI-compatible chat completions server that answers every lead '
+        'with a canned assessment after a fixed latency, optionally failing a share of requests. '
+        'Point OPENAI_BASE_URL at it (and set any OPENAI_API_KEY) to load test validation, '
+        'or exercise the AI client timeouts and circuit breaker, without calling the real API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8999)
+        parser.add_argument('--latency', type=float, default=1.0,
+                            help='Seconds each completion takes')
+        parser.add_argument('--jitter', type=float, default=0.0,
+                            help='Up to this many extra seconds, chosen at random per request')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of requests (0-1) answered with --error-status')
+        parser.add_argument('--error-status', type=int, default=500)
+        parser.add_argument('--seed', type=int, help='Seed for the jitter and error injection')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] <= 1:
+            raise CommandError('--error-rate must be between 0 and 1')
+        server = FakeAIServer((options['host'], options['port']), latency=options['latency'],
+                              jitter=options['jitter'], error_rate=options['error_rate'],
+                              error_status=options['error_status'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake AI server on {server.base_url} ({options["latency"]}s latency, '
+            f'+{options["jitter"]}s jitter, {options["error_rate"]:.0%} errors). '
+            f'Use OPENAI_BASE_URL={server.base_url}'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Served {server.requests_served} completions ({server.errors_served} failed) '
+                              f'over {server.connections} connections')
@@ -0,0 +1,102 @@
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from lead_validation.ai_batch import disable_ai_batching, enable_ai_batching, get_ai_batch_settings
+from lead_validation.queue import (
+    complete_job, fail_job, lease_jobs, run_validation_job, sweep_unvalidated_leads,
+)
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Runs a bounded pool of workers that process queued lead validation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Maximum number of jobs processed concurrently')
+        parser.add_argument('--visibility-timeout', type=int, default=300,
+                            help='Seconds a leased job stays invisible before another worker may retry it')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--sweep-interval', type=int, default=300,
+                            help='Seconds between sweeps for leads that were never validated (0 disables)')
+        parser.add_argument('--sweep-grace', type=int, default=600,
+                            help='Only sweep leads older than this many seconds')
+        parser.add_argument('--ai-batch-size', type=int, default=get_ai_batch_settings()['MAX_SIZE'],
+                            help='Leads per AI request, gathered from concurrent jobs (1 disables batching)')
+        parser.add_argument('--ai-linger', type=float, default=get_ai_batch_settings()['LINGER'],
+                            help='Seconds a job waits for others to fill its AI batch')
+        parser.add_argument('--once', action='store_true',
+                            help='Process everything that is ready, then exit')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        self.stdout.write(self.style.SUCCESS(f'Starting {workers} validation workers'))
+        if options['ai_batch_size'] > 1 and workers > 1:
+            enable_ai_batching(max_size=options['ai_batch_size'], linger=options['ai_linger'])
+
+        in_flight = set()
+        in_flight_lock = threading.Lock()
+        processed = 0
+        last_sweep = 0
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='validation-worker') as pool:
+            while not self.stopping.is_set():
+                if options['sweep_interval'] and time.monotonic() - last_sweep >= options['sweep_interval']:
+                    last_sweep = time.monotonic()
+                    try:
+                        sweep_unvalidated_leads(grace_seconds=options['sweep_grace'])
+                    except Exception as e:
+                        logger.error(f"Error sweeping unvalidated leads: {str(e)}")
+
+                with in_flight_lock:
+                    free_slots = workers - len(in_flight)
+
+                jobs = lease_jobs(free_slots, options['visibility_timeout']) if free_slots else []
+                for job in jobs:
+                    future = pool.submit(self._process, job)
+                    with in_flight_lock:
+                        in_flight.add(future)
+                    future.add_done_callback(lambda f: self._discard(in_flight, in_flight_lock, f))
+                processed += len(jobs)
+
+                if not jobs:
+                    with in_flight_lock:
+                        idle = not in_flight
+                    if options['once'] and idle:
+                        break
+                    self.stopping.wait(options['poll_interval'])
+
+        # Leaving the executor block waits for in-flight jobs to finish
+        disable_ai_batching()
+        connection.close()
+        self.stdout.write(self.style.SUCCESS(f'Validation workers stopped after leasing {processed} jobs'))
+
+    def _request_stop(self, signum, frame):
+        self.stdout.write('Stopping after in-flight jobs finish...')
+        self.stopping.set()
+
+    @staticmethod
+    def _discard(in_flight, lock, future):
+        with lock:
+            in_flight.discard(future)
+
+    def _process(self, job):
+        close_old_connections()
+        try:
+            run_validation_job(job)
+        except Exception as e:
+            fail_job(job, e)
+        else:
+            complete_job(job)
+        finally:
+            # Each pool thread owns a connection; don't leak it between jobs
+            connection.close()
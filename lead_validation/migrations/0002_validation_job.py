@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_capture', '0001_initial'),
+        ('lead_validation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValidationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.PositiveSmallIntegerField(choices=[(0, 'Live submission'), (5, 'Retry'), (10, 'Backfill')], default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('leased', 'Leased'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('available_at', models.DateTimeField(help_text='Job is not leased before this time (used for backoff)')),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('lease_token', models.CharField(blank=True, db_index=True, default='', max_length=64)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='validation_jobs', to='lead_capture.lead')),
+            ],
+            options={
+                'ordering': ['priority', 'available_at'],
+                'indexes': [models.Index(fields=['status', 'priority', 'available_at'], name='validation_job_ready_idx'), models.Index(fields=['status', 'leased_until'], name='validation_job_lease_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_capture', '0003_lead_identity_keys'),
+        ('lead_validation', '0002_validation_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadSimilarityKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=64)),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_keys', to='lead_capture.lead')),
+            ],
+        ),
+    ]
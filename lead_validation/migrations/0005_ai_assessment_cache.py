@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lead_validation', '0004_revalidation_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIAssessmentCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('assessment', models.JSONField(default=dict)),
+                ('model', models.CharField(max_length=50)),
+                ('prompt_version', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -62,4 +62,96 @@ class ValidationLog(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"Validation for Lead {self.lead.id}: Score {self.score}" 
\ No newline at end of file
+        return f"Validation for Lead {self.lead.id}: Score {self.score}" 
+
+class ValidationJob(models.Model):
+    """Durable queue entry for validating a lead in a background worker"""
+    # Lower numbers are leased first, so live submissions jump ahead of backfills
+    PRIORITY_LIVE = 0
+    PRIORITY_RETRY = 5
+    PRIORITY_BACKFILL = 10
+    PRIORITY_CHOICES = [
+        (PRIORITY_LIVE, 'Live submission'),
+        (PRIORITY_RETRY, 'Retry'),
+        (PRIORITY_BACKFILL, 'Backfill'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_LEASED = 'leased'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_LEASED, 'Leased'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='validation_jobs')
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_LIVE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    # Retry tracking
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    available_at = models.DateTimeField(help_text="Job is not leased before this time (used for backoff)")
+    last_error = models.TextField(blank=True, default='')
+
+    # Lease held by a worker; an expired lease makes the job visible again
+    lease_token = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    leased_until = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['priority', 'available_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'available_at'], name='validation_job_ready_idx'),
+            models.Index(fields=['status', 'leased_until'], name='validation_job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"Validation job {self.id} for Lead {self.lead_id} ({self.status})"
+
+
+class LeadSimilarityKey(models.Model):
+    """LSH/blocking bucket key for near-duplicate candidate lookup (see near_duplicates.py)"""
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='similarity_keys')
+    key = models.CharField(max_length=64, db_index=True)
+
+    def __str__(self):
+        return f"{self.key} -> Lead {self.lead_id}"
+
+
+class RevalidationRun(models.Model):
+    """Checkpoint of a revalidate_leads backfill, so an interrupted run resumes instead of starting over"""
+    name = models.CharField(max_length=100, unique=True)
+    filters = JSONField(default=dict, blank=True)
+
+    # Every matching lead with an ID up to this one has been revalidated
+    last_lead_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        state = 'complete' if self.completed_at else f'at lead {self.last_lead_id}'
+        return f"Revalidation {self.name} ({self.processed} leads, {state})"
+
+
+class AIAssessmentCache(models.Model):
+    """AI assessment shared by every worker, keyed by a hash of the prompt fields, model and prompt version"""
+    key = models.CharField(max_length=64, unique=True)
+    assessment = JSONField(default=dict)
+    model = models.CharField(max_length=50)
+    prompt_version = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"AI assessment {self.key[:12]} ({self.model}, prompt v{self.prompt_version})"
@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import random
+import re
+from django.db import transaction
+from django.db.models import Count
+from fuzzywuzzy import fuzz
+from lead_capture.identity import normalize_email, normalize_zip
+from .models import LeadSimilarityKey
+
+logger = logging.getLogger(__name__)
+
+# MinHash uses universal hashing (a*x + b) mod p over a stable 64-bit hash of
+# each shingle, so signatures are identical across processes and restarts.
+_PRIME = (1 << 61) - 1
+_MAX_PERMUTATIONS = 64
+_rng = random.Random(20250308)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_MAX_PERMUTATIONS)]
+
+# (bands, rows per band, shingle size) per field. More bands / fewer rows
+# catch lower similarities at the cost of more candidates.
+NAME_LSH = (10, 2, 3)
+EMAIL_LSH = (12, 3, 2)
+ADDRESS_LSH = (10, 2, 3)
+
+# Only the leads sharing the most buckets are scored with fuzzy matching
+MAX_CANDIDATES = 50
+
+# Minimum confidence reported as a near-duplicate
+MIN_CONFIDENCE = 40
+
+_NON_ALNUM = re.compile(r'[^a-z0-9 ]')
+
+def _clean(text):
+    return ' '.join(_NON_ALNUM.sub(' ', (text or '').casefold()).split())
+
+def _shingles(text, size):
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def _stable_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+def minhash_signature(shingles, num_permutations):
+    """MinHash signature of a shingle set"""
+    hashes = [_stable_hash(shingle) for shingle in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS[:num_permutations]]
+
+def _band_keys(prefix, text, lsh):
+    bands, rows, shingle_size = lsh
+    shingles = _shingles(text, shingle_size)
+    if not shingles:
+        return []
+    signature = minhash_signature(shingles, bands * rows)
+    keys = []
+    for band in range(bands):
+        chunk = ','.join(str(value) for value in signature[band * rows:(band + 1) * rows])
+        digest = hashlib.blake2b(chunk.encode(), digest_size=8).hexdigest()
+        keys.append(f"{prefix}:{band}:{digest}")
+    return keys
+
+def _email_parts(email):
+    normalized = normalize_email(email)
+    if '@' not in normalized:
+        return '', ''
+    local, domain = normalized.split('@', 1)
+    return re.sub(r'[^a-z0-9]', '', local), domain
+
+def similarity_keys(lead_data):
+    """
+    Bucket keys for a lead.
+
+    Name and address buckets are blocked by 5-digit ZIP so "Jon Smith" and
+    "John Smith" collide only when they live in the same area. Email buckets
+    are blocked by domain, plus a sorted-letters key that catches
+    transposed characters ("jonhsmith" vs "johnsmith").
+    """
+    keys = []
+    zip5 = normalize_zip(lead_data.get('zip_code'))
+
+    name = _clean(lead_data.get('name'))
+    if name and zip5:
+        keys += _band_keys(f"n:{zip5}", name, NAME_LSH)
+
+    address = _clean(lead_data.get('address'))
+    if address and zip5:
+        keys += _band_keys(f"a:{zip5}", address, ADDRESS_LSH)
+
+    local, domain = _email_parts(lead_data.get('email'))
+    if len(local) >= 4:
+        domain_hash = hashlib.blake2b(domain.encode(), digest_size=4).hexdigest()
+        keys += _band_keys(f"e:{domain_hash}", local, EMAIL_LSH)
+        sorted_local = hashlib.blake2b(''.join(sorted(local)).encode(), digest_size=8).hexdigest()
+        keys.append(f"es:{domain_hash}:{sorted_local}")
+
+    return keys
+
+def index_lead(lead, replace=True):
+    """
+    Store the bucket keys for a saved lead. Leads are indexed when they are
+    created (lead_capture.services.submit_lead, ingest.BulkIngest), so later
+    submissions find them; pass replace=False there, as a lead created in the
+    current transaction has no keys to delete yet.
+    """
+    keys = [
+        LeadSimilarityKey(lead_id=lead.id, key=key)
+        for key in similarity_keys({
+            'name': lead.name,
+            'email': lead.email,
+            'zip_code': lead.zip_code,
+            'address': lead.address,
+        })
+    ]
+    if not replace:
+        LeadSimilarityKey.objects.bulk_create(keys)
+        return len(keys)
+    with transaction.atomic():
+        LeadSimilarityKey.objects.filter(lead_id=lead.id).delete()
+        LeadSimilarityKey.objects.bulk_create(keys)
+    return len(keys)
+
+def _score(lead_data, candidate):
+    """Confidence (0-100) and matching fields for one candidate"""
+    zip_match = bool(normalize_zip(lead_data.get('zip_code'))) and \
+        normalize_zip(lead_data.get('zip_code')) == normalize_zip(candidate.zip_code)
+    name_sim = fuzz.token_sort_ratio(_clean(lead_data.get('name')), _clean(candidate.name))
+
+    local, domain = _email_parts(lead_data.get('email'))
+    cand_local, cand_domain = _email_parts(candidate.email)
+    email_sim = fuzz.ratio(local, cand_local) if local and cand_local and domain == cand_domain else 0
+
+    address = _clean(lead_data.get('address'))
+    address_sim = fuzz.token_set_ratio(address, _clean(candidate.address)) if address and candidate.address else 0
+
+    confidence = 0
+    fields = []
+    if zip_match and name_sim >= 88:
+        confidence = 80 if address_sim >= 85 else 70
+        fields = ['name', 'zip_code'] + (['address'] if address_sim >= 85 else [])
+    if email_sim >= 88:
+        email_confidence = 80 if name_sim >= 80 else 65
+        if email_confidence > confidence:
+            confidence = email_confidence
+            fields = ['email'] + (['name'] if name_sim >= 80 else [])
+    if not confidence and zip_match and address_sim >= 90:
+        confidence = 50
+        fields = ['address', 'zip_code']
+
+    return confidence, fields, {'name': name_sim, 'email': email_sim, 'address': address_sim}
+
+NO_NEAR_DUPLICATE = (False, 0, [], [], {})
+
+def _candidate_ids_query(keys, exclude_id):
+    """IDs of the leads sharing the most buckets with `keys`"""
+    buckets = LeadSimilarityKey.objects.filter(key__in=keys)
+    if exclude_id:
+        buckets = buckets.exclude(lead_id=exclude_id)
+    return (
+        buckets.values('lead_id').annotate(shared=Count('id'))
+        .order_by('-shared', '-lead_id').values_list('lead_id', flat=True)[:MAX_CANDIDATES]
+    )
+
+def _candidates_query(candidate_ids):
+    from lead_capture.models import Lead
+    return Lead.objects.filter(id__in=candidate_ids).only('id', 'name', 'email', 'zip_code', 'address')
+
+def _best_match(lead_data, candidates):
+    best_confidence, best_fields, best_similarity, matching_ids = 0, [], {}, []
+    for candidate in candidates:
+        confidence, fields, similarity = _score(lead_data, candidate)
+        if confidence < MIN_CONFIDENCE:
+            continue
+        if confidence > best_confidence:
+            best_confidence, best_fields, best_similarity, matching_ids = confidence, fields, similarity, [candidate.id]
+        elif confidence == best_confidence:
+            matching_ids.append(candidate.id)
+
+    if not matching_ids:
+        return NO_NEAR_DUPLICATE
+
+    logger.info(f"Near-duplicate match ({best_confidence}%) on {best_fields}: {sorted(matching_ids)}")
+    return True, best_confidence, sorted(matching_ids), best_fields, best_similarity
+
+def find_near_duplicates(lead_data, exclude_id=None):
+    """
+    Look for near-duplicate leads (typos, nicknames, reformatted addresses).
+    Returns (is_duplicate, confidence, matching_lead_ids, matching_fields, similarity)
+    where confidence is capped at 80 so exact identity matches always rank higher.
+    """
+    keys = similarity_keys(lead_data)
+    if not keys:
+        return NO_NEAR_DUPLICATE
+
+    candidate_ids = list(_candidate_ids_query(keys, exclude_id))
+    if not candidate_ids:
+        return NO_NEAR_DUPLICATE
+    return _best_match(lead_data, _candidates_query(candidate_ids))
@@ -0,0 +1,247 @@
+"""
+Rule-based pre-screen tier in front of the AI assessment.
+
+The validators in validators.py run first (microseconds per lead) and
+their findings add up to a rule risk score. Leads the rules settle on their
+own - obvious fakes and high-confidence duplicates, whose score the
+duplicate penalty caps anyway - never reach the AI. A lead with no rule
+findings is not clear-cut (the rules cannot see what the model checks), so
+it is only settled as low risk when ACCEPT_RISK is opted into. If the AI call fails, the rule score is
+used, capped at the neutral 50 the old fallback gave.
+
+validate_and_store_lead_data records the deciding tier under
+validation_results['tier']; manage.py prescreen_report summarizes the AI
+calls avoided and the latency saved.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from . import validators
+
+DEFAULT_PRESCREEN_SETTINGS = {
+    'ENABLED': True,
+    'REJECT_RISK': 80,           # Rule risk at or above this settles the lead as high risk
+    'ACCEPT_RISK': None,         # Rule risk at or below this settles it as low risk (None: never)
+    'DUPLICATE_CONFIDENCE': 80,  # Duplicates above this confidence skip the AI
+}
+
+# Every lead starts here: the rules cannot rule out what only the model checks.
+# An ACCEPT_RISK at or above it settles every lead without findings.
+BASE_RISK = 10
+
+# Risk points per finding. A hard finding alone reaches REJECT_RISK; the
+# softer ones only settle a lead when several coincide.
+HARD = 70
+SOFT = 35
+RULE_RISK_POINTS = {
+    'email_missing': 60,
+    'email_invalid': HARD,
+    'email_disposable': HARD,
+    'email_pattern': SOFT,
+    'email_high_risk_tld': 20,
+    'email_suspicious': 10,
+    'phone_missing': 60,
+    'phone_invalid': HARD,
+    'phone_fake': HARD,
+    'phone_pattern': SOFT,
+    'phone_high_risk_area_code': 10,
+    'phone_voip': 10,
+    'name_invalid': 30,
+    'name_fake': HARD,
+    'name_celebrity': HARD,
+    'name_pattern': SOFT,
+    'location_invalid': 30,
+    'location_state_mismatch': 30,
+    'location_high_risk_zip': 10,
+    'cross_field_mismatch': 10,
+}
+
+# Decided by the rules: why the AI was not asked
+CLEAR_REJECT = 'clear_reject'
+CLEAR_ACCEPT = 'clear_accept'
+DUPLICATE = 'duplicate'
+AI_UNAVAILABLE = 'ai_unavailable'
+
+Prescreen = namedtuple('Prescreen', 'results risk_score findings decision elapsed_ms')
+
+
+def get_prescreen_settings():
+    """Merge LEAD_PRESCREEN from settings over the defaults"""
+    options = dict(DEFAULT_PRESCREEN_SETTINGS)
+    options.update(getattr(settings, 'LEAD_PRESCREEN', {}))
+    return options
+
+
+def _findings(results, email_given, phone_given):
+    """Names of the RULE_RISK_POINTS findings present in the validator results"""
+    email, phone, name = results['email'], results['phone'], results['name']
+    location, cross_field = results['location'], results['cross_field']
+    found = []
+    if not email['format_valid']:
+        found.append('email_invalid' if email_given else 'email_missing')
+    if email['disposable']:
+        found.append('email_disposable')
+    if email['suspicious_pattern']:
+        found.append('email_pattern')
+    if email['high_risk_tld']:
+        found.append('email_high_risk_tld')
+    elif email.get('suspicious'):
+        found.append('email_suspicious')
+
+    if not phone['format_valid']:
+        found.append('phone_invalid' if phone_given else 'phone_missing')
+    elif "Obviously fake phone number pattern" in phone['details']:
+        found.append('phone_fake')
+    elif phone['suspicious_pattern']:
+        found.append('phone_pattern')
+    if phone['high_risk_area_code']:
+        found.append('phone_high_risk_area_code')
+    if phone['voip_number']:
+        found.append('phone_voip')
+
+    if not name['format_valid']:
+        found.append('name_invalid')
+    if name['fake_name']:
+        found.append('name_fake')
+    if name['celebrity_name']:
+        found.append('name_celebrity')
+    if name['suspicious_pattern']:
+        found.append('name_pattern')
+
+    if not location['format_valid']:
+        found.append('location_invalid')
+    if location['state_mismatch']:
+        found.append('location_state_mismatch')
+    if location['high_risk_zip']:
+        found.append('location_high_risk_zip')
+
+    if not cross_field['consistent']:
+        found.append('cross_field_mismatch')
+    return found
+
+
+def screen_lead(lead_data):
+    """Run the rule validators on a lead and decide 'reject', 'accept' or 'ambiguous'"""
+    started = time.perf_counter()
+    email = lead_data.get('email') or ''
+    phone = lead_data.get('phone') or ''
+    name = lead_data.get('name') or ''
+    zip_code = lead_data.get('zip_code') or ''
+    results = {
+        'email': validators.validate_email_address(email),
+        'phone': validators.validate_phone_number(phone),
+        'location': validators.validate_location(zip_code, lead_data.get('state') or None),
+        'name': validators.validate_name(name),
+        'cross_field': validators.validate_cross_fields(email, phone, name, zip_code),
+    }
+    findings = _findings(results, bool(email), bool(phone))
+    risk_score = min(100, BASE_RISK + sum(RULE_RISK_POINTS[finding] for finding in findings))
+
+    options = get_prescreen_settings()
+    if risk_score >= options['REJECT_RISK']:
+        decision = 'reject'
+    elif options['ACCEPT_RISK'] is not None and risk_score <= options['ACCEPT_RISK']:
+        decision = 'accept'
+    else:
+        decision = 'ambiguous'
+    return Prescreen(results, risk_score, findings, decision, (time.perf_counter() - started) * 1000)
+
+
+def settle_reason(prescreen, is_duplicate, dup_confidence):
+    """Why the rules settle this lead without the AI, or None to ask the AI"""
+    options = get_prescreen_settings()
+    if not options['ENABLED']:
+        return None
+    if prescreen.decision == 'reject':
+        return CLEAR_REJECT
+    if is_duplicate and dup_confidence > options['DUPLICATE_CONFIDENCE']:
+        return DUPLICATE
+    if prescreen.decision == 'accept':
+        return CLEAR_ACCEPT
+    return None
+
+
+def rule_assessment(prescreen):
+    """The rule tier's verdict, in the same shape as the AI assessment"""
+    if prescreen.risk_score >= 70:
+        assessment = 'high_risk'
+    elif prescreen.risk_score >= 40:
+        assessment = 'medium_risk'
+    else:
+        assessment = 'low_risk'
+    issues = []
+    for field in ('email', 'phone', 'name', 'location'):
+        issues.extend(detail for detail in prescreen.results[field]['details'] if detail not in issues)
+    issues.extend(prescreen.results['cross_field']['issues'])
+    return {
+        'risk_score': prescreen.risk_score,
+        'assessment': assessment,
+        'decision': prescreen.decision,
+        'findings': prescreen.findings,
+        'issues': issues,
+    }
+
+
+class _Stats:
+    """Tier decisions and time spent in each tier, for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {'leads': 0, 'ai_calls': 0, CLEAR_REJECT: 0, CLEAR_ACCEPT: 0, DUPLICATE: 0,
+                           AI_UNAVAILABLE: 0}
+            self.rules_ms = 0.0
+            self.ai_ms = 0.0
+
+    def add(self, reason, rules_ms, ai_ms):
+        with self._lock:
+            self.counts['leads'] += 1
+            if ai_ms is not None:
+                self.counts['ai_calls'] += 1
+                self.ai_ms += ai_ms
+            if reason:
+                self.counts[reason] += 1
+            self.rules_ms += rules_ms
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+            rules_ms, ai_ms = self.rules_ms, self.ai_ms
+        avoided = counts['leads'] - counts['ai_calls']
+        mean_ai_ms = ai_ms / counts['ai_calls'] if counts['ai_calls'] else 0.0
+        counts.update({
+            'ai_calls_avoided': avoided,
+            'avoided_share': avoided / counts['leads'] if counts['leads'] else 0.0,
+            'mean_rules_ms': rules_ms / counts['leads'] if counts['leads'] else 0.0,
+            'mean_ai_ms': mean_ai_ms,
+            'estimated_ms_saved': avoided * mean_ai_ms,
+        })
+        return counts
+
+_stats = _Stats()
+
+
+def record_tier(prescreen, reason, ai_ms=None):
+    """Count the decision and return validation_results['tier'] for it"""
+    _stats.add(reason, prescreen.elapsed_ms, ai_ms)
+    return {
+        'decided_by': 'ai' if reason is None else 'rules',
+        'reason': reason,
+        'rules_ms': round(prescreen.elapsed_ms, 3),
+        'ai_ms': round(ai_ms, 1) if ai_ms is not None else None,
+    }
+
+
+def prescreen_stats():
+    """Tier counters for this process since start or reset (see _Stats.snapshot)"""
+    return _stats.snapshot()
+
+
+def reset_prescreen_stats():
+    _stats.reset()
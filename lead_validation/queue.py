@@ -0,0 +1,183 @@
+import logging
+import random
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .ai_validator import AI_NOT_CONFIGURED
+from .models import ValidationJob
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (ValidationJob.STATUS_PENDING, ValidationJob.STATUS_LEASED)
+
+# Retry backoff: base * 2^(attempt-1) seconds, capped, with a little jitter
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+def enqueue_validation(lead_id, priority=ValidationJob.PRIORITY_LIVE, check_existing=True):
+    """
+    Queue a lead for validation by the worker pool.
+    Returns the job, reusing an open job for the same lead if one exists.
+    Pass check_existing=False for a lead created in the current transaction,
+    which cannot have a job yet; the job is then a single INSERT.
+    """
+    if not check_existing:
+        return ValidationJob.objects.create(lead_id=lead_id, priority=priority, available_at=timezone.now())
+
+    with transaction.atomic():
+        existing = ValidationJob.objects.filter(lead_id=lead_id, status__in=OPEN_STATUSES).first()
+        if existing:
+            # A live resubmission should not wait behind a queued backfill
+            if priority < existing.priority and existing.status == ValidationJob.STATUS_PENDING:
+                ValidationJob.objects.filter(pk=existing.pk).update(priority=priority)
+                existing.priority = priority
+            return existing
+
+        return ValidationJob.objects.create(
+            lead_id=lead_id,
+            priority=priority,
+            available_at=timezone.now(),
+        )
+
+def enqueue_validations(lead_ids, priority=ValidationJob.PRIORITY_BACKFILL):
+    """Queue many leads at once, skipping leads that already have an open job"""
+    lead_ids = list(lead_ids)
+    if not lead_ids:
+        return 0
+
+    already_queued = set(
+        ValidationJob.objects.filter(lead_id__in=lead_ids, status__in=OPEN_STATUSES)
+        .values_list('lead_id', flat=True)
+    )
+    now = timezone.now()
+    jobs = [
+        ValidationJob(lead_id=lead_id, priority=priority, available_at=now)
+        for lead_id in lead_ids if lead_id not in already_queued
+    ]
+    ValidationJob.objects.bulk_create(jobs)
+    return len(jobs)
+
+def lease_jobs(limit, visibility_timeout=300):
+    """
+    Lease up to `limit` ready jobs, highest priority first.
+
+    A job is ready when it is pending and its backoff has elapsed, or when a
+    previous lease expired (the worker died or hung). Leasing is a single
+    conditional UPDATE tagged with a fresh token, so two workers can never
+    lease the same job even without SELECT ... FOR UPDATE.
+    """
+    now = timezone.now()
+    expired = Q(status=ValidationJob.STATUS_LEASED, leased_until__lt=now)
+
+    # Every lease counts as an attempt, so a job that keeps crashing or hanging
+    # its worker gives up like one that keeps raising
+    gave_up = ValidationJob.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+        status=ValidationJob.STATUS_FAILED,
+        leased_until=None,
+        last_error='Lease expired on the last attempt',
+    )
+    if gave_up:
+        logger.error(f"{gave_up} validation jobs failed permanently after their last lease expired")
+
+    ready = (
+        Q(status=ValidationJob.STATUS_PENDING, available_at__lte=now) |
+        (expired & Q(attempts__lt=F('max_attempts')))
+    )
+    candidate_ids = list(
+        ValidationJob.objects.filter(ready)
+        .order_by('priority', 'available_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not candidate_ids:
+        return []
+
+    token = uuid.uuid4().hex
+    ValidationJob.objects.filter(ready, id__in=candidate_ids).update(
+        status=ValidationJob.STATUS_LEASED,
+        lease_token=token,
+        leased_until=now + timedelta(seconds=visibility_timeout),
+        attempts=F('attempts') + 1,
+    )
+    return list(
+        ValidationJob.objects.filter(lease_token=token, status=ValidationJob.STATUS_LEASED)
+        .order_by('priority', 'available_at', 'id')
+    )
+
+def complete_job(job):
+    """Mark a leased job as done (ignored if the lease was lost to another worker)"""
+    return ValidationJob.objects.filter(pk=job.pk, lease_token=job.lease_token).update(
+        status=ValidationJob.STATUS_DONE,
+        completed_at=timezone.now(),
+        leased_until=None,
+        last_error='',
+    )
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt"""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay + random.uniform(0, delay * 0.1)
+
+def fail_job(job, error):
+    """Record a failed attempt and schedule a retry, or give up after max_attempts"""
+    if job.attempts >= job.max_attempts:
+        logger.error(f"Validation job {job.pk} for lead {job.lead_id} failed permanently: {error}")
+        return ValidationJob.objects.filter(pk=job.pk, lease_token=job.lease_token).update(
+            status=ValidationJob.STATUS_FAILED,
+            leased_until=None,
+            last_error=str(error),
+        )
+
+    delay = retry_delay(job.attempts)
+    logger.warning(f"Validation job {job.pk} for lead {job.lead_id} failed (attempt {job.attempts}), retrying in {delay:.0f}s: {error}")
+    return ValidationJob.objects.filter(pk=job.pk, lease_token=job.lease_token).update(
+        status=ValidationJob.STATUS_PENDING,
+        priority=max(job.priority, ValidationJob.PRIORITY_RETRY),
+        available_at=timezone.now() + timedelta(seconds=delay),
+        leased_until=None,
+        last_error=str(error),
+    )
+
+def sweep_unvalidated_leads(grace_seconds=600, limit=1000):
+    """
+    Re-enqueue leads that were never validated (validation_timestamp is null)
+    and have no open job - e.g. leads submitted while the old in-process
+    threads were killed by a deploy.
+    """
+    from lead_capture.models import Lead
+
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    lead_ids = list(
+        Lead.objects.filter(validation_timestamp__isnull=True, created_at__lt=cutoff)
+        .exclude(validation_jobs__status__in=OPEN_STATUSES)
+        .order_by('id')
+        .values_list('id', flat=True)[:limit]
+    )
+    queued = enqueue_validations(lead_ids, priority=ValidationJob.PRIORITY_BACKFILL)
+    if queued:
+        logger.info(f"Sweeper re-enqueued {queued} unvalidated leads")
+    return queued
+
+class ValidationFailed(Exception):
+    """The lead was scored, but without its AI assessment or without being stored"""
+
+
+def run_validation_job(job):
+    """
+    Validate the lead for a leased job. Raises on failure so the caller can
+    retry - also when the AI call failed and the lead only got the rule
+    tier's fallback score, which a later attempt can improve on.
+    """
+    from lead_capture.models import Lead
+    from .utils import validate_and_store_lead_data
+
+    lead = Lead.objects.get(id=job.lead_id)
+    logger.info(f"Running validation job {job.pk} for lead {lead.id} (insurance type: {lead.insurance_type})")
+    result = validate_and_store_lead_data(lead)
+    ai_error = result['validation_results'].get('ai_assessment', {}).get('error')
+    # Without an API key, retrying cannot get a better score
+    error = result.get('error') or (ai_error if ai_error != AI_NOT_CONFIGURED else None)
+    if error:
+        raise ValidationFailed(error)
+    return result
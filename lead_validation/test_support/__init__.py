@@ -0,0 +1,4 @@
+"""
+Reference code for the tests and benchmarks; not part of the app and never
+imported by it.
+"""
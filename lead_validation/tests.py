@@ -0,0 +1,796 @@
+import json
+import random
+import socket
+import string
+import struct
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+import openai
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from lead_capture.models import Lead
+from lead_capture.services import submit_lead
+from lead_validation import ai_batch, ai_cache, ai_client, ai_validator, batch, prescreen, validators
+from lead_validation.backfill import Watermark, default_workers, revalidate
+from lead_validation.fake_ai_server import start_fake_ai_server
+from lead_validation.ingest import BulkIngest, IngestError
+from lead_validation.models import AIAssessmentCache, LeadSimilarityKey, RevalidationRun, ValidationJob, ValidationLog
+from lead_validation.near_duplicates import NO_NEAR_DUPLICATE, find_near_duplicates, similarity_keys
+from lead_validation.queue import (
+    ValidationFailed, complete_job, enqueue_validation, fail_job, lease_jobs, run_validation_job,
+)
+from lead_validation.test_support import legacy_validators
+from lead_validation.utils import avalidate_and_store_lead_data, validate_and_store_lead_data, validate_and_store_leads
+from referral_system.models import AgentStats, PaymentRate, ReferralLink
+from referral_system.rates import invalidate_rate_table
+from referral_system.stats import reconcile_stats
+
+EMAILS = [
+    '', 'plain', 'a@b', 'james.garcia12@gmail.com', 'JAMES.GARCIA@Gmail.COM', 'qwerty@gmail.com',
+    'abc@yahoo.com', 'x9876y@outlook.com', 'aaaaaa@mailinator.com', 'ababab@site.xyz', 'jo@top.top',
+    'user@TEMPMAIL.COM', 'mary.smith@co.uk', 'jsmith@mail.example.co.uk', 'bad@@x.com', 'a@b@c.com',
+    '"quoted@user"@example.com', 'user@[127.0.0.1]', 'user@[999.1.1.1]', 'user@localhost.com',
+    'josé@exämple.com', 'user@xn--exmple-cua.com', 'a' * 310 + '@example.com', ' spaced@example.com',
+    'dot.@example.com', 'user@-bad.com', 'Ab1@Ab1.Ab1', 'zyx@zyx.zyx', 'k@l.m',
+]
+PHONES = [
+    '', '1234567890', '(415) 555-0134', '+1 212 555 0199', '1-800-555-0000', '21255501999',
+    '2125550199x', '5555555555', '0987654321', '456-789-0123', '700 111 2233', '12345', '٣٣٣٣٣٣٣٣٣٣',
+    '1 (929) 867 5309', '9988776655', '3216540987', '2020202020', '1231231234',
+]
+ZIPS = ['', '94107', '10001', '90210-1234', '9010', '90210-12', '00501', 'abcde', '٩٠٢١٠', '33101\n', '60601']
+STATES = [None, '', 'CA', 'ny', 'Tx', 'ZZ', 'PR', 'dc']
+NAMES = [
+    '', 'Al', 'Cher', 'John Doe', '  JOHN   DOE  ', 'Brad Pitt', 'j smith', 'Qwerty Jones', 'Abc Def',
+    'Anna Annas', 'aaaa bbbb', 'Mary-Jane O\'Neil', 'José Álvarez', 'Li Na', 'Xu  ', 'tom hanks',
+    'James Garcia', 'Patricia Lopez-Miller', 'Taylor Swift', 'Ab Ab Ab',
+]
+WORDS = ['james', 'garcia', 'qwerty', 'abc', 'xyz', '123', '6789', 'zxcvb', 'aaa', 'ab', 'z', '.', '_', 'İ']
+
+
+class ValidatorEquivalenceTests(SimpleTestCase):
+    """The compiled validators return exactly what the original list-scanning ones did"""
+
+    def assertSameResult(self, name, *args):
+        def call(module):
+            try:
+                return getattr(module, name)(*args)
+            except Exception as e:
+                return type(e)
+        self.assertEqual(call(validators), call(legacy_validators), f'{name}{args!r}')
+
+    def random_text(self, rng, alphabet):
+        if rng.random() < 0.5:
+            return ''.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 16)))
+
+    def test_curated_inputs(self):
+        for email in EMAILS:
+            self.assertSameResult('validate_email_address', email)
+        for phone in PHONES:
+            self.assertSameResult('validate_phone_number', phone)
+        for zip_code in ZIPS:
+            for state in STATES:
+                self.assertSameResult('validate_location', zip_code, state)
+        for name in NAMES:
+            self.assertSameResult('validate_name', name)
+            for email in EMAILS:
+                self.assertSameResult('validate_cross_fields', email, '', name, '')
+
+    def test_random_inputs(self):
+        rng = random.Random(19)
+        alphabet = string.ascii_letters + string.digits + '._- @'
+        for _ in range(3000):
+            user = self.random_text(rng, alphabet)
+            domain = rng.choice(['gmail.com', 'site.xyz', 'mailinator.com', 'co.uk', 'example.tk', 'x'])
+            name = f'{self.random_text(rng, alphabet)} {self.random_text(rng, alphabet)}'
+            self.assertSameResult('validate_email_address', f'{user}@{domain}')
+            self.assertSameResult('validate_name', name)
+            self.assertSameResult('validate_cross_fields', f'{user}@{domain}', '', name, '')
+            self.assertSameResult('validate_phone_number', ''.join(rng.choice('0123456789 -()+') for _ in range(rng.randint(8, 14))))
+            self.assertSameResult('validate_location', ''.join(rng.choice('0123456789-') for _ in range(rng.choice([5, 10]))),
+                                  rng.choice(STATES))
+
+    def test_pattern_helpers(self):
+        rng = random.Random(7)
+        for _ in range(2000):
+            text = self.random_text(rng, string.ascii_letters + string.digits)
+            for length in (3, 4, 5):
+                self.assertEqual(validators._detect_sequential_chars(text, length),
+                                 legacy_validators._detect_sequential_chars(text, length), text)
+            self.assertEqual(validators._detect_keyboard_pattern(text), legacy_validators._detect_keyboard_pattern(text), text)
+            self.assertEqual(validators._detect_repetitive_chars(text, 0.3),
+                             legacy_validators._detect_repetitive_chars(text, 0.3), text)
+
+
+class BatchValidatorTests(SimpleTestCase):
+    """The columnar validators agree with the scalar ones row by row"""
+
+    def assertColumnsMatch(self, columns, batch_result, scalar_results, inputs):
+        for row, scalar in enumerate(scalar_results):
+            for column in columns:
+                self.assertEqual(bool(batch_result[column][row]), scalar.get(column, False),
+                                 f'{column} for {inputs[row]!r}')
+
+    def scalar_phone(self, phone):
+        result = validators.validate_phone_number(phone if isinstance(phone, str) else '')
+        result['toll_free'] = 'Toll-free number detected' in result['details']
+        return result
+
+    def test_phones(self):
+        rng = random.Random(20)
+        phones = PHONES + [None, float('nan')] + [
+            ''.join(rng.choice('0123456789 -()+.x') for _ in range(rng.randint(0, 16))) for _ in range(3000)
+        ] + [f'{rng.choice(["", "1"])}{rng.choice(["212", "456", "800", "415"])}{rng.randrange(10 ** 7):07d}'
+             for _ in range(1000)]
+        self.assertColumnsMatch(
+            batch.PHONE_COLUMNS, batch.validate_phone_numbers(phones),
+            [self.scalar_phone(phone) for phone in phones],
+            phones,
+        )
+
+    def test_locations(self):
+        rng = random.Random(21)
+        zip_codes = ZIPS * len(STATES) + [
+            ''.join(rng.choice('0123456789-') for _ in range(rng.choice([4, 5, 6, 10]))) for _ in range(2000)
+        ]
+        states = [state for state in STATES for _ in ZIPS] + [rng.choice(STATES) for _ in range(2000)]
+        self.assertColumnsMatch(
+            batch.LOCATION_COLUMNS, batch.validate_locations(zip_codes, states),
+            [validators.validate_location(z, s) for z, s in zip(zip_codes, states)],
+            list(zip(zip_codes, states)),
+        )
+
+    def test_emails_and_names(self):
+        self.assertColumnsMatch(batch.EMAIL_COLUMNS, batch.validate_email_addresses(EMAILS),
+                                [validators.validate_email_address(e) for e in EMAILS], EMAILS)
+        self.assertColumnsMatch(batch.NAME_COLUMNS, batch.validate_names(NAMES),
+                                [validators.validate_name(n) for n in NAMES], NAMES)
+
+
+def ai_reply(risk_score):
+    content = json.dumps({'ai_assessment': {'risk_score': risk_score}, 'risk_score': risk_score, 'issues': []})
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def batch_reply(*entries):
+    """A batched reply holding the given result entries"""
+    content = json.dumps({'results': list(entries)})
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def mock_ai(test, reply):
+    """Configure an API key and answer every AI call with `reply`; returns the mock"""
+    api_key = mock.patch('lead_validation.ai_validator.openai.api_key', 'test-key')
+    complete = mock.patch('lead_validation.ai_client.AIClient.complete', return_value=reply)
+    api_key.start()
+    test.addCleanup(api_key.stop)
+    test.addCleanup(complete.stop)
+    return complete.start()
+
+
+@override_settings(AI_ASSESSMENT_CACHE={'ENABLED': True, 'TIMEOUT': 3600, 'MAX_ENTRIES': 2})
+class AIAssessmentCacheTests(TestCase):
+    """Assessments are reused for the same prompt and re-requested on refresh"""
+
+    LEAD = {'name': 'James Garcia', 'email': 'james.garcia@gmail.com', 'phone': '(415) 555-0134',
+            'zip_code': '94107', 'state': 'CA', 'address': '1 Main St', 'ip_address': '10.0.0.1',
+            'user_agent': 'Mozilla/5.0', 'insurance_type': 'auto', 'notes': '', 'vehicle_make': 'Honda',
+            'property_type': 'condo', 'preferred_time': 'morning'}
+
+    def setUp(self):
+        ai_cache.reset_assessment_cache()
+        self.addCleanup(ai_cache.reset_assessment_cache)
+        self.complete = mock_ai(self, ai_reply(20))
+
+    def test_key_covers_exactly_the_prompt_fields(self):
+        key = ai_cache.assessment_key(self.LEAD)
+        prompt = ai_validator.build_lead_prompt(self.LEAD)
+        for field in self.LEAD:
+            if field == 'insurance_type':
+                continue
+            changed = dict(self.LEAD, **{field: self.LEAD[field] + 'x'})
+            prompt_changed = ai_validator.build_lead_prompt(changed) != prompt
+            self.assertEqual(ai_cache.assessment_key(changed) != key, prompt_changed, field)
+        self.assertNotEqual(ai_cache.assessment_key(dict(self.LEAD, insurance_type='home')), key)
+        with mock.patch.object(ai_validator, 'PROMPT_VERSION', ai_validator.PROMPT_VERSION + 1):
+            self.assertNotEqual(ai_cache.assessment_key(self.LEAD), key)
+
+    def test_reuse_and_refresh(self):
+        first = ai_validator.analyze_lead_with_ai(self.LEAD)
+        self.assertEqual(first['cache']['status'], 'miss')
+        self.assertEqual(AIAssessmentCache.objects.count(), 1)
+
+        second = ai_validator.analyze_lead_with_ai(dict(self.LEAD, user_agent='curl'))
+        self.assertEqual((second['cache']['status'], second['cache']['source']), ('hit', 'memory'))
+        self.assertEqual(second['risk_score'], 20)
+        self.assertEqual(self.complete.call_count, 1)
+
+        # Another process only has the shared table
+        ai_cache.reset_assessment_cache()
+        third = ai_validator.analyze_lead_with_ai(self.LEAD)
+        self.assertEqual(third['cache']['source'], 'database')
+        self.assertNotIn('cache', AIAssessmentCache.objects.get().assessment)
+
+        self.complete.return_value = ai_reply(70)
+        refreshed = ai_validator.analyze_lead_with_ai(self.LEAD, refresh=True)
+        self.assertEqual((refreshed['cache']['status'], refreshed['risk_score']), ('refresh', 70))
+        self.assertEqual(ai_validator.analyze_lead_with_ai(self.LEAD)['risk_score'], 70)
+        self.assertEqual(self.complete.call_count, 2)
+        stats = ai_cache.ai_cache_stats()
+        self.assertEqual((stats['database_hits'], stats['memory_hits'], stats['refreshes']), (1, 1, 1))
+
+    def test_failures_are_not_cached_and_lru_is_bounded(self):
+        self.complete.side_effect = RuntimeError('upstream down')
+        self.assertIn('error', ai_validator.analyze_lead_with_ai(self.LEAD))
+        self.assertFalse(AIAssessmentCache.objects.exists())
+
+        self.complete.side_effect = None
+        for zip_code in ('10001', '10002', '10003'):
+            ai_validator.analyze_lead_with_ai(dict(self.LEAD, zip_code=zip_code))
+        self.assertEqual(ai_cache.ai_cache_stats()['entries'], 2)
+        self.assertEqual(ai_validator.analyze_lead_with_ai(dict(self.LEAD, zip_code='10001'))['cache']['source'],
+                         'database')
+
+
+class PrescreenTests(TestCase):
+    """The rule tier settles clear-cut leads; only ambiguous ones reach the AI"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='secret')
+
+    def setUp(self):
+        ai_cache.reset_assessment_cache()
+        prescreen.reset_prescreen_stats()
+        self.complete = mock_ai(self, ai_reply(30))
+
+    def validate(self, **fields):
+        lead = Lead.objects.create(agent=self.agent, insurance_type='auto', **dict({
+            'name': 'Maria Gonzales', 'email': 'maria.gonzales@gmail.com', 'phone': '(312) 867-2093',
+            'zip_code': '60614', 'state': 'IL',
+        }, **fields))
+        result = validate_and_store_lead_data(lead)
+        lead.refresh_from_db()
+        self.assertEqual(lead.validation_details['tier'], result['validation_results']['tier'])
+        return result
+
+    def test_tiers(self):
+        fake = self.validate(name='Brad Pitt', email='qwerty@mailinator.com', phone='1234567890')
+        tier = fake['validation_results']['tier']
+        self.assertEqual((tier['decided_by'], tier['reason'], tier['ai_ms']), ('rules', 'clear_reject', None))
+        self.assertEqual(fake['score'], 0)
+        self.assertNotIn('ai_assessment', fake['validation_results'])
+
+        self.complete.assert_not_called()
+
+        # No rule findings is not clear-cut: the AI still decides
+        clean = self.validate()
+        self.assertEqual(clean['validation_results']['tier']['decided_by'], 'ai')
+        self.assertEqual(clean['score'], 70)
+
+        ambiguous = self.validate(name='Dana Reyes', email='dr1988@gmail.com', phone='(212) 867-2093', zip_code='10025', state='NY')
+        self.assertEqual(ambiguous['validation_results']['tier']['decided_by'], 'ai')
+        self.assertEqual(ambiguous['score'], 70)
+        self.assertEqual(self.complete.call_count, 2)
+
+        stats = prescreen.prescreen_stats()
+        self.assertEqual((stats['leads'], stats['ai_calls'], stats['ai_calls_avoided']), (3, 2, 1))
+
+    @override_settings(LEAD_PRESCREEN={'ACCEPT_RISK': prescreen.BASE_RISK})
+    def test_clear_accept_is_opt_in(self):
+        clean = self.validate()
+        self.assertEqual(clean['validation_results']['tier']['reason'], 'clear_accept')
+        self.assertEqual(clean['score'], 100 - prescreen.BASE_RISK)
+        self.complete.assert_not_called()
+
+    def test_duplicates_and_ai_failures_use_the_rule_score(self):
+        self.validate(email='mg1988@gmail.com')
+        duplicate = self.validate(email='mg1988@gmail.com')
+        self.assertEqual(duplicate['validation_results']['tier']['reason'], 'duplicate')
+        self.assertEqual(self.complete.call_count, 1)
+
+        self.complete.side_effect = RuntimeError('upstream down')
+        failed = self.validate(email='mg1977@gmail.com', phone='(212) 867-2093', zip_code='60615')
+        validation_results = failed['validation_results']
+        self.assertEqual(validation_results['tier']['reason'], 'ai_unavailable')
+        self.assertIn('error', validation_results['ai_assessment'])
+        # The rules found little wrong, but only the AI could vouch for the lead: neutral at best
+        self.assertGreater(100 - validation_results['rule_assessment']['risk_score'], 50)
+        self.assertEqual(failed['score'], 50)
+
+    def test_async_path_matches_sync(self):
+        fields = {'name': 'Dana Reyes', 'email': 'dr1988@gmail.com', 'phone': '(212) 867-2093',
+                  'zip_code': '10025', 'state': 'NY'}
+        lead = Lead.objects.create(agent=self.agent, insurance_type='auto', **fields)
+        expected = validate_and_store_lead_data(lead)
+        result = async_to_sync(avalidate_and_store_lead_data)(lead)
+        self.assertEqual(result['score'], expected['score'])
+        self.assertEqual(result['validation_results']['tier']['decided_by'], 'ai')
+        self.assertEqual(ValidationLog.objects.filter(lead=lead).count(), 2)
+
+    @override_settings(LEAD_PRESCREEN={'ENABLED': False})
+    def test_disabled(self):
+        result = self.validate(name='Brad Pitt')
+        self.assertEqual(result['validation_results']['tier']['decided_by'], 'ai')
+        self.assertEqual(result['score'], 70)
+
+
+class AIClientTests(SimpleTestCase):
+    """Deadlines, the circuit breaker and connection reuse, against the fake AI server"""
+
+    MESSAGES = [{'role': 'user', 'content': 'Analyze this lead'}]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_fake_ai_server(latency=0, seed=24)
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.latency = self.server.error_rate = 0
+        base_url = override_settings(OPENAI_BASE_URL=self.server.base_url)
+        base_url.enable()
+        self.addCleanup(base_url.disable)
+        api_key = mock.patch('lead_validation.ai_validator.openai.api_key', 'test-key')
+        api_key.start()
+        self.addCleanup(api_key.stop)
+
+    def make_client(self, **options):
+        return ai_client.AIClient(dict(ai_client.DEFAULT_AI_CLIENT_SETTINGS, **options))
+
+    def call(self, client):
+        return client.complete(model='gpt-4o', messages=self.MESSAGES)
+
+    def test_connections_are_reused(self):
+        client = self.make_client()
+        connections = self.server.connections
+        for _ in range(5):
+            self.assertIn('risk_score', self.call(client).choices[0].message.content)
+        self.assertEqual(self.server.connections - connections, 1)
+        stats = client.stats()
+        self.assertEqual((stats['calls'], stats['successes'], stats['in_flight']), (5, 5, 0))
+        self.assertIsNotNone(stats['latency_ms']['p99'])
+
+    def test_deadlines(self):
+        self.server.latency = 1.0
+        client = self.make_client(TIMEOUT=0.2)
+        started = time.monotonic()
+        with self.assertRaises(openai.APITimeoutError):
+            self.call(client)
+        with self.assertRaises(TimeoutError):
+            async_to_sync(client.acomplete)(model='gpt-4o', messages=self.MESSAGES)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(client.stats()['timeouts'], 2)
+
+    def test_client_disconnect_is_quiet(self):
+        # A client that gives up mid-delay resets the connection; the server
+        # shouldn't report the failed write as a handler error
+        self.server.latency = 0.2
+        host, port = self.server.server_address[:2]
+        body = b'{}'
+        with mock.patch.object(self.server, 'handle_error') as handle_error:
+            sock = socket.create_connection((host, port))
+            sock.sendall(b'POST /chat/completions HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n%s'
+                         % (len(body), body))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            sock.close()
+            time.sleep(0.5)
+        handle_error.assert_not_called()
+
+    def test_circuit_breaker(self):
+        self.server.error_rate = 1.0
+        client = self.make_client(FAILURE_THRESHOLD=2, RESET_TIMEOUT=0.2)
+        for _ in range(2):
+            with self.assertRaises(openai.InternalServerError):
+                self.call(client)
+
+        # Open: calls fail without reaching the server
+        served = self.server.requests_served
+        with self.assertRaises(ai_client.CircuitOpen):
+            self.call(client)
+        self.assertEqual(self.server.requests_served, served)
+        self.assertEqual(client.stats()['circuit']['state'], 'open')
+
+        # After RESET_TIMEOUT a failed trial reopens it, a successful one closes it
+        time.sleep(0.25)
+        with self.assertRaises(openai.InternalServerError):
+            self.call(client)
+        self.assertEqual(client.stats()['circuit']['times_opened'], 2)
+        self.server.error_rate = 0
+        time.sleep(0.25)
+        self.call(client)
+        stats = client.stats()
+        self.assertEqual((stats['circuit']['state'], stats['rejected_open']), ('closed', 1))
+
+    def test_open_circuit_falls_back(self):
+        self.server.error_rate = 1.0
+        with override_settings(AI_CLIENT={'FAILURE_THRESHOLD': 1}):
+            ai_client.reset_ai_client()
+            self.addCleanup(ai_client.reset_ai_client)
+            lead = {'name': 'Dana Reyes', 'email': 'dana.reyes@example.com', 'insurance_type': 'auto'}
+            with override_settings(AI_ASSESSMENT_CACHE={'ENABLED': False}):
+                self.assertIn('error', ai_validator.analyze_lead_with_ai(lead))
+                served = self.server.requests_served
+                result = ai_validator.analyze_lead_with_ai(lead)
+        self.assertIn('circuit open', result['error'])
+        self.assertEqual(self.server.requests_served, served)
+
+
+def batch_lead(number):
+    return {'name': f'Lead Number{number}', 'email': f'lead{number}@example.com', 'phone': '(212) 867-2093',
+            'zip_code': '10025', 'insurance_type': 'auto'}
+
+
+@override_settings(AI_BATCH={'MAX_SIZE': 3, 'TIMEOUT': 5.0})
+class AIBatchTests(TestCase):
+    """Several leads per AI request, checked lead by lead"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_fake_ai_server(latency=0)
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        ai_cache.reset_assessment_cache()
+        self.addCleanup(ai_cache.reset_assessment_cache)
+        ai_client.reset_ai_client()
+        self.addCleanup(ai_client.reset_ai_client)
+        base_url = override_settings(OPENAI_BASE_URL=self.server.base_url)
+        base_url.enable()
+        self.addCleanup(base_url.disable)
+        api_key = mock.patch('lead_validation.ai_validator.openai.api_key', 'test-key')
+        api_key.start()
+        self.addCleanup(api_key.stop)
+
+    def test_leads_are_batched_and_cached(self):
+        leads = [batch_lead(number) for number in range(5)] + [batch_lead(0)]
+        served = self.server.requests_served
+        results = ai_validator.analyze_leads_with_ai(leads)
+        self.assertEqual(self.server.requests_served - served, 2)
+        self.assertEqual([result['risk_score'] for result in results], [20] * 6)
+        self.assertEqual([result['batch']['size'] for result in results], [3, 3, 3, 2, 2, 3])
+        self.assertEqual(AIAssessmentCache.objects.count(), 5)
+
+        again = ai_validator.analyze_leads_with_ai(leads[:2] + [batch_lead(5)])
+        self.assertEqual(self.server.requests_served - served, 3)
+        self.assertEqual([result['cache']['status'] for result in again], ['hit', 'hit', 'miss'])
+        self.assertEqual(again[2]['batch']['size'], 1)
+
+    def test_bad_entries_are_asked_again_one_by_one(self):
+        complete = mock_ai(self, batch_reply(
+            {'lead_id': 'L1', 'risk_score': 10},
+            {'lead_id': 'L2', 'risk_score': 'high'},
+            {'lead_id': 'L3', 'risk_score': 10},
+            {'lead_id': 'L3', 'risk_score': 90},
+            {'lead_id': 'L9', 'risk_score': 10},
+        ))
+        single = ai_reply(40)
+        complete.side_effect = [complete.return_value, single, single]
+        results = ai_validator.analyze_leads_with_ai([batch_lead(number) for number in range(3)])
+        self.assertEqual([result['risk_score'] for result in results], [10, 40, 40])
+        self.assertEqual(complete.call_count, 3)
+        self.assertNotIn('lead_id', results[0])
+
+        complete.side_effect = openai.APIConnectionError(request=mock.Mock())
+        failed = ai_validator.analyze_leads_with_ai([batch_lead(number) for number in range(3, 6)])
+        self.assertTrue(all('error' in result for result in failed))
+        self.assertEqual(complete.call_count, 4)
+        self.assertEqual(AIAssessmentCache.objects.count(), 3)
+
+    @override_settings(AI_ASSESSMENT_CACHE={'ENABLED': False})
+    def test_batcher_fills_from_concurrent_threads(self):
+        batcher = ai_batch.AIBatcher(max_size=4, linger=1.0, in_flight=2)
+        self.addCleanup(batcher.stop)
+        served = self.server.requests_served
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(batcher.assess, [batch_lead(number) for number in range(4)]))
+        self.assertEqual(self.server.requests_served - served, 1)
+        self.assertEqual([result['batch']['size'] for result in results], [4] * 4)
+        self.assertEqual(batcher.stats(), {'batches': 1, 'leads': 4, 'mean_batch_size': 4.0})
+
+    def test_validate_and_store_leads(self):
+        agent = User.objects.create_user('agent', password='secret')
+        fields = {'zip_code': '60614', 'state': 'IL', 'insurance_type': 'auto'}
+        leads = [
+            Lead.objects.create(agent=agent, name='Maria Gonzales', email='maria.gonzales@gmail.com',
+                                phone='(312) 867-2093', **fields),
+            Lead.objects.create(agent=agent, name='Dana Reyes', email='dr1988@gmail.com',
+                                phone='(212) 867-2093', **fields),
+            Lead.objects.create(agent=agent, name='Sam Ortiz', email='so1979@gmail.com',
+                                phone='(646) 867-2093', **fields),
+        ]
+        served = self.server.requests_served
+        results = validate_and_store_leads(leads)
+        self.assertEqual(self.server.requests_served - served, 1)
+        tiers = [result['validation_results']['tier']['decided_by'] for result in results]
+        self.assertEqual(tiers, ['ai', 'ai', 'ai'])
+        self.assertEqual(results[1]['validation_results']['ai_assessment']['batch']['size'], 3)
+        leads[2].refresh_from_db()
+        self.assertEqual(leads[2].validation_score, 80)
+
+
+class ValidationQueueTests(TestCase):
+    """Leases, retries with backoff, and giving up after max_attempts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent')
+        cls.lead = Lead.objects.create(agent=cls.agent, name='Dana Reyes', email='dr1988@gmail.com',
+                                       phone='(212) 867-2093', zip_code='10025', state='NY', insurance_type='auto')
+
+    def setUp(self):
+        ai_cache.reset_assessment_cache()
+
+    def expire(self, job):
+        ValidationJob.objects.filter(pk=job.pk).update(leased_until=timezone.now() - timedelta(seconds=1))
+
+    def test_leases_are_exclusive_and_expire(self):
+        first = enqueue_validation(self.lead.id)
+        other = Lead.objects.create(agent=self.agent, name='Sam Ortiz', insurance_type='home')
+        second = enqueue_validation(other.id, priority=ValidationJob.PRIORITY_BACKFILL)
+        self.assertEqual(enqueue_validation(self.lead.id).pk, first.pk)
+
+        [leased] = lease_jobs(1)
+        self.assertEqual((leased.pk, leased.attempts), (first.pk, 1))
+        self.assertEqual([job.pk for job in lease_jobs(5)], [second.pk])
+        self.assertEqual(lease_jobs(5), [])
+
+        # A worker that died leaves an expired lease; the job comes back as another attempt
+        self.expire(leased)
+        [again] = lease_jobs(5)
+        self.assertEqual((again.pk, again.attempts), (first.pk, 2))
+        self.assertEqual(complete_job(leased), 0)
+        self.assertEqual(complete_job(again), 1)
+
+    def test_failures_back_off_then_give_up(self):
+        job = enqueue_validation(self.lead.id)
+        ValidationJob.objects.filter(pk=job.pk).update(max_attempts=2)
+        [job] = lease_jobs(1)
+        fail_job(job, RuntimeError('boom'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.priority, job.last_error), ('pending', ValidationJob.PRIORITY_RETRY, 'boom'))
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertEqual(lease_jobs(1), [])
+
+        ValidationJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        [job] = lease_jobs(1)
+        fail_job(job, RuntimeError('boom again'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_expired_last_lease_gives_up(self):
+        job = enqueue_validation(self.lead.id)
+        ValidationJob.objects.filter(pk=job.pk).update(max_attempts=1)
+        [job] = lease_jobs(1)
+        self.expire(job)
+        self.assertEqual(lease_jobs(1), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_ai_failure_is_retried(self):
+        complete = mock_ai(self, ai_reply(30))
+        complete.side_effect = RuntimeError('upstream down')
+        enqueue_validation(self.lead.id)
+        [job] = lease_jobs(1)
+        with self.assertRaises(ValidationFailed):
+            run_validation_job(job)
+        # The fallback score is stored meanwhile
+        self.lead.refresh_from_db()
+        self.assertEqual(self.lead.validation_details['tier']['reason'], 'ai_unavailable')
+
+        complete.side_effect = None
+        self.assertEqual(run_validation_job(job)['validation_results']['tier']['decided_by'], 'ai')
+
+
+class BulkIngestTests(TestCase):
+    """Partner batches are parsed, deduplicated and credited per row"""
+
+    def setUp(self):
+        self.agent = User.objects.create_user('partner')
+        self.client.force_login(self.agent)
+        self.link = ReferralLink.objects.create(user=self.agent, code='bulk01', insurance_type='auto',
+                                                referral_type='customer')
+        PaymentRate.objects.create(state='', insurance_type='auto', rate_amount=Decimal('40.00'))
+        PaymentRate.objects.create(state='', insurance_type='home', rate_amount=Decimal('25.00'))
+        invalidate_rate_table()
+        self.url = reverse('lead_validation:bulk_ingest_leads')
+
+    def row(self, n, **fields):
+        return {'name': f'Partner Lead {n}', 'email': f'partner.lead{n}@example.com',
+                'phone': f'(212) 555-01{n:02d}', 'insurance_type': 'auto', 'state': 'NY', **fields}
+
+    def post(self, body, content_type='application/x-ndjson', **params):
+        url = self.url + (f'?referral_code={params["referral_code"]}' if params else '')
+        return self.client.post(url, body, content_type=content_type)
+
+    def ndjson(self, *rows):
+        return '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows)
+
+    def test_parses_ndjson_and_json_arrays(self):
+        response = self.post(self.ndjson(self.row(1), '{broken', '', self.row(2, insurance_type='boat', email='x')))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary'], {'created': 1, 'duplicate': 0, 'invalid': 2})
+        results = response.json()['results']
+        self.assertEqual([result['row'] for result in results], [0, 1, 2])
+        self.assertTrue(results[1]['errors'][0].startswith('Invalid JSON'))
+        self.assertEqual(sorted(results[2]['errors']),
+                         ['email: invalid address', 'insurance_type: must be one of auto, business, health, home, life, other'])
+
+        response = self.post(json.dumps([self.row(3), self.row(4)]), content_type='application/json')
+        self.assertEqual(response.json()['summary'], {'created': 2, 'duplicate': 0, 'invalid': 0})
+        self.assertEqual(self.post('[{"name": "x"', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post('name,email', content_type='text/csv').status_code, 415)
+
+    def test_duplicates_within_and_across_batches(self):
+        existing = Lead.objects.create(agent=self.agent, name='Old Lead', email='Partner.Lead1@Example.com',
+                                       phone='4155550100', insurance_type='auto')
+        response = self.post(self.ndjson(
+            self.row(1),
+            self.row(2),
+            self.row(3, email='partner.lead2@example.com'),
+            self.row(4, phone='212 555 0102'),
+        ))
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['duplicate', 'created', 'duplicate', 'duplicate'])
+        self.assertEqual(results[0]['lead_id'], existing.id)
+        self.assertEqual(results[2]['duplicate_of_row'], 1)
+        self.assertEqual(results[3]['duplicate_of_row'], 1)
+        created = Lead.objects.get(pk=results[1]['lead_id'])
+        self.assertEqual((created.agent_id, created.email_normalized), (self.agent.id, 'partner.lead2@example.com'))
+        self.assertEqual(ValidationJob.objects.filter(lead=created).count(), 1)
+
+    def test_link_credit_and_stats(self):
+        response = self.post(self.ndjson(self.row(1), self.row(2, insurance_type='home'), self.row(3, email='bad')),
+                             referral_code=self.link.code)
+        self.assertEqual(response.json()['summary'], {'created': 2, 'duplicate': 0, 'invalid': 1})
+        # Rewards follow the link's rates, as for a form submission
+        rewards = sorted(Lead.objects.filter(referral_link=self.link).values_list('reward_amount', flat=True))
+        self.assertEqual(rewards, [Decimal('40.00'), Decimal('40.00')])
+
+        self.link.refresh_from_db()
+        self.assertEqual((self.link.conversions, self.link.paid_conversions, self.link.earnings),
+                         (2, 2, Decimal('65.00')))
+        self.assertEqual((self.link.stats.leads_total, self.link.stats.leads_new, self.link.stats.leads_low), (2, 2, 2))
+        stats = AgentStats.objects.get(user=self.agent)
+        self.assertEqual((stats.leads_total, stats.conversions, stats.earnings), (2, 2, Decimal('65.00')))
+        self.assertEqual(reconcile_stats(fix=False), ([], []))
+
+    def test_agent_link_matches_form_rewards(self):
+        link = ReferralLink.objects.create(user=self.agent, code='bulk02', insurance_type='auto', referral_type='agent')
+        response = self.post(self.ndjson(self.row(1)), referral_code=link.code)
+        self.assertEqual(response.json()['summary']['created'], 1)
+        ingested = Lead.objects.get(referral_link=link)
+        submitted = Lead.objects.create(referral_link=link, name='Form Lead', email='form.lead@example.com',
+                                        phone='2125550199', insurance_type='auto', state='NY')
+        self.assertEqual((ingested.reward_amount, submitted.reward_amount), (Decimal('0.00'), Decimal('0.00')))
+        # The agent still earns their payout for the lead
+        link.refresh_from_db()
+        self.assertEqual(link.earnings, Decimal('40.00'))
+
+    def test_inactive_link_is_not_credited(self):
+        ingest = BulkIngest(self.agent, referral_link=self.link, chunk_size=1)
+        rows = iter([self.row(1), self.row(2)])
+
+        def deactivate_after_first_chunk():
+            yield next(rows)
+            self.link.deactivate()
+            yield next(rows)
+
+        with self.assertRaises(IngestError):
+            ingest.run(deactivate_after_first_chunk())
+        self.assertEqual([result['status'] for result in ingest.results], ['created'])
+        self.assertEqual(Lead.objects.filter(referral_link=self.link).count(), 1)
+        self.link.refresh_from_db()
+        self.assertEqual((self.link.conversions, self.link.earnings), (1, Decimal('40.00')))
+
+
+class NearDuplicateTests(TestCase):
+    """Leads are indexed when they are created and matched through shared LSH buckets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent')
+        cls.link = ReferralLink.objects.create(user=cls.agent, code='near01')
+
+    LEAD = {'name': 'Jonathan Smith', 'email': 'jonathan.smith@gmail.com', 'zip_code': '60614',
+            'address': '1200 North Lake Shore Drive'}
+    TYPO = {'name': 'Johnathan Smith', 'email': 'jonathon.smith@gmail.com', 'zip_code': '60614-2201',
+            'address': '1200 N Lake Shore Drive'}
+
+    def test_keys_are_blocked_by_area(self):
+        here = set(similarity_keys({'name': 'Jon Smith', 'zip_code': '60614'}))
+        self.assertTrue(here & set(similarity_keys({'name': 'John Smith', 'zip_code': '60614-1234'})))
+        self.assertFalse(here & set(similarity_keys({'name': 'John Smith', 'zip_code': '10001'})))
+        self.assertEqual(here, set(similarity_keys({'name': '  JON smith!', 'zip_code': '60614'})))
+
+    def test_submitted_leads_are_matched_before_validation(self):
+        lead, _ = submit_lead(self.link, Lead(insurance_type='auto', phone='(312) 867-2093', **self.LEAD))
+        self.assertEqual(LeadSimilarityKey.objects.filter(lead=lead).count(), len(similarity_keys(self.LEAD)))
+
+        is_duplicate, confidence, lead_ids, fields, _ = find_near_duplicates(self.TYPO)
+        self.assertEqual((is_duplicate, confidence, lead_ids, fields), (True, 80, [lead.id], ['name', 'zip_code', 'address']))
+        self.assertEqual(find_near_duplicates(self.LEAD, exclude_id=lead.id), NO_NEAR_DUPLICATE)
+        self.assertEqual(find_near_duplicates({'name': 'Priya Raman', 'email': 'praman@yahoo.com', 'zip_code': '60614'}),
+                         NO_NEAR_DUPLICATE)
+
+    def test_ingested_leads_are_matched(self):
+        BulkIngest(self.agent).run([dict(self.LEAD, phone='(312) 867-2093', insurance_type='auto')])
+        lead = Lead.objects.get()
+        self.assertEqual(set(LeadSimilarityKey.objects.filter(lead=lead).values_list('key', flat=True)),
+                         set(similarity_keys(self.LEAD)))
+        self.assertEqual(find_near_duplicates(dict(self.TYPO, email='jsmith@yahoo.com', address=''))[:4],
+                         (True, 70, [lead.id], ['name', 'zip_code']))
+
+
+class RevalidationTests(TestCase):
+    """An interrupted backfill resumes from its checkpoint"""
+
+    def setUp(self):
+        agent = User.objects.create_user('agent')
+        self.lead_ids = [
+            Lead.objects.create(agent=agent, name=f'Lead {n}', email=f'lead{n}@example.com',
+                                phone=f'31286720{n:02d}', insurance_type='auto').id
+            for n in range(5)
+        ]
+        self.run = RevalidationRun.objects.create(name='test-run')
+        self.chunks = []
+
+    def revalidate_chunk(self, lead_ids, refresh_ai=False):
+        self.chunks.append(lead_ids)
+        if len(self.chunks) == 3:
+            raise KeyboardInterrupt
+        return len(lead_ids), 0
+
+    def test_watermark_moves_past_finished_prefix_only(self):
+        futures = [Future() for _ in range(3)]
+        watermark = Watermark(0)
+        for last_id, future in zip([10, 20, 30], futures):
+            watermark.add(last_id, future)
+        futures[1].set_result((1, 0))
+        self.assertEqual(watermark.advance(), 0)
+        futures[0].set_result((1, 0))
+        self.assertEqual(watermark.advance(), 20)
+        futures[2].set_result((1, 0))
+        self.assertEqual(watermark.advance(), 30)
+
+    def test_single_worker_limits_ai_calls(self):
+        client = ai_client.get_ai_client()
+        default_slots = client.slots
+        limits = []
+
+        def revalidate_chunk(lead_ids, refresh_ai=False):
+            limits.append(client.slots._initial_value)
+            return len(lead_ids), 0
+
+        with mock.patch('lead_validation.backfill.revalidate_chunk', side_effect=revalidate_chunk):
+            revalidate(self.run, Lead.objects.all(), workers=1, chunk_size=5, ai_concurrency=2)
+        self.assertEqual(limits, [2])
+        self.assertIs(client.slots, default_slots)
+
+    def test_interrupted_run_resumes_after_checkpoint(self):
+        self.assertEqual(default_workers(), 1)
+        with mock.patch('lead_validation.backfill.revalidate_chunk', side_effect=self.revalidate_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                revalidate(self.run, Lead.objects.all(), chunk_size=1)
+            self.run.refresh_from_db()
+            self.assertEqual((self.run.last_lead_id, self.run.processed, self.run.completed_at),
+                             (self.lead_ids[1], 2, None))
+
+            self.chunks = [None] * 3  # no more interruptions
+            run = RevalidationRun.objects.get(name='test-run')
+            self.assertEqual(revalidate(run, Lead.objects.all(), chunk_size=1), 3)
+        self.assertEqual(self.chunks[3:], [[lead_id] for lead_id in self.lead_ids[2:]])
+        run.refresh_from_db()
+        self.assertEqual((run.last_lead_id, run.processed, run.failed), (self.lead_ids[-1], 5, 0))
+        self.assertIsNotNone(run.completed_at)
@@ -7,6 +7,19 @@ urlpatterns = [
     # API endpoint for validating leads
     path('api/validate-lead/', views.validate_lead_api, name='validate_lead_api'),
     
+    # Bulk lead ingestion for partner integrations (NDJSON or JSON array)
+    path('api/leads/bulk/', views.bulk_ingest_leads, name='bulk_ingest_leads'),
+    
+    # Async (ASGI) variants of the validation endpoints
+    path('api/v2/validate-lead/', views.validate_lead_api_async, name='validate_lead_api_async'),
+    path('validate-lead-async/<int:lead_id>/', views.validate_existing_lead_async, name='validate_lead_async'),
+    
     # View for validating an existing lead (using validate_lead as the name to match template)
     path('validate-lead/<int:lead_id>/', views.validate_existing_lead, name='validate_lead'),
+    
+    # AI assessment cache counters for this process (staff only)
+    path('ai-cache-stats/', views.ai_cache_stats, name='ai_cache_stats'),
+    
+    # AI client circuit breaker state and latency percentiles for this process (staff only)
+    path('ai-client-stats/', views.ai_client_stats, name='ai_client_stats'),
 ] 
\ No newline at end of file
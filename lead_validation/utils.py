@@ -1,16 +1,32 @@
 import logging
+import time
+from collections import namedtuple
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 from django.db.models import Q
 from django.core.exceptions import MultipleObjectsReturned
 from .models import ValidationLog
 from .validators import validate_email_address, validate_phone_number, validate_location, validate_name, validate_cross_fields
-from .ai_validator import analyze_lead_with_ai
+from .ai_batch import get_ai_batcher
+from .ai_validator import analyze_lead_with_ai, analyze_lead_with_ai_async, analyze_leads_with_ai
+from .prescreen import AI_UNAVAILABLE, get_prescreen_settings, record_tier, rule_assessment, screen_lead, settle_reason
+from .near_duplicates import find_near_duplicates
 from lead_capture.models import Lead
+from lead_capture.identity import identity_keys
 import re
-from fuzzywuzzy import fuzz
 
 logger = logging.getLogger(__name__)
 
+# Confidence for each identity key, strongest first
+DUPLICATE_KEY_CONFIDENCE = [
+    ('email_normalized', 95, ["email"]),
+    ('phone_e164', 90, ["phone"]),
+    ('name_zip_key', 75, ["name", "zip_code"]),
+]
+
+# Matching leads reported per key
+DUPLICATE_MATCH_LIMIT = 100
+
 def check_for_duplicate_lead(lead_data, exclude_id=None):
     """
     Check if a lead already exists with similar information
@@ -19,68 +35,33 @@ def check_for_duplicate_lead(lead_data, exclude_id=None):
     Parameters:
     - lead_data: Dictionary with lead information
     - exclude_id: Optional lead ID to exclude from the check (for revalidation)
-    """
-    from lead_capture.models import Lead
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    print(f"Checking for duplicates with data: {lead_data['email']}")
-    if exclude_id:
-        print(f"Excluding lead ID {exclude_id} from duplicate check (revalidation)")
-    
-    # Look for exact email match first (highest confidence)
-    email_query = Lead.objects.filter(email__iexact=lead_data['email'])
-    if exclude_id:
-        email_query = email_query.exclude(id=exclude_id)
-    
-    email_matches = email_query.all()
-    if email_matches.exists():
-        print(f"Found exact email match: {lead_data['email']}")
-        return True, 95, email_matches, ["email"]
     
-    # Look for exact phone match (high confidence)
-    if lead_data.get('phone'):
-        # Normalize phone number for comparison
-        phone = ''.join(filter(str.isdigit, lead_data['phone']))
-        if phone:
-            phone_query = Lead.objects.filter(phone__endswith=phone[-10:])
-            if exclude_id:
-                phone_query = phone_query.exclude(id=exclude_id)
-                
-            phone_matches = phone_query.all()
-            if phone_matches.exists():
-                print(f"Found phone match: {phone}")
-                return True, 90, phone_matches, ["phone"]
+    The email, phone and name+ZIP keys are probed strongest first, one
+    query each against the indexed normalized identity columns on Lead, so
+    a crowd of name+ZIP matches can't hide an exact email or phone match.
+    """
+    keys = identity_keys(
+        lead_data.get('email'), lead_data.get('phone'),
+        lead_data.get('name'), lead_data.get('zip_code'),
+    )
     
-    # Look for name + zip code match (medium confidence)
-    if lead_data.get('name') and lead_data.get('zip_code'):
-        name_zip_query = Lead.objects.filter(
-            name__iexact=lead_data['name'],
-            zip_code=lead_data['zip_code']
-        )
+    for field, confidence, matching_fields in DUPLICATE_KEY_CONFIDENCE:
+        if not keys[field]:
+            continue
+        candidates = Lead.objects.filter(**{field: keys[field]})
         if exclude_id:
-            name_zip_query = name_zip_query.exclude(id=exclude_id)
-            
-        name_zip_matches = name_zip_query.all()
-        if name_zip_matches.exists():
-            print(f"Found name+zip match: {lead_data['name']} in {lead_data['zip_code']}")
-            return True, 75, name_zip_matches, ["name", "zip_code"]
+            candidates = candidates.exclude(id=exclude_id)
+        matches = list(candidates.only('id', field).order_by('id')[:DUPLICATE_MATCH_LIMIT])
+        if matches:
+            logger.info(f"Found duplicate by {field} (confidence {confidence}%): {[lead.id for lead in matches]}")
+            return True, confidence, matches, matching_fields
     
     # No duplicates found
     return False, 0, [], []
 
-def validate_and_store_lead_data(lead, save_to_db=True):
-    """
-    Main validation workflow with hybrid scoring approach:
-    1. Check for duplicates first
-    2. Use AI validation for lead quality assessment 
-    3. Calculate final score considering both factors
-    """
-    logger.info(f"Starting validation for lead data: {lead.email}")
-    print(f"VALIDATING LEAD: {getattr(lead, 'id', 'New')} - name={lead.name}, email={lead.email}")
-    
-    # Prepare lead data for validation
-    lead_data = {
+def build_lead_data(lead):
+    """Prepare the dict of lead fields used by the duplicate checks and the AI prompt"""
+    return {
         # Basic information
         'name': lead.name,
         'email': lead.email,
@@ -121,105 +102,155 @@ def validate_and_store_lead_data(lead, save_to_db=True):
         'num_employees': getattr(lead, 'num_employees', ''),
         'annual_revenue': getattr(lead, 'annual_revenue', '')
     }
-    
-    print(f"Lead data for validation: insurance_type={lead_data['insurance_type']}, keys={list(lead_data.keys())}")
-    
-    # Initialize validation results
-    validation_results = {}
-    
-    # STEP 1: Check for duplicates in database
-    print("STEP 1: Checking for duplicates in database...")
-    
-    # Get the lead ID if it exists (for revalidation)
-    lead_id = getattr(lead, 'id', None)
-    
-    # Always perform the duplicate check, excluding self for existing leads
-    is_duplicate, dup_confidence, matching_leads, matching_fields = check_for_duplicate_lead(
-        lead_data, 
-        exclude_id=lead_id  # This will exclude the current lead from the check
-    )
-    
+
+def _duplicate_details(exact_match, near_match):
+    """
+    Combine the exact and near-duplicate results into
+    (is_duplicate, confidence, validation_results['duplicate_check'])
+    """
+    is_duplicate, dup_confidence, matching_leads, matching_fields = exact_match
     if is_duplicate:
-        print(f"DATABASE DUPLICATE DETECTED! Confidence: {dup_confidence}%")
-        print(f"Matching leads: {[l.id for l in matching_leads]}")
-        print(f"Matching fields: {matching_fields}")
-        
-        # Store matching lead IDs
-        matching_lead_ids = [l.id for l in matching_leads]
-        validation_results['duplicate_check'] = {
+        return True, dup_confidence, {
             'is_duplicate': True,
+            'match_type': 'exact',
             'confidence': dup_confidence,
-            'matching_lead_ids': matching_lead_ids,
+            'matching_lead_ids': [l.id for l in matching_leads],
             'matching_fields': matching_fields
         }
-    else:
-        print("No duplicates found in database")
-        validation_results['duplicate_check'] = {
-            'is_duplicate': False
-        }
     
-    # STEP 2: Always use AI validation (no fallback to rules)
-    try:
-        logger.info("STEP 2: Running AI validation")
-        print("\n*** CALLING AI VALIDATOR ***\n")
-        
-        ai_assessment = analyze_lead_with_ai(lead_data)
-        validation_results['ai_assessment'] = ai_assessment
-        print(f"AI RESULT RECEIVED")
-        
-        # AI returns risk score (higher = worse)
-        # We need to invert for our system (higher = better)
-        quality_score = 100 - ai_assessment.get('risk_score', 50)
-        print(f"AI risk score: {ai_assessment.get('risk_score', 50)}, converted quality score: {quality_score}")
-        
-    except Exception as e:
-        logger.error(f"Error during AI validation: {e}")
-        print(f"AI VALIDATION ERROR: {e}")
-        validation_results['ai_assessment'] = {
-            "error": str(e),
-            "risk_score": 50,  # Neutral score when AI fails
-            "issues": ["AI validation error: " + str(e)],
-            "assessment": "medium_risk",
-            "confidence": 0
+    if near_match and near_match[0]:
+        _, dup_confidence, matching_lead_ids, matching_fields, similarity = near_match
+        return True, dup_confidence, {
+            'is_duplicate': True,
+            'match_type': 'near',
+            'confidence': dup_confidence,
+            'matching_lead_ids': matching_lead_ids,
+            'matching_fields': matching_fields,
+            'similarity': similarity
         }
-        quality_score = 50  # Neutral score in case of error
     
-    # STEP 3: Calculate final score considering duplicate detection
-    print("STEP 3: Calculating final score based on AI quality and duplicate status")
+    return False, 0, {'is_duplicate': False}
+
+def _quality_from_ai(ai_assessment):
+    """AI returns risk score (higher = worse); invert it to a quality score (higher = better)"""
+    return 100 - ai_assessment.get('risk_score', 50)
+
+def _ai_error_assessment(e):
+    logger.error(f"Error during AI validation: {e}")
+    return {
+        "error": str(e),
+        "risk_score": 50,  # Neutral score when AI fails
+        "issues": ["AI validation error: " + str(e)],
+        "assessment": "medium_risk",
+        "confidence": 0
+    }
+
+# Without the AI the rules can mark a lead down, but not vouch for it
+FALLBACK_MAX_QUALITY = 50
+
+def _fallback_reason(ai_assessment):
+    """When the AI call failed, the rule tier's score is used, capped at the neutral FALLBACK_MAX_QUALITY"""
+    if 'error' in ai_assessment and get_prescreen_settings()['ENABLED']:
+        return AI_UNAVAILABLE
+    return None
+
+def _tier_quality(validation_results, prescreen, reason, ai_ms):
+    """Record which tier decided the lead and return its quality score"""
+    validation_results['tier'] = record_tier(prescreen, reason, ai_ms)
+    if reason is None:
+        return _quality_from_ai(validation_results['ai_assessment'])
+    quality = _quality_from_ai(validation_results['rule_assessment'])
+    if reason == AI_UNAVAILABLE:
+        return min(quality, FALLBACK_MAX_QUALITY)
+    return quality
+
+def _apply_duplicate_penalty(quality_score, is_duplicate, dup_confidence, source='AI'):
+    """Calculate final score considering duplicate detection. Returns (final_score, explanation)"""
     if is_duplicate:
         # HIGH CONFIDENCE DUPLICATE (>80%)
         if dup_confidence > 80:
             final_score = max(5, int(quality_score * 0.1))  # 90% reduction, min score 5
-            explanation = f"High-confidence duplicate ({dup_confidence}%). AI quality score of {quality_score} reduced by 90%."
+            explanation = f"High-confidence duplicate ({dup_confidence}%). {source} quality score of {quality_score} reduced by 90%."
         
         # MEDIUM CONFIDENCE DUPLICATE (50-80%)
         elif dup_confidence > 50:
             final_score = max(10, int(quality_score * 0.25))  # 75% reduction, min score 10
-            explanation = f"Medium-confidence duplicate ({dup_confidence}%). AI quality score of {quality_score} reduced by 75%."
+            explanation = f"Medium-confidence duplicate ({dup_confidence}%). {source} quality score of {quality_score} reduced by 75%."
         
         # LOW CONFIDENCE DUPLICATE (<50%)
         else:
             final_score = max(20, int(quality_score * 0.5))  # 50% reduction, min score 20
-            explanation = f"Low-confidence duplicate ({dup_confidence}%). AI quality score of {quality_score} reduced by 50%."
+            explanation = f"Low-confidence duplicate ({dup_confidence}%). {source} quality score of {quality_score} reduced by 50%."
     else:
         # Not a duplicate - use quality score directly
         final_score = quality_score
-        explanation = f"No duplicate detected. Using AI quality score of {quality_score}."
-    
-    # Store score breakdown
-    validation_results['score_breakdown'] = {
+        explanation = f"No duplicate detected. Using {source} quality score of {quality_score}."
+    return final_score, explanation
+
+def _score_breakdown(final_score, explanation, is_duplicate, dup_confidence):
+    return {
         'final_score': final_score,
         'explanation': explanation,
         'is_duplicate': is_duplicate,
         'duplicate_confidence': dup_confidence if is_duplicate else 0
     }
+
+def _result(lead, final_score, validation_results, save_error=None):
+    result = {
+        'score': final_score,
+        'validation_results': validation_results,
+        'lead_id': getattr(lead, 'id', None)
+    }
+    if save_error:
+        # The score was computed but not stored; queue workers retry the job
+        result['error'] = save_error
+    return result
+
+# A lead part-way through validation: duplicates checked and rules run (steps 1-2)
+Screened = namedtuple('Screened', 'lead lead_data validation_results is_duplicate dup_confidence prescreen reason')
+
+def _screen(lead):
+    """Steps 1-2 of validate_and_store_lead_data: duplicate checks, then the rule pre-screen"""
+    lead_data = build_lead_data(lead)
+    validation_results = {}
+    
+    # Get the lead ID if it exists (for revalidation)
+    lead_id = getattr(lead, 'id', None)
+    
+    # STEP 1: Check for duplicates in database, excluding self for existing leads
+    exact_match = check_for_duplicate_lead(lead_data, exclude_id=lead_id)
+    # No exact identity match - look for near-duplicates (typos, nicknames)
+    near_match = None if exact_match[0] else find_near_duplicates(lead_data, exclude_id=lead_id)
+    is_duplicate, dup_confidence, validation_results['duplicate_check'] = _duplicate_details(exact_match, near_match)
+    if is_duplicate:
+        logger.debug(f"Database duplicate detected (confidence {dup_confidence}%)")
+    
+    # STEP 2: Rule-based pre-screen settles clear-cut leads without the AI
+    prescreen = screen_lead(lead_data)
+    validation_results.update(prescreen.results)
+    validation_results['rule_assessment'] = rule_assessment(prescreen)
+    reason = settle_reason(prescreen, is_duplicate, dup_confidence)
+    return Screened(lead, lead_data, validation_results, is_duplicate, dup_confidence, prescreen, reason)
+
+def _finish(screened, ai_ms, save_to_db):
+    """Step 4 of validate_and_store_lead_data, once any AI assessment is in; stores the result"""
+    lead, validation_results = screened.lead, screened.validation_results
+    is_duplicate, dup_confidence, reason = screened.is_duplicate, screened.dup_confidence, screened.reason
+    if reason is None and ai_ms is not None:
+        reason = _fallback_reason(validation_results['ai_assessment'])
+    quality_score = _tier_quality(validation_results, screened.prescreen, reason, ai_ms)
+    logger.debug(f"Decided by: {validation_results['tier']['decided_by']} ({reason or 'ambiguous'})")
+    
+    # STEP 4: Calculate final score considering duplicate detection
+    final_score, explanation = _apply_duplicate_penalty(quality_score, is_duplicate, dup_confidence,
+                                                        source='AI' if reason is None else 'Rule')
+    validation_results['score_breakdown'] = _score_breakdown(final_score, explanation, is_duplicate, dup_confidence)
     
-    print(f"FINAL VALIDATION SCORE: {final_score}/100")
-    print(f"  Explanation: {explanation}")
     logger.info(f"Validation complete - Final Score: {final_score}/100")
     
     # Store validation results in lead
-    if save_to_db and hasattr(lead, 'id'):
+    save_error = None
+    if save_to_db and getattr(lead, 'id', None):
         try:
             lead.validation_score = final_score
             lead.validation_details = validation_results
@@ -236,14 +267,87 @@ def validate_and_store_lead_data(lead, save_to_db=True):
             logger.info(f"Validation data saved for lead ID: {lead.id}")
         except Exception as e:
             logger.error(f"Error saving validation data: {e}")
-            print(f"ERROR SAVING VALIDATION: {e}")
+            save_error = f"Error saving validation data: {e}"
     
-    # Return validation results
-    return {
-        'score': final_score,
-        'validation_results': validation_results,
-        'lead_id': getattr(lead, 'id', None)
-    }
+    return _result(lead, final_score, validation_results, save_error)
+
+def validate_and_store_lead_data(lead, save_to_db=True, refresh_ai=False):
+    """
+    Main validation workflow with hybrid scoring approach:
+    1. Check for duplicates first
+    2. Run the rule validators; they settle clear-cut leads (see prescreen.py)
+    3. Use AI validation for the quality of the remaining, ambiguous leads
+    4. Calculate final score considering duplicates and quality
+    
+    refresh_ai asks the model again instead of reusing a cached assessment.
+    While an AIBatcher runs (see ai_batch.py) the AI call joins a batch.
+    """
+    logger.info(f"Starting validation for lead data: {lead.email}")
+    
+    screened = _screen(lead)
+    
+    # STEP 3: AI validation for the ambiguous rest
+    ai_ms = None
+    if screened.reason is None:
+        batcher = get_ai_batcher()
+        started = time.perf_counter()
+        try:
+            if batcher is not None:
+                assessment = batcher.assess(screened.lead_data, refresh=refresh_ai)
+            else:
+                assessment = analyze_lead_with_ai(screened.lead_data, refresh=refresh_ai)
+        except Exception as e:
+            assessment = _ai_error_assessment(e)
+        screened.validation_results['ai_assessment'] = assessment
+        ai_ms = (time.perf_counter() - started) * 1000
+    
+    return _finish(screened, ai_ms, save_to_db)
+
+def validate_and_store_leads(leads, save_to_db=True, refresh_ai=False):
+    """
+    validate_and_store_lead_data for several leads, with the AI assessments
+    of the ambiguous ones requested in batches (analyze_leads_with_ai).
+    Returns one result per lead, in order.
+    """
+    screened = [_screen(lead) for lead in leads]
+    ambiguous = [entry for entry in screened if entry.reason is None]
+    
+    ai_ms = None
+    if ambiguous:
+        started = time.perf_counter()
+        try:
+            assessments = analyze_leads_with_ai([entry.lead_data for entry in ambiguous], refresh=refresh_ai)
+        except Exception as e:
+            assessments = [_ai_error_assessment(e) for _ in ambiguous]
+        # Each lead is charged its share of the batched calls
+        ai_ms = (time.perf_counter() - started) * 1000 / len(ambiguous)
+        for entry, assessment in zip(ambiguous, assessments):
+            entry.validation_results['ai_assessment'] = assessment
+    
+    return [_finish(entry, ai_ms if entry.reason is None else None, save_to_db) for entry in screened]
+
+async def avalidate_and_store_lead_data(lead, save_to_db=True, refresh_ai=False):
+    """
+    Async version of validate_and_store_lead_data for ASGI views. The
+    duplicate checks, rules and storing are the same sync steps run in a
+    thread; only the AI call is awaited, so it does not hold a worker thread.
+    """
+    logger.info(f"Starting async validation for lead data: {lead.email}")
+    
+    screened = await sync_to_async(_screen)(lead)
+    
+    # STEP 3: AI validation for ambiguous leads
+    ai_ms = None
+    if screened.reason is None:
+        started = time.perf_counter()
+        try:
+            assessment = await analyze_lead_with_ai_async(screened.lead_data, refresh=refresh_ai)
+        except Exception as e:
+            assessment = _ai_error_assessment(e)
+        screened.validation_results['ai_assessment'] = assessment
+        ai_ms = (time.perf_counter() - started) * 1000
+    
+    return await sync_to_async(_finish)(screened, ai_ms, save_to_db)
 
 def fix_missing_validations():
     """Utility function to fix existing leads with missing validation data"""
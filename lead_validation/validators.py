@@ -3,7 +3,8 @@ import logging
 import string
 import tldextract
 import socket
-from collections import Counter
+from collections import deque
+from functools import lru_cache
 from django.core.validators import validate_email as django_validate_email
 from django.core.exceptions import ValidationError
 
@@ -69,55 +70,166 @@ HIGH_FRAUD_ZIP_CODES = [
     '20001', '20500', '95054', '95132', '77001', '77002', '19101', '19102'
 ]
 
+# Obvious fake phone numbers (10 digits, country code removed)
+OBVIOUS_FAKE_PHONES = [
+    '1234567890', '0987654321', '1111111111', '2222222222', '3333333333',
+    '4444444444', '5555555555', '6666666666', '7777777777', '8888888888',
+    '9999999999', '0000000000', '1234554321', '9876543210', '1122334455',
+    '9988776655', '1231231234', '4565456545'
+]
+
+TOLL_FREE_AREA_CODES = ['800', '888', '877', '866', '855', '844', '833']
+
+# States each leading ZIP digit belongs to
+ZIP_PREFIX_STATES = {
+    0: ['CT', 'MA', 'ME', 'NH', 'NJ', 'PR', 'RI', 'VT'],
+    1: ['DE', 'NY', 'PA'],
+    2: ['DC', 'MD', 'NC', 'SC', 'VA', 'WV'],
+    3: ['AL', 'FL', 'GA', 'MS', 'TN'],
+    4: ['IN', 'KY', 'MI', 'OH'],
+    5: ['IA', 'MN', 'MT', 'ND', 'SD', 'WI'],
+    6: ['IL', 'KS', 'MO', 'NE'],
+    7: ['AR', 'LA', 'OK', 'TX'],
+    8: ['AZ', 'CO', 'ID', 'NM', 'NV', 'UT', 'WY'],
+    9: ['AK', 'CA', 'HI', 'OR', 'WA'],
+}
+
+
+# Compiled once at import: the checks below are set lookups and a single
+# pass over each string, so validating a lead allocates almost nothing.
+_DISPOSABLE_DOMAINS = frozenset(DISPOSABLE_EMAIL_DOMAINS)
+_HIGH_RISK_TLDS = frozenset(HIGH_RISK_TLDS)
+_FAKE_NAMES = frozenset(FAKE_NAMES)
+_CELEBRITY_NAMES = frozenset(CELEBRITY_NAMES)
+_HIGH_FRAUD_AREA_CODES = frozenset(HIGH_FRAUD_AREA_CODES)
+_VOIP_AREA_CODES = frozenset(VOIP_AREA_CODES)
+_HIGH_FRAUD_ZIP_CODES = frozenset(HIGH_FRAUD_ZIP_CODES)
+_OBVIOUS_FAKE_PHONES = frozenset(OBVIOUS_FAKE_PHONES)
+_TOLL_FREE_AREA_CODES = frozenset(TOLL_FREE_AREA_CODES)
+_ZIP_PREFIX_STATES = {prefix: frozenset(states) for prefix, states in ZIP_PREFIX_STATES.items()}
+
+_NON_DIGITS = re.compile(r'[^0-9]')
+_PHONE_SEPARATORS = str.maketrans('', '', ' ()-+.')
+_ZIP_RE = re.compile(r'^\d{5}(-\d{4})?$')
+
+# Django's email regexes, compiled now rather than lazily on every call
+_EMAIL_USER_RE = re.compile(django_validate_email.user_regex.pattern, django_validate_email.user_regex.flags)
+_EMAIL_DOMAIN_RE = re.compile(django_validate_email.domain_regex.pattern, django_validate_email.domain_regex.flags)
+
+# Pattern kinds reported by the automaton
+KEYBOARD = 1
+SEQUENCE_3 = 2  # 3 consecutive letters or digits, either direction
+SEQUENCE_4 = 4
+
+
+def _sequences(length):
+    patterns = []
+    for alphabet in (string.ascii_lowercase, string.digits):
+        for i in range(len(alphabet) - length + 1):
+            patterns.append(alphabet[i:i + length])
+            patterns.append(alphabet[i:i + length][::-1])
+    return patterns
+
+
+class PatternAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of patterns, each tagged with a
+    kind bit. search() makes one pass over the text and returns the kinds
+    of every pattern that occurs in it.
+    """
+
+    def __init__(self, patterns):
+        trie, kinds = [{}], [0]
+        for pattern, kind in patterns:
+            state = 0
+            for char in pattern:
+                if char not in trie[state]:
+                    trie.append({})
+                    kinds.append(0)
+                    trie[state][char] = len(trie) - 1
+                state = trie[state][char]
+            kinds[state] |= kind
+
+        # Breadth-first, so each state's fallback is complete before its children use it
+        fallback = [0] * len(trie)
+        self.transitions = [dict(trie[0])] + [None] * (len(trie) - 1)
+        queue = deque(trie[0].values())
+        while queue:
+            state = queue.popleft()
+            self.transitions[state] = dict(self.transitions[fallback[state]], **trie[state])
+            for char, child in trie[state].items():
+                fallback[child] = self.transitions[fallback[state]].get(char, 0) if state else 0
+                kinds[child] |= kinds[fallback[child]]
+                queue.append(child)
+        self.kinds = kinds
+
+    def search(self, text, wanted=-1):
+        """Bitmask of the pattern kinds found; stops early once all `wanted` kinds are found"""
+        transitions, kinds = self.transitions, self.kinds
+        state = found = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if kinds[state]:
+                found |= kinds[state]
+                if found & wanted == wanted:
+                    break
+        return found
+
+
+_PATTERNS = PatternAutomaton(
+    [(pattern, KEYBOARD) for pattern in KEYBOARD_PATTERNS]
+    + [(pattern, SEQUENCE_3) for pattern in _sequences(3)]
+    + [(pattern, SEQUENCE_4) for pattern in _sequences(4)]
+)
+
+
+@lru_cache(maxsize=4096)
+def _email_domain_valid(domain_part):
+    """The fast half of Django's domain check (most leads share a few domains)"""
+    return domain_part in django_validate_email.domain_allowlist or bool(_EMAIL_DOMAIN_RE.match(domain_part))
+
+
+@lru_cache(maxsize=4096)
+def _tld(domain):
+    """Lower-cased public suffix of a domain (tldextract is slow and domains repeat)"""
+    suffix = tldextract.extract(domain).suffix
+    return suffix.lower() if suffix else ""
+
+
 def _detect_keyboard_pattern(text):
     """Detect keyboard patterns in text"""
-    text = text.lower()
-    for pattern in KEYBOARD_PATTERNS:
-        if pattern in text:
-            return True
-    return False
+    return bool(_PATTERNS.search(text.lower(), KEYBOARD) & KEYBOARD)
 
 def _detect_sequential_chars(text, length=3):
     """Detect sequential characters in text"""
+    if length == 3:
+        return bool(_PATTERNS.search(text.lower(), SEQUENCE_3) & SEQUENCE_3)
+    if length == 4:
+        return bool(_PATTERNS.search(text.lower(), SEQUENCE_4) & SEQUENCE_4)
     text = text.lower()
-    # Alphanumeric sequence detection
-    alpha = string.ascii_lowercase
-    nums = string.digits
-    
-    # Check for alphabetic sequences
-    for i in range(len(alpha) - length + 1):
-        if alpha[i:i+length] in text:
-            return True
-        if alpha[i:i+length][::-1] in text:  # Reverse sequence
-            return True
-    
-    # Check for numeric sequences
-    for i in range(len(nums) - length + 1):
-        if nums[i:i+length] in text:
-            return True
-        if nums[i:i+length][::-1] in text:  # Reverse sequence
-            return True
-    
-    return False
+    return any(pattern in text for pattern in _sequences(length))
 
 def _detect_repetitive_chars(text, threshold=0.5):
     """Detect repetitive characters in text"""
     if not text or len(text) < 3:
         return False
         
-    # Count character occurrences
-    counter = Counter(text.lower())
-    most_common = counter.most_common(1)[0]
-    
-    # If most common character appears more than threshold % of the time
-    if most_common[1] / len(text) >= threshold:
-        return True
-        
-    # Check for repetitive patterns like "ababab"
-    for pattern_len in range(1, min(5, len(text)//2)):
-        pattern = text[:pattern_len]
-        if pattern * (len(text)//pattern_len) == text[:pattern_len * (len(text)//pattern_len)]:
+    # If most common character appears more than threshold % of the time.
+    # No character can occur more often than the number of repeated
+    # characters allows, so most texts are ruled out without counting.
+    lowered = text.lower()
+    distinct = set(lowered)
+    if (len(lowered) - len(distinct) + 1) / len(text) >= threshold:
+        if max(map(lowered.count, distinct)) / len(text) >= threshold:
             return True
+    
+    # Check for repetitive patterns like "ababab". A pattern of at most 4
+    # characters plus the leftover tail uses at most 7 distinct characters.
+    if len(distinct if lowered == text else set(text)) <= 7:
+        for pattern_len in range(1, min(5, len(text)//2)):
+            repeats = len(text) // pattern_len
+            if text[:pattern_len] * repeats == text[:pattern_len * repeats]:
+                return True
             
     return False
 
@@ -129,6 +241,29 @@ def _check_mx_record(domain):
     except:
         return False
 
+def _phone_digits(phone):
+    """Digits of a phone number; the usual separators are dropped without a regex"""
+    digits = phone.translate(_PHONE_SEPARATORS)
+    if digits.isascii() and digits.isdigit():
+        return digits
+    return _NON_DIGITS.sub('', phone)
+
+def _email_format_valid(email):
+    """
+    Django's validate_email. Addresses the precompiled regexes accept are
+    valid without raising; everything else (IDN and IP-literal domains,
+    invalid addresses) goes through Django itself.
+    """
+    if len(email) <= 320:
+        user_part, domain_part = email.rsplit('@', 1)
+        if _EMAIL_USER_RE.match(user_part) and _email_domain_valid(domain_part):
+            return True
+    try:
+        django_validate_email(email)
+        return True
+    except ValidationError:
+        return False
+
 def validate_email_address(email):
     """
     Enhanced email validation with multiple checks:
@@ -158,34 +293,32 @@ def validate_email_address(email):
         return result
     
     # Use Django's validator
-    try:
-        django_validate_email(email)
-        result['format_valid'] = True
-    except ValidationError:
+    if not _email_format_valid(email):
         result['details'].append("Invalid email format")
         return result
+    result['format_valid'] = True
     
     # Split email parts
     username, domain = email.split('@')
-    domain_parts = tldextract.extract(domain)
-    tld = domain_parts.suffix.lower() if domain_parts.suffix else ""
+    tld = _tld(domain)
     
     # Check for disposable email
-    if domain.lower() in DISPOSABLE_EMAIL_DOMAINS:
+    if domain.lower() in _DISPOSABLE_DOMAINS:
         result['disposable'] = True
         result['details'].append("Disposable email detected")
     
     # Check for suspicious TLD
-    if tld in HIGH_RISK_TLDS:
+    if tld in _HIGH_RISK_TLDS:
         result['high_risk_tld'] = True
         result['details'].append(f"High-risk TLD detected: .{tld}")
     
-    # Check for suspicious patterns in username
-    if _detect_keyboard_pattern(username):
+    # Check for suspicious patterns in username (one pass for both pattern kinds)
+    patterns = _PATTERNS.search(username.lower(), KEYBOARD | SEQUENCE_3)
+    if patterns & KEYBOARD:
         result['suspicious_pattern'] = True
         result['details'].append("Keyboard pattern detected in email username")
     
-    if _detect_sequential_chars(username):
+    if patterns & SEQUENCE_3:
         result['suspicious_pattern'] = True
         result['details'].append("Sequential character pattern detected in email username")
     
@@ -228,10 +361,10 @@ def validate_phone_number(phone):
         return result
     
     # Clean the phone number
-    phone = re.sub(r'[^0-9]', '', phone)
+    phone = _phone_digits(phone)
     
     # Check length (US numbers)
-    is_valid_length = len(phone) in [10, 11]
+    is_valid_length = len(phone) in (10, 11)
     if len(phone) == 11 and not phone.startswith('1'):
         is_valid_length = False
     
@@ -249,19 +382,12 @@ def validate_phone_number(phone):
     area_code = phone[:3]
     
     # Check for obvious fake patterns
-    obvious_fakes = [
-        '1234567890', '0987654321', '1111111111', '2222222222', '3333333333',
-        '4444444444', '5555555555', '6666666666', '7777777777', '8888888888',
-        '9999999999', '0000000000', '1234554321', '9876543210', '1122334455',
-        '9988776655', '1231231234', '4565456545'
-    ]
-    
-    if phone in obvious_fakes:
+    if phone in _OBVIOUS_FAKE_PHONES:
         result['suspicious_pattern'] = True
         result['details'].append("Obviously fake phone number pattern")
     
     # Check for sequential digits
-    if _detect_sequential_chars(phone, 4):
+    if _PATTERNS.search(phone, SEQUENCE_4) & SEQUENCE_4:
         result['suspicious_pattern'] = True
         result['details'].append("Sequential digit pattern detected in phone number")
     
@@ -271,18 +397,17 @@ def validate_phone_number(phone):
         result['details'].append("Repetitive digit pattern detected in phone number")
     
     # Check for high-fraud area code
-    if area_code in HIGH_FRAUD_AREA_CODES:
+    if area_code in _HIGH_FRAUD_AREA_CODES:
         result['high_risk_area_code'] = True
         result['details'].append("High-fraud risk area code detected")
     
     # Check for VOIP number
-    if area_code in VOIP_AREA_CODES:
+    if area_code in _VOIP_AREA_CODES:
         result['voip_number'] = True
         result['details'].append("VOIP number detected")
     
     # Check for toll-free numbers
-    toll_free_codes = ['800', '888', '877', '866', '855', '844', '833']
-    if area_code in toll_free_codes:
+    if area_code in _TOLL_FREE_AREA_CODES:
         result['details'].append("Toll-free number detected")
     
     # Determine overall validity
@@ -319,8 +444,7 @@ def validate_location(zip_code, state=None):
         return result
     
     # Basic US ZIP code validation
-    zip_valid = bool(re.match(r'^\d{5}(-\d{4})?$', zip_code))
-    if not zip_valid:
+    if not _ZIP_RE.match(zip_code):
         result['issue'] = "Invalid ZIP code format"
         result['details'].append("Invalid ZIP code format")
         return result
@@ -330,42 +454,16 @@ def validate_location(zip_code, state=None):
     result['format_valid'] = True
     
     # Check for high-fraud ZIP
-    if zip5 in HIGH_FRAUD_ZIP_CODES:
+    if zip5 in _HIGH_FRAUD_ZIP_CODES:
         result['high_risk_zip'] = True
         result['details'].append("High-fraud risk ZIP code")
     
-    # Check state-ZIP correspondence if state is provided
+    # Check state-ZIP correspondence if state is provided. This is a
+    # simplified example - in a real implementation you'd have a complete
+    # ZIP-to-state mapping
     if state:
-        # This is a simplified example - in a real implementation you'd 
-        # have a complete ZIP-to-state mapping
-        expected_state = None
         state = state.upper()
-        
-        # Simple ZIP prefix check
-        zip_prefix = int(zip5[:1])
-        
-        if zip_prefix == 0:  # 0xxxx
-            expected_state = ['CT', 'MA', 'ME', 'NH', 'NJ', 'PR', 'RI', 'VT']
-        elif zip_prefix == 1:  # 1xxxx
-            expected_state = ['DE', 'NY', 'PA']
-        elif zip_prefix == 2:  # 2xxxx
-            expected_state = ['DC', 'MD', 'NC', 'SC', 'VA', 'WV']
-        elif zip_prefix == 3:  # 3xxxx
-            expected_state = ['AL', 'FL', 'GA', 'MS', 'TN']
-        elif zip_prefix == 4:  # 4xxxx
-            expected_state = ['IN', 'KY', 'MI', 'OH']
-        elif zip_prefix == 5:  # 5xxxx
-            expected_state = ['IA', 'MN', 'MT', 'ND', 'SD', 'WI']
-        elif zip_prefix == 6:  # 6xxxx
-            expected_state = ['IL', 'KS', 'MO', 'NE']
-        elif zip_prefix == 7:  # 7xxxx
-            expected_state = ['AR', 'LA', 'OK', 'TX']
-        elif zip_prefix == 8:  # 8xxxx
-            expected_state = ['AZ', 'CO', 'ID', 'NM', 'NV', 'UT', 'WY']
-        elif zip_prefix == 9:  # 9xxxx
-            expected_state = ['AK', 'CA', 'HI', 'OR', 'WA']
-            
-        if expected_state and state not in expected_state:
+        if state not in _ZIP_PREFIX_STATES[int(zip5[:1])]:
             result['state_mismatch'] = True
             result['details'].append(f"State {state} doesn't match ZIP code {zip5}")
     
@@ -423,12 +521,13 @@ def validate_name(name):
     # Basic format is valid
     result['format_valid'] = True
     
-    # Check for suspicious patterns
-    if _detect_keyboard_pattern(name):
+    # Check for suspicious patterns (name is already lower case)
+    patterns = _PATTERNS.search(name, KEYBOARD | SEQUENCE_3)
+    if patterns & KEYBOARD:
         result['suspicious_pattern'] = True
         result['details'].append("Keyboard pattern detected in name")
     
-    if _detect_sequential_chars(name):
+    if patterns & SEQUENCE_3:
         result['suspicious_pattern'] = True
         result['details'].append("Sequential character pattern detected in name")
     
@@ -437,18 +536,17 @@ def validate_name(name):
         result['details'].append("Repetitive character pattern detected in name")
     
     # Check for known fake names
-    if name in FAKE_NAMES:
+    if name in _FAKE_NAMES:
         result['fake_name'] = True
         result['details'].append("Common fake/test name detected")
     
     # Check for celebrity names
-    if name in CELEBRITY_NAMES:
+    if name in _CELEBRITY_NAMES:
         result['celebrity_name'] = True
         result['details'].append("Celebrity name detected")
     
     # Check for single-character name parts
-    name_parts = name.split()
-    for part in name_parts:
+    for part in name.split():
         if len(part) == 1:
             result['suspicious_pattern'] = True
             result['details'].append("Single-character name part detected")
@@ -462,6 +560,35 @@ def validate_name(name):
     
     return result
 
+def _username_matches_name(username, first_name, last_name):
+    """
+    Whether the email username looks derived from the name: it contains one
+    of the common username patterns (first, last, first.last, flast, ...) or
+    is part of one, optionally followed by a single digit 1-9.
+    """
+    first_initial = first_name[0] if first_name else ''
+    last_initial = last_name[0] if last_name else ''
+    patterns = (
+        first_name,
+        last_name,
+        first_name + last_name,
+        first_name + '.' + last_name,
+        first_name + '_' + last_name,
+        first_initial + last_name,
+        first_name + last_initial,
+        first_initial + '.' + last_name,
+    )
+    for pattern in patterns:
+        if pattern in username or username in pattern:
+            return True
+    # "pattern + digit" contains the username only if the username is a
+    # suffix of the pattern followed by that digit; containing the username
+    # means containing the pattern itself, which was checked above
+    if username and username[-1] in '123456789':
+        stem = username[:-1]
+        return any(pattern.endswith(stem) for pattern in patterns)
+    return False
+
 def validate_cross_fields(email, phone, name, zip_code, ip_address=None):
     """
     Cross-field validation to check for consistency across fields
@@ -475,36 +602,11 @@ def validate_cross_fields(email, phone, name, zip_code, ip_address=None):
     if email and '@' in email and name and ' ' in name:
         username = email.split('@')[0].lower()
         name_parts = name.lower().split()
-        first_name = name_parts[0]
-        last_name = name_parts[-1]
-        
-        # Extract initials
-        first_initial = first_name[0] if first_name else ''
-        last_initial = last_name[0] if last_name else ''
         
-        # Check common username patterns
-        username_patterns = [
-            first_name,
-            last_name,
-            first_name + last_name,
-            first_name + '.' + last_name,
-            first_name + '_' + last_name,
-            first_initial + last_name,
-            first_name + last_initial,
-            first_initial + '.' + last_name
-        ]
-        
-        # Add numeric variations
-        for pattern in username_patterns[:]:
-            for i in range(1, 10):
-                username_patterns.append(pattern + str(i))
-        
-        username_match = any(pattern in username or username in pattern for pattern in username_patterns)
-        
-        if not username_match and len(username) > 3:
+        if not _username_matches_name(username, name_parts[0], name_parts[-1]) and len(username) > 3:
             result['consistent'] = False
             result['issues'].append("Email username doesn't match provided name")
     
     # Advanced checks could be added here (ZIP to IP geolocation, etc.)
     
-    return result 
\ No newline at end of file
+    return result
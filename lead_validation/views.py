@@ -1,22 +1,29 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import json
 import logging
 from lead_capture.models import Lead
-from .utils import validate_and_store_lead_data, check_for_duplicate_lead
+from referral_system.models import ReferralLink
+from . import ai_cache, ai_client
+from .ingest import BulkIngest, IngestError, iter_json_array, iter_ndjson
+from .utils import avalidate_and_store_lead_data, validate_and_store_lead_data
 
 logger = logging.getLogger(__name__)
 
-@api_view(['POST'])
-def validate_lead_api(request):
-    """REST API endpoint for lead validation using our hybrid scoring system"""
-    data = request.data
-    logger.info(f"Received lead validation request: {data.get('email', 'no-email')}")
-    
-    # Create a temporary lead object to leverage the same validation logic
-    temp_lead = Lead(
+def _refresh_requested(request):
+    """?refresh=1 re-asks the model instead of reusing a cached AI assessment"""
+    return request.GET.get('refresh', '').lower() in ('1', 'true', 'yes')
+
+def _temp_lead_from_data(data, request):
+    """Create a temporary (unsaved) lead object to leverage the same validation logic"""
+    return Lead(
         name=data.get('name', ''),
         email=data.get('email', ''),
         phone=data.get('phone', ''),
@@ -27,22 +34,20 @@ def validate_lead_api(request):
         user_agent=data.get('user_agent', request.META.get('HTTP_USER_AGENT')),
         # Don't actually save this to DB
     )
+
+def _format_validation_result(validation_result, results, include_duplicates=True):
+    """Add issues, duplicate info and the final assessment to a response dict"""
+    results.update({
+        'score': validation_result['score'],
+        'max_score': 100,
+        'validations': validation_result['validation_results'],
+        'issues': [],
+    })
     
-    try:
-        # Use our enhanced hybrid validation function
-        validation_result = validate_and_store_lead_data(temp_lead, save_to_db=False)
-        
-        # Format the response to match the API expected format
-        results = {
-            'score': validation_result['score'],
-            'max_score': 100,
-            'issues': [],
-            'validations': validation_result['validation_results'],
-        }
-        
-        # Extract issues from validation results
-        validations = validation_result['validation_results']
-        
+    # Extract issues from validation results
+    validations = validation_result['validation_results']
+    
+    if include_duplicates:
         # Check if this is a duplicate - look for it in both locations
         is_duplicate = False
         if 'duplicate_check' in validations and validations['duplicate_check'].get('is_duplicate', False):
@@ -58,30 +63,51 @@ def validate_lead_api(request):
             results['duplicate_detected'] = True
             results['duplicate_confidence'] = validations['score_breakdown'].get('duplicate_confidence', 0)
             results['issues'].append(f"Duplicate lead detected with {validations['score_breakdown'].get('duplicate_confidence', 0)}% confidence")
-        
-        # Get issues from AI assessment if available
-        if 'ai_assessment' in validations and 'issues' in validations['ai_assessment']:
-            results['issues'].extend(validations['ai_assessment'].get('issues', []))
-        
-        # Add issues from rule-based validation
-        for field in ['email', 'phone', 'location', 'name']:
-            if field in validations and not validations[field].get('valid', False):
-                issue = validations[field].get('issue', f'Invalid {field}')
-                if issue not in results['issues']:
-                    results['issues'].append(issue)
-        
-        # Final assessment
-        if results['score'] < 20:
-            results['assessment'] = "High Risk"
-            results['recommendation'] = "Reject"
-        elif results['score'] < 70:
-            results['assessment'] = "Medium Risk"
-            results['recommendation'] = "Review"
-        else:
-            results['assessment'] = "Low Risk"
-            results['recommendation'] = "Approve"
-        
-        return Response(results)
+    
+    # Get issues from AI assessment if available
+    if 'ai_assessment' in validations and 'issues' in validations['ai_assessment']:
+        results['issues'].extend(validations['ai_assessment'].get('issues', []))
+    
+    # Leads settled by the rule pre-screen carry the rule tier's issues instead
+    tier = validations.get('tier', {})
+    if tier.get('decided_by') == 'rules':
+        results['decided_by'] = 'rules'
+        results['issues'].extend(validations['rule_assessment'].get('issues', []))
+    elif tier:
+        results['decided_by'] = 'ai'
+    
+    # Add issues from rule-based validation
+    for field in ['email', 'phone', 'location', 'name']:
+        if field in validations and not validations[field].get('valid', False):
+            issue = validations[field].get('issue', f'Invalid {field}')
+            if issue not in results['issues']:
+                results['issues'].append(issue)
+    
+    # Final assessment
+    if results['score'] < 20:
+        results['assessment'] = "High Risk"
+        results['recommendation'] = "Reject"
+    elif results['score'] < 70:
+        results['assessment'] = "Medium Risk"
+        results['recommendation'] = "Review"
+    else:
+        results['assessment'] = "Low Risk"
+        results['recommendation'] = "Approve"
+    
+    return results
+
+@api_view(['POST'])
+def validate_lead_api(request):
+    """REST API endpoint for lead validation using our hybrid scoring system"""
+    data = request.data
+    logger.info(f"Received lead validation request: {data.get('email', 'no-email')}")
+    
+    temp_lead = _temp_lead_from_data(data, request)
+    
+    try:
+        # Use our enhanced hybrid validation function
+        validation_result = validate_and_store_lead_data(temp_lead, save_to_db=False)
+        return Response(_format_validation_result(validation_result, {}))
     
     except Exception as e:
         logger.error(f"Error validating lead: {str(e)}")
@@ -90,9 +116,86 @@ def validate_lead_api(request):
             'message': str(e)
         }, status=500)
 
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_ingest_leads(request):
+    """
+    Server-to-server lead ingestion for partner integrations.
+    
+    The body is NDJSON (one lead object per line) or a JSON array of lead
+    objects; both are parsed incrementally. Leads belong to the authenticated
+    user, or to the owner of ?referral_code= when it is one of the caller's
+    links. Returns a summary plus one result per row: created (with lead_id),
+    duplicate (lead_id of the existing lead, or duplicate_of_row within the
+    batch) or invalid (with errors).
+    """
+    referral_link = None
+    referral_code = request.query_params.get('referral_code')
+    if referral_code:
+        referral_link = ReferralLink.objects.filter(code=referral_code, is_active=True).first()
+        if referral_link is None or (referral_link.user_id != request.user.id and not request.user.is_staff):
+            return Response({'error': f'Unknown referral code {referral_code}'}, status=404)
+    
+    content_type = request.content_type.split(';')[0].strip().lower()
+    stream = request.stream
+    if stream is None:
+        return Response({'error': 'Empty request body'}, status=400)
+    if content_type in NDJSON_CONTENT_TYPES:
+        rows = iter_ndjson(stream)
+    elif content_type == 'application/json':
+        rows = iter_json_array(stream)
+    else:
+        return Response({'error': f'Unsupported content type {content_type or "(none)"}; '
+                                  f'send application/json or application/x-ndjson'}, status=415)
+    
+    ingest = BulkIngest(request.user, referral_link=referral_link,
+                        ip_address=request.META.get('REMOTE_ADDR'))
+    try:
+        results = ingest.run(rows)
+    except IngestError as e:
+        logger.warning(f"Bulk ingest by {request.user} stopped: {e}")
+        return Response({'error': str(e), 'summary': ingest.counts, 'results': ingest.results}, status=400)
+    
+    logger.info(f"Bulk ingest by {request.user}: {ingest.counts}")
+    return Response({'summary': ingest.counts, 'results': results})
+
+@csrf_exempt
+@require_POST
+async def validate_lead_api_async(request):
+    """
+    Async variant of validate_lead_api for ASGI deployments. The AI call
+    awaits on the event loop instead of blocking a worker thread while
+    the model responds. Accepts a JSON body.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    logger.info(f"Received async lead validation request: {data.get('email', 'no-email')}")
+    
+    temp_lead = _temp_lead_from_data(data, request)
+    
+    try:
+        validation_result = await avalidate_and_store_lead_data(temp_lead, save_to_db=False)
+        return JsonResponse(_format_validation_result(validation_result, {}))
+    
+    except Exception as e:
+        logger.error(f"Error validating lead: {str(e)}")
+        return JsonResponse({
+            'error': 'Validation failed',
+            'message': str(e)
+        }, status=500)
+
 @login_required
 def validate_existing_lead(request, lead_id):
-    """View to validate an existing lead in the database using our hybrid scoring"""
+    """
+    View to validate an existing lead in the database using our hybrid scoring.
+    Add ?refresh=1 to ignore a cached AI assessment.
+    """
     lead = get_object_or_404(Lead, id=lead_id)
     
     # Check if the current user owns the lead
@@ -101,48 +204,56 @@ def validate_existing_lead(request, lead_id):
     
     try:
         # Use our enhanced hybrid validation function - exactly the same as API endpoint
-        result = validate_and_store_lead_data(lead)
+        result = validate_and_store_lead_data(lead, refresh_ai=_refresh_requested(request))
         
         # Format the response to match the API expected format for consistency
-        response_data = {
-            'success': True,
-            'lead_id': lead.id,
-            'score': result['score'],
-            'max_score': 100,
-            'validations': result['validation_results'],
-            'issues': []
-        }
-        
-        # Extract issues from validation results (same as in API endpoint)
-        validations = result['validation_results']
-        
-        # Get issues from AI assessment if available
-        if 'ai_assessment' in validations and 'issues' in validations['ai_assessment']:
-            response_data['issues'].extend(validations['ai_assessment'].get('issues', []))
-        
-        # Add issues from rule-based validation
-        for field in ['email', 'phone', 'location', 'name']:
-            if field in validations and not validations[field].get('valid', False):
-                issue = validations[field].get('issue', f'Invalid {field}')
-                if issue not in response_data['issues']:
-                    response_data['issues'].append(issue)
-        
-        # Final assessment (same as API endpoint)
-        if result['score'] < 20:
-            response_data['assessment'] = "High Risk"
-            response_data['recommendation'] = "Reject"
-        elif result['score'] < 70:
-            response_data['assessment'] = "Medium Risk"
-            response_data['recommendation'] = "Review"
-        else:
-            response_data['assessment'] = "Low Risk"
-            response_data['recommendation'] = "Approve"
-        
-        return JsonResponse(response_data)
+        response_data = {'success': True, 'lead_id': lead.id}
+        return JsonResponse(_format_validation_result(result, response_data, include_duplicates=False))
     
     except Exception as e:
         logger.error(f"Error validating lead {lead_id}: {str(e)}")
         return JsonResponse({
             'success': False,
             'error': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+async def validate_existing_lead_async(request, lead_id):
+    """Async variant of validate_existing_lead for ASGI deployments"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    
+    try:
+        lead = await Lead.objects.aget(id=lead_id)
+    except Lead.DoesNotExist:
+        raise Http404("No Lead matches the given query.")
+    
+    # Check if the current user owns the lead
+    if lead.agent_id != user.id and not user.is_staff:
+        return JsonResponse({'error': 'You do not have permission to validate this lead'}, status=403)
+    
+    try:
+        result = await avalidate_and_store_lead_data(lead, refresh_ai=_refresh_requested(request))
+        response_data = {'success': True, 'lead_id': lead.id}
+        return JsonResponse(_format_validation_result(result, response_data, include_duplicates=False))
+    
+    except Exception as e:
+        logger.error(f"Error validating lead {lead_id}: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@login_required
+def ai_cache_stats(request):
+    """AI assessment cache counters for this worker process (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    return JsonResponse(ai_cache.ai_cache_stats())
+
+@login_required
+def ai_client_stats(request):
+    """AI client circuit breaker state, call counters and latency percentiles for this process (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    return JsonResponse(ai_client.ai_client_stats())
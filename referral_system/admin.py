@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ReferralLink, PaymentRate
+from .models import ReferralLink, PaymentRate, AgentStats, LinkStats, ReferralClickDaily
 
 @admin.register(ReferralLink)
 class ReferralLinkAdmin(admin.ModelAdmin):
@@ -19,3 +19,23 @@ class PaymentRateAdmin(admin.ModelAdmin):
             return 'Nationwide (Default)'
         return dict(PaymentRate.STATE_CHOICES).get(obj.state)
     get_state_display.short_description = 'State'
+
+@admin.register(AgentStats)
+class AgentStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'leads_total', 'leads_high', 'leads_medium', 'leads_low', 'clicks', 'conversions', 'earnings', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = [field.name for field in AgentStats._meta.fields]
+
+@admin.register(LinkStats)
+class LinkStatsAdmin(admin.ModelAdmin):
+    list_display = ('link', 'leads_total', 'leads_high', 'leads_medium', 'leads_low', 'updated_at')
+    search_fields = ('link__code', 'link__user__username')
+    readonly_fields = [field.name for field in LinkStats._meta.fields]
+
+@admin.register(ReferralClickDaily)
+class ReferralClickDailyAdmin(admin.ModelAdmin):
+    list_display = ('link', 'day', 'clicks', 'unique_visitors')
+    list_filter = ('day',)
+    search_fields = ('link__code',)
+    date_hierarchy = 'day'
+    readonly_fields = ('link', 'day', 'clicks', 'unique_visitors', 'ua_families', 'sources')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReferralSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'referral_system'
+
+    def ready(self):
+        """Connect signal handlers"""
+        import referral_system.signals
@@ -0,0 +1,271 @@
+import atexit
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, time as dt_time, timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLICK_EVENT_SETTINGS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5.0,     # Seconds between automatic flushes
+    'FLUSH_THRESHOLD': 1000,   # Buffered clicks that force an early flush
+    'BATCH_SIZE': 500,         # Rows per INSERT
+    'MAX_PENDING': 50000,      # Clicks kept for retry while flushes fail; older ones are dropped
+    'RETENTION_DAYS': 90,      # Raw events older than this are deleted once rolled up
+}
+
+# Checked in order; the first matching token names the family
+UA_FAMILIES = (
+    ('bot', ('bot', 'crawl', 'spider', 'slurp', 'preview', 'curl', 'wget', 'python-requests')),
+    ('edge', ('edg/',)),
+    ('opera', ('opr/', 'opera')),
+    ('samsung', ('samsungbrowser',)),
+    ('chrome', ('chrome/', 'crios/')),
+    ('firefox', ('firefox/', 'fxios/')),
+    ('safari', ('safari/',)),
+)
+
+
+def get_click_event_settings():
+    """Merge REFERRAL_CLICK_EVENTS from settings over the defaults"""
+    options = dict(DEFAULT_CLICK_EVENT_SETTINGS)
+    options.update(getattr(settings, 'REFERRAL_CLICK_EVENTS', {}))
+    return options
+
+
+def ua_family(user_agent):
+    """Coarse browser family of a User-Agent header"""
+    if not user_agent:
+        return ''
+    user_agent = user_agent.lower()
+    for family, tokens in UA_FAMILIES:
+        if any(token in user_agent for token in tokens):
+            return family
+    return 'other'
+
+
+def hash_ip(ip_address):
+    """Keyed, truncated hash: enough to count unique visitors, useless for recovering the IP"""
+    if not ip_address:
+        return ''
+    return hmac.new(settings.SECRET_KEY.encode(), ip_address.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def click_source(utm_source, referer):
+    """utm_source if the link was tagged, otherwise the referring host"""
+    if utm_source:
+        return utm_source.strip().lower()[:64]
+    if referer:
+        return (urlsplit(referer).hostname or '')[:64]
+    return ''
+
+
+class ClickEventBuffer:
+    """
+    Buffers raw clicks in this process and writes them with bulk_create.
+
+    record() only appends a tuple under a lock; hashing, parsing and the
+    INSERTs happen in flush(), which runs when the buffer reaches the
+    threshold or the interval has passed, and at exit. A crashed worker
+    loses at most one interval of events (ReferralLink.clicks is buffered
+    the same way, see counters.py).
+    """
+
+    def __init__(self):
+        options = get_click_event_settings()
+        self.enabled = options['ENABLED']
+        self.flush_interval = options['FLUSH_INTERVAL']
+        self.flush_threshold = options['FLUSH_THRESHOLD']
+        self.batch_size = options['BATCH_SIZE']
+        self.max_pending = options['MAX_PENDING']
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def record(self, link_id, ip_address='', user_agent='', referer='', utm_source='', occurred_at=None):
+        if not self.enabled:
+            return
+        event = (link_id, occurred_at or timezone.now(), ip_address, user_agent, referer, utm_source)
+        with self._lock:
+            self._pending.append(event)
+            pending = len(self._pending)
+        if pending >= self.flush_threshold or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def record_request(self, link_id, request):
+        meta = request.META
+        self.record(
+            link_id,
+            ip_address=meta.get('REMOTE_ADDR', ''),
+            user_agent=meta.get('HTTP_USER_AGENT', ''),
+            referer=meta.get('HTTP_REFERER', ''),
+            utm_source=request.GET.get('utm_source', ''),
+        )
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _requeue(self, drained):
+        """Put events back after a failed flush, keeping at most max_pending"""
+        with self._lock:
+            self._pending[:0] = drained
+            dropped = len(self._pending) - self.max_pending
+            if dropped > 0:
+                del self._pending[:dropped]
+        if dropped > 0:
+            logger.error(f"Dropped the {dropped} oldest click events; the buffer is full")
+
+    def flush(self):
+        """Write buffered clicks; returns the number of events stored"""
+        from .models import ReferralClickEvent, ReferralLink
+
+        # Only one thread in the process flushes at a time; others keep buffering
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            with self._lock:
+                drained, self._pending = self._pending, []
+            if not drained:
+                return 0
+
+            ua_cache, ip_cache = {}, {}
+            events = []
+            for link_id, occurred_at, ip_address, user_agent, referer, utm_source in drained:
+                if user_agent not in ua_cache:
+                    ua_cache[user_agent] = ua_family(user_agent)
+                if ip_address not in ip_cache:
+                    ip_cache[ip_address] = hash_ip(ip_address)
+                events.append(ReferralClickEvent(
+                    link_id=link_id, occurred_at=occurred_at, ip_hash=ip_cache[ip_address],
+                    ua_family=ua_cache[user_agent], source=click_source(utm_source, referer),
+                ))
+
+            try:
+                with transaction.atomic():
+                    # Clicks on links deleted since are dropped, or their FK would fail every retry
+                    to_pk = ReferralLink._meta.pk.to_python
+                    link_ids = {to_pk(event.link_id) for event in events}
+                    existing = set(ReferralLink.objects.filter(pk__in=link_ids).values_list('pk', flat=True))
+                    if len(existing) < len(link_ids):
+                        kept = [event for event in events if to_pk(event.link_id) in existing]
+                        logger.warning(f"Dropping {len(events) - len(kept)} click events for deleted links")
+                        events = kept
+                    ReferralClickEvent.objects.bulk_create(events, batch_size=self.batch_size)
+            except Exception as e:
+                logger.error(f"Error flushing click events: {str(e)}")
+                self._requeue(drained)
+                return 0
+            return len(events)
+        finally:
+            self._flush_lock.release()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_click_buffer():
+    """Return the process-wide click event buffer, creating it on first use"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ClickEventBuffer()
+    return _buffer
+
+
+def reset_click_buffer():
+    """Discard the current buffer so settings changes take effect (used by tests)"""
+    global _buffer
+    with _buffer_lock:
+        _buffer = None
+
+
+def record_click_event(link_id, request):
+    get_click_buffer().record_request(link_id, request)
+
+
+def flush_click_events():
+    """Flush buffered clicks; safe to call when nothing was buffered"""
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, dt_time.min))
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(day):
+    """
+    Rebuild ReferralClickDaily for one (local) day from the raw events.
+    Idempotent: the day's rows are replaced, so it can be rerun for late events.
+    A day with no raw events left (purged) keeps its rows. Returns the number
+    of links with clicks that day.
+    """
+    from .models import ReferralClickDaily, ReferralClickEvent
+
+    start, end = _day_bounds(day)
+    events = ReferralClickEvent.objects.filter(occurred_at__gte=start, occurred_at__lt=end).order_by()
+
+    totals = {
+        row['link_id']: row
+        for row in events.values('link_id').annotate(clicks=Count('id'), unique_visitors=Count('ip_hash', distinct=True))
+    }
+    families, sources = defaultdict(Counter), defaultdict(Counter)
+    for row in events.values('link_id', 'ua_family').annotate(n=Count('id')):
+        families[row['link_id']][row['ua_family'] or 'unknown'] = row['n']
+    for row in events.values('link_id', 'source').annotate(n=Count('id')):
+        sources[row['link_id']][row['source'] or 'direct'] = row['n']
+    if not totals:
+        return 0
+
+    with transaction.atomic():
+        ReferralClickDaily.objects.filter(day=day).delete()
+        ReferralClickDaily.objects.bulk_create([
+            ReferralClickDaily(
+                link_id=link_id, day=day, clicks=row['clicks'], unique_visitors=row['unique_visitors'],
+                ua_families=dict(families[link_id]), sources=dict(sources[link_id]),
+            )
+            for link_id, row in totals.items()
+        ], batch_size=500)
+    return len(totals)
+
+
+def purge_click_events(retention_days, rolled_up_through):
+    """
+    Delete raw events older than retention_days, but never events from days
+    after `rolled_up_through` (their daily rows would be lost). Whole days are
+    deleted, so a rerun rollup never rebuilds a day from part of its events.
+    Returns the count.
+    """
+    from .models import ReferralClickEvent
+
+    cutoff = _day_bounds(timezone.localdate() - timedelta(days=retention_days))[0]
+    cutoff = min(cutoff, _day_bounds(rolled_up_through)[1])
+    deleted, _ = ReferralClickEvent.objects.filter(occurred_at__lt=cutoff).delete()
+    return deleted
+
+
+def _flush_on_exit():
+    try:
+        flush_click_events()
+    except Exception as e:
+        logger.error(f"Error flushing click events on shutdown: {str(e)}")
+
+
+atexit.register(_flush_on_exit)
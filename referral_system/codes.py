@@ -0,0 +1,169 @@
+import hashlib
+import hmac
+import string
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# Allocated codes are always 7 characters. Codes from the old random
+# generator are 8, so the two can never collide.
+CODE_LENGTH = 7
+ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+# Sequence numbers are permuted within 2**40 values (62**7 > 2**40, so every
+# one fits in CODE_LENGTH characters)
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+CODE_SPACE = 1 << (2 * HALF_BITS)
+ROUNDS = 6
+
+# Sequence numbers reserved per database round trip
+BLOCK_SIZE = 100
+
+SEQUENCE_NAME = 'referral_code'
+
+
+class CodeSpaceExhausted(Exception):
+    """Every sequence number in the code space has been issued"""
+
+
+def _key():
+    """Permutation key. REFERRAL_CODE_KEY must never change once codes are issued"""
+    secret = getattr(settings, 'REFERRAL_CODE_KEY', None) or settings.SECRET_KEY
+    return hashlib.sha256(f'referral-codes:{secret}'.encode()).digest()
+
+
+def key_fingerprint():
+    return hashlib.sha256(_key()).hexdigest()[:16]
+
+
+def _round(key, number, half):
+    digest = hmac.new(key, bytes([number]) + half.to_bytes(3, 'big'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:3], 'big') & HALF_MASK
+
+
+def permute(value, key=None):
+    """
+    Keyed bijection on [0, CODE_SPACE): a balanced Feistel network, so
+    distinct sequence numbers always give distinct results while consecutive
+    ones look unrelated.
+    """
+    key = key or _key()
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for number in range(ROUNDS):
+        left, right = right, left ^ _round(key, number, right)
+    return (left << HALF_BITS) | right
+
+
+def encode(value):
+    """Fixed-width base62"""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, 62)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def code_for(sequence_number, key=None):
+    return encode(permute(sequence_number, key))
+
+
+def _reserve(count):
+    """
+    Claim `count` sequence numbers; returns (start, end). The UPDATE takes
+    the row's write lock first, so concurrent reservations never overlap.
+    """
+    from .models import ReferralCodeSequence
+
+    fingerprint = key_fingerprint()
+    with transaction.atomic():
+        updated = ReferralCodeSequence.objects.filter(name=SEQUENCE_NAME).update(
+            next_value=F('next_value') + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    ReferralCodeSequence.objects.create(name=SEQUENCE_NAME, next_value=count,
+                                                        key_fingerprint=fingerprint)
+            except IntegrityError:
+                # Created concurrently
+                ReferralCodeSequence.objects.filter(name=SEQUENCE_NAME).update(
+                    next_value=F('next_value') + count)
+        sequence = ReferralCodeSequence.objects.get(name=SEQUENCE_NAME)
+        if not sequence.key_fingerprint:
+            ReferralCodeSequence.objects.filter(name=SEQUENCE_NAME).update(key_fingerprint=fingerprint)
+        elif sequence.key_fingerprint != fingerprint:
+            raise ImproperlyConfigured(
+                'REFERRAL_CODE_KEY (or SECRET_KEY) changed since referral codes were issued; '
+                'restore it, or new codes may collide with existing ones'
+            )
+    end = sequence.next_value
+    if end > CODE_SPACE:
+        raise CodeSpaceExhausted(f'{SEQUENCE_NAME} has issued all {CODE_SPACE} codes')
+    return end - count, end
+
+
+class CodeAllocator:
+    """
+    Issues unique referral codes without checking the links table.
+
+    Each process reserves blocks of sequence numbers with one UPDATE and
+    hands them out from memory; codes are the permuted sequence numbers.
+    The unused rest of a block only becomes available to later calls once
+    the transaction that reserved it commits: if it rolls back, the
+    reservation is undone and the rest of the block is dropped with it.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._ranges = []
+
+    def _release(self, start, end):
+        with self._lock:
+            self._ranges.append((start, end))
+
+    def allocate(self, count=1):
+        numbers = []
+        with self._lock:
+            while self._ranges and len(numbers) < count:
+                start, end = self._ranges.pop()
+                take = min(end - start, count - len(numbers))
+                numbers.extend(range(start, start + take))
+                if start + take < end:
+                    self._ranges.append((start + take, end))
+
+        missing = count - len(numbers)
+        if missing:
+            start, end = _reserve(max(self.block_size, missing))
+            numbers.extend(range(start, start + missing))
+            if start + missing < end:
+                transaction.on_commit(lambda: self._release(start + missing, end))
+
+        key = _key()
+        return [code_for(number, key) for number in numbers]
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    """Return the process-wide allocator, creating it on first use"""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = CodeAllocator()
+    return _allocator
+
+
+def allocate_codes(count):
+    """`count` new, unique referral codes"""
+    return get_allocator().allocate(count)
+
+
+def allocate_code():
+    return allocate_codes(1)[0]
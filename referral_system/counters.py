@@ -0,0 +1,320 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Fields on ReferralLink that are buffered instead of written on every request
+COUNTER_FIELDS = ('clicks', 'visits', 'conversions')
+
+DEFAULT_COUNTER_SETTINGS = {
+    'BACKEND': 'local',        # 'local' (per-process) or 'cache' (shared Django cache)
+    'CACHE_ALIAS': 'default',  # Cache used by the 'cache' backend
+    'FLUSH_INTERVAL': 5.0,     # Seconds between automatic flushes (None: only on requests and exit)
+    'FLUSH_THRESHOLD': 100,    # Pending increments that force an early flush
+}
+
+
+def get_counter_settings():
+    """Merge REFERRAL_COUNTERS from settings over the defaults"""
+    options = dict(DEFAULT_COUNTER_SETTINGS)
+    options.update(getattr(settings, 'REFERRAL_COUNTERS', {}))
+    return options
+
+
+class LocalCounterBuffer:
+    """Buffers increments in this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._total = 0
+
+    def add(self, link_id, field, amount):
+        with self._lock:
+            self._pending[(str(link_id), field)] += amount
+            self._total += amount
+            return self._total
+
+    def drain(self):
+        """Remove and return every pending increment"""
+        with self._lock:
+            pending = dict(self._pending)
+            self._pending.clear()
+            self._total = 0
+        return pending
+
+    def restore(self, pending):
+        """Put drained increments back after a failed flush"""
+        with self._lock:
+            for key, amount in pending.items():
+                self._pending[key] += amount
+                self._total += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._pending)
+
+
+class CacheCounterBuffer:
+    """
+    Buffers increments in a shared Django cache so every worker on the host
+    (and the management commands) see the same pending totals.
+
+    Counts use cache.incr/decr so concurrent writers never lose increments.
+    The set of links with pending counts is kept in an index key guarded by
+    a short cache.add() lock. Draining holds a second cache.add() lock, so
+    two processes flushing at once cannot both claim the same increments.
+    """
+    INDEX_KEY = 'referral_counters:index'
+    LOCK_KEY = 'referral_counters:index_lock'
+    DRAIN_LOCK_KEY = 'referral_counters:drain_lock'
+    DRAIN_LOCK_TIMEOUT = 60
+    # Seconds a link is known to be in the index; re-registering it afterwards
+    # recovers from an evicted index key
+    SEEN_TIMEOUT = 3600
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+        self._lock = threading.Lock()
+        self._unregistered = set()
+
+    def _key(self, link_id, field):
+        return f"referral_counters:{link_id}:{field}"
+
+    def _add_to_index(self, link_id):
+        for _ in range(50):
+            if self.cache.add(self.LOCK_KEY, 1, timeout=5):
+                try:
+                    index = self.cache.get(self.INDEX_KEY, set())
+                    index.add(str(link_id))
+                    self.cache.set(self.INDEX_KEY, index, timeout=None)
+                finally:
+                    self.cache.delete(self.LOCK_KEY)
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _register(self, link_id):
+        seen_key = f"referral_counters:seen:{link_id}"
+        if self.cache.get(seen_key):
+            return
+        # Only marked as seen once it is in the index
+        if self._add_to_index(link_id):
+            self.cache.set(seen_key, 1, timeout=self.SEEN_TIMEOUT)
+            return
+        # Could not get the lock - the next drain in this process tries again
+        with self._lock:
+            self._unregistered.add(str(link_id))
+        logger.warning(f"Could not register pending counters for link {link_id}")
+
+    def add(self, link_id, field, amount):
+        key = self._key(link_id, field)
+        self.cache.add(key, 0, timeout=None)
+        total = self.cache.incr(key, amount)
+        self._register(link_id)
+        return total
+
+    def _read(self, consume):
+        index = self.cache.get(self.INDEX_KEY, set())
+        pending = {}
+        for link_id in index:
+            for field in COUNTER_FIELDS:
+                key = self._key(link_id, field)
+                amount = self.cache.get(key) or 0
+                if amount:
+                    if consume:
+                        # decr keeps any increments that landed after the read
+                        self.cache.decr(key, amount)
+                    pending[(link_id, field)] = amount
+        return pending
+
+    def drain(self):
+        """Claim every pending increment, or return {} while another process drains"""
+        with self._lock:
+            retry, self._unregistered = self._unregistered, set()
+        for link_id in retry:
+            self._register(link_id)
+
+        if not self.cache.add(self.DRAIN_LOCK_KEY, 1, timeout=self.DRAIN_LOCK_TIMEOUT):
+            return {}
+        try:
+            return self._read(consume=True)
+        finally:
+            self.cache.delete(self.DRAIN_LOCK_KEY)
+
+    def restore(self, pending):
+        for (link_id, field), amount in pending.items():
+            self.add(link_id, field, amount)
+
+    def snapshot(self):
+        return self._read(consume=False)
+
+
+class ReferralCounters:
+    """
+    Write-behind counters for ReferralLink.
+
+    Increments are buffered and periodically written as one
+    UPDATE ... SET clicks = clicks + n per link, so hot links no longer
+    turn into a read-modify-write hotspot.
+
+    A daemon thread flushes every FLUSH_INTERVAL seconds, so an idle
+    process doesn't hold counts until its next request or its exit; a
+    process killed outright (SIGKILL, OOM) loses at most that interval's
+    counts with the local backend.
+    """
+
+    def __init__(self):
+        options = get_counter_settings()
+        if options['BACKEND'] == 'cache':
+            self.buffer = CacheCounterBuffer(options['CACHE_ALIAS'])
+        else:
+            self.buffer = LocalCounterBuffer()
+        self.flush_interval = options['FLUSH_INTERVAL']
+        self.flush_threshold = options['FLUSH_THRESHOLD']
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _start_flusher(self):
+        # Threads don't survive a fork, so a worker forked after the first
+        # record starts its own
+        with self._flusher_lock:
+            if self._stopped.is_set() or (self._flusher is not None and self._flusher.is_alive()):
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name='referral-counters', daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush < self.flush_interval:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing referral counters in the background: {str(e)}")
+            finally:
+                # Don't leak this thread's connection between flushes
+                connection.close()
+
+    def stop(self):
+        """Stop the background flushes (pending increments stay buffered)"""
+        self._stopped.set()
+
+    def record(self, link_id, field, amount=1):
+        """Buffer an increment, flushing if the interval or threshold is reached"""
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"Unknown counter field: {field}")
+        pending = self.buffer.add(link_id, field, amount)
+        if self.flush_interval and (self._flusher is None or not self._flusher.is_alive()):
+            self._start_flusher()
+        if pending >= self.flush_threshold or \
+                (self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def pending(self):
+        """Return pending increments grouped by link: {link_id: {field: n}}"""
+        grouped = defaultdict(dict)
+        for (link_id, field), amount in self.buffer.snapshot().items():
+            grouped[link_id][field] = amount
+        return dict(grouped)
+
+    def flush(self):
+        """Write all pending increments to the database as atomic F() updates"""
+        from .models import ReferralLink
+        from .stats import apply_agent_delta
+
+        # Only one thread in the process flushes at a time; others keep buffering
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            drained = self.buffer.drain()
+            if not drained:
+                return 0
+
+            grouped = defaultdict(dict)
+            for (link_id, field), amount in drained.items():
+                grouped[link_id][field] = amount
+
+            try:
+                with transaction.atomic():
+                    for link_id, fields in grouped.items():
+                        ReferralLink.objects.filter(pk=link_id).update(
+                            **{field: F(field) + amount for field, amount in fields.items()}
+                        )
+                    # The agent stats rows carry the same totals summed over each agent's links
+                    owners = ReferralLink.objects.filter(pk__in=grouped.keys()).values_list('pk', 'user_id')
+                    by_agent = defaultdict(Counter)
+                    for link_id, user_id in owners:
+                        by_agent[user_id].update(grouped[str(link_id)])
+                    for user_id, fields in by_agent.items():
+                        apply_agent_delta(user_id, fields)
+            except Exception as e:
+                logger.error(f"Error flushing referral counters: {str(e)}")
+                self.buffer.restore(drained)
+                return 0
+
+            logger.info(f"Flushed referral counters for {len(grouped)} links")
+            return len(grouped)
+        finally:
+            self._flush_lock.release()
+
+
+_counters = None
+_counters_lock = threading.Lock()
+
+
+def get_counters():
+    """Return the process-wide counter instance, creating it on first use"""
+    global _counters
+    if _counters is None:
+        with _counters_lock:
+            if _counters is None:
+                _counters = ReferralCounters()
+    return _counters
+
+
+def reset_counters():
+    """Discard the current instance so settings changes take effect (used by tests)"""
+    global _counters
+    with _counters_lock:
+        counters, _counters = _counters, None
+    if counters is not None:
+        counters.stop()
+
+
+def record_click(link_id):
+    get_counters().record(link_id, 'clicks')
+
+
+def record_visit(link_id):
+    get_counters().record(link_id, 'visits')
+
+
+def flush_counters():
+    """Flush pending increments; safe to call when nothing was buffered"""
+    if _counters is None:
+        return 0
+    return _counters.flush()
+
+
+def _flush_on_exit():
+    try:
+        flush_counters()
+    except Exception as e:
+        logger.error(f"Error flushing referral counters on shutdown: {str(e)}")
+
+
+# Guarantee buffered increments reach the database when the worker shuts down
+atexit.register(_flush_on_exit)
@@ -0,0 +1,186 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from lead_capture.models import Lead
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# Rows fetched per database round trip; memory use is bounded by this, not by the export size
+EXPORT_CHUNK_SIZE = 2000
+
+CURSOR_HEADER = 'X-Export-Cursor'
+
+# Exportable columns: output name -> ORM lookup
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'name': 'name',
+    'email': 'email',
+    'phone': 'phone',
+    'address': 'address',
+    'state': 'state',
+    'zip_code': 'zip_code',
+    'insurance_type': 'insurance_type',
+    'status': 'status',
+    'preferred_contact_method': 'preferred_contact_method',
+    'preferred_time': 'preferred_time',
+    'notes': 'notes',
+    'validation_score': 'validation_score',
+    'validation_timestamp': 'validation_timestamp',
+    'reward_amount': 'reward_amount',
+    'referral_code': 'referral_link__code',
+    'vehicle_vin': 'vehicle_vin',
+    'vehicle_year': 'vehicle_year',
+    'vehicle_make': 'vehicle_make',
+    'vehicle_model': 'vehicle_model',
+    'date_of_birth': 'date_of_birth',
+    'current_insurer': 'current_insurer',
+    'property_type': 'property_type',
+    'ownership_status': 'ownership_status',
+    'year_built': 'year_built',
+    'square_footage': 'square_footage',
+    'business_name': 'business_name',
+    'industry': 'industry',
+    'num_employees': 'num_employees',
+    'annual_revenue': 'annual_revenue',
+}
+
+DEFAULT_COLUMNS = [
+    'id', 'created_at', 'updated_at', 'name', 'email', 'phone', 'state', 'zip_code',
+    'insurance_type', 'status', 'validation_score', 'referral_code',
+]
+
+
+class ExportError(ValueError):
+    """Invalid export parameters"""
+
+
+def _parse_bound(value, name, end_of_day=False):
+    """A date (whole day) or ISO datetime query parameter"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ExportError(f"{name} must be a date (YYYY-MM-DD) or ISO datetime")
+        moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_export_params(params):
+    """Validate query parameters into (format, columns, filters Q, cursor)"""
+    export_format = params.get('format', 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        raise ExportError("format must be csv or ndjson")
+
+    columns = [column.strip() for column in params.get('columns', '').split(',') if column.strip()]
+    columns = columns or DEFAULT_COLUMNS
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        raise ExportError(f"Unknown columns: {', '.join(unknown)}")
+
+    filters = Q()
+    if params.get('status'):
+        statuses = [status.strip() for status in params['status'].split(',') if status.strip()]
+        valid = {choice for choice, _ in Lead.STATUS_CHOICES}
+        invalid = [status for status in statuses if status not in valid]
+        if invalid:
+            raise ExportError(f"Unknown status: {', '.join(invalid)}")
+        filters &= Q(status__in=statuses)
+    if params.get('created_from'):
+        filters &= Q(created_at__gte=_parse_bound(params['created_from'], 'created_from'))
+    if params.get('created_to'):
+        filters &= Q(created_at__lt=_parse_bound(params['created_to'], 'created_to', end_of_day=True))
+
+    try:
+        cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+    except InvalidCursor as e:
+        raise ExportError(str(e))
+    return export_format, columns, filters, cursor
+
+
+def _format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() returns the line for StreamingHttpResponse"""
+    def write(self, value):
+        return value
+
+
+# Leading characters that make spreadsheets read a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    """
+    A CSV cell. Lead fields are visitor input, so text that a spreadsheet
+    would run as a formula is prefixed with ' (numbers, dates and Decimals
+    are left as they are).
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+    return _format_value(value)
+
+
+def _csv_rows(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def _ndjson_rows(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, map(_format_value, row)))) + '\n'
+
+
+def stream_leads(leads, params, filename):
+    """
+    StreamingHttpResponse exporting `leads` as CSV or NDJSON.
+
+    Leads are ordered by (updated_at, id) and read with iterator(), so memory
+    stays flat however many leads there are. The export stops at the newest
+    lead present when it started; that position is returned in the
+    X-Export-Cursor header, and passing it back as ?cursor= exports only
+    leads created or changed since.
+    """
+    export_format, columns, filters, cursor = parse_export_params(params)
+    leads = leads.filter(filters)
+    if cursor:
+        updated_at, lead_id = cursor
+        leads = leads.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=lead_id))
+
+    # Upper bound of this export and the cursor for the next one
+    newest = leads.order_by('-updated_at', '-id').values_list('updated_at', 'id').first()
+    if newest:
+        leads = leads.filter(Q(updated_at__lt=newest[0]) | Q(updated_at=newest[0], id__lte=newest[1]))
+        next_cursor = encode_cursor(*newest)
+    else:
+        next_cursor = params.get('cursor', '')
+
+    rows = (
+        leads.order_by('updated_at', 'id')
+        .values_list(*[EXPORT_COLUMNS[column] for column in columns])
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    if export_format == 'csv':
+        response = StreamingHttpResponse(_csv_rows(columns, rows), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(_ndjson_rows(columns, rows), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    response[CURSOR_HEADER] = next_cursor
+    return response
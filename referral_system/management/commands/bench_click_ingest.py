@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from referral_system.clicks import ClickEventBuffer, rollup_day
+from referral_system.models import ReferralClickEvent, ReferralLink
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+]
+REFERERS = ['', 'https://www.facebook.com/', 'https://www.google.com/search?q=insurance', 'https://t.co/abc']
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = (
+        'Measures click logging throughput: buffered record() calls plus the batched inserts, '
+        'then one daily rollup. Everything is rolled back at the end; run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clicks', type=int, default=100000)
+        parser.add_argument('--links', type=int, default=100)
+        parser.add_argument('--target', type=int, default=10000, help='Clicks per second to compare against')
+
+    def handle(self, *args, **options):
+        if options['clicks'] <= 0 or options['links'] <= 0:
+            raise CommandError('--clicks and --links must be positive')
+
+        try:
+            with transaction.atomic():
+                agent = User.objects.create(username=f'bench-{time.time_ns()}')
+                links = ReferralLink.objects.bulk_create([
+                    ReferralLink(user=agent, code=f'bc{time.time_ns() % 10**8}{n}', name=f'Bench {n}')
+                    for n in range(options['links'])
+                ])
+                link_ids = [link.pk for link in links]
+
+                # Flush by size only, so the timing covers every insert
+                buffer = ClickEventBuffer()
+                buffer.flush_interval = float('inf')
+                now = timezone.now()
+                started = time.perf_counter()
+                for n in range(options['clicks']):
+                    buffer.record(
+                        link_ids[n % len(link_ids)],
+                        ip_address=f'10.{n % 251}.{n % 241}.{n % 239}',
+                        user_agent=USER_AGENTS[n % len(USER_AGENTS)],
+                        referer=REFERERS[n % len(REFERERS)],
+                        occurred_at=now - timedelta(seconds=n % 3600),
+                    )
+                buffer.flush()
+                elapsed = time.perf_counter() - started
+
+                rate = options['clicks'] / elapsed
+                style = self.style.SUCCESS if rate >= options['target'] else self.style.WARNING
+                self.stdout.write(style(
+                    f'Logged {ReferralClickEvent.objects.count()} clicks in {elapsed:.2f}s '
+                    f'({rate:.0f} clicks/s, target {options["target"]})'
+                ))
+
+                started = time.perf_counter()
+                for day in {timezone.localdate(now), timezone.localdate(now - timedelta(hours=1))}:
+                    rollup_day(day)
+                self.stdout.write(f'Daily rollup took {time.perf_counter() - started:.2f}s')
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write('Rolled back synthetic clicks')
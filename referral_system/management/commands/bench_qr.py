@@ -0,0 +1,52 @@
+import statistics
+import time
+from io import BytesIO
+import qrcode
+from django.core.management.base import BaseCommand, CommandError
+from referral_system.qr import BORDER, ERROR_LEVELS, qr_matrix, render_png, render_svg
+
+def legacy_png(url, size, error_level):
+    """The previous path: qrcode's PIL image factory drawing every module"""
+    qr = qrcode.QRCode(error_correction=ERROR_LEVELS[error_level], border=BORDER)
+    qr.add_data(url)
+    qr.make(fit=True)
+    qr.box_size = max(1, size // (qr.modules_count + 2 * BORDER))
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def matrix_png(url, size, error_level):
+    return render_png(qr_matrix(url, error_level), size)
+
+def matrix_svg(url, size, error_level):
+    return render_svg(qr_matrix(url, error_level), size)
+
+RENDERERS = [('legacy PNG (PIL)', legacy_png), ('matrix PNG', matrix_png), ('SVG', matrix_svg)]
+
+class Command(BaseCommand):
+    help = 'Compares QR rendering latency and output size: the legacy PIL PNG path, matrix PNG and SVG'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='370,1200,2400,4000', help='Comma-separated pixel sizes')
+        parser.add_argument('--ecc', default='M', choices=list(ERROR_LEVELS))
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--url', default='https://insuraloop.example.com/referrals/ref/AbC123xY/')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        if options['repeat'] <= 0:
+            raise CommandError('--repeat must be positive')
+
+        self.stdout.write(f'{"size":>6}  {"renderer":<18} {"median ms":>10} {"bytes":>10}')
+        for size in sizes:
+            for name, render in RENDERERS:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    data = render(options['url'], size, options['ecc'])
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(f'{size:>6}  {name:<18} {statistics.median(timings):>10.1f} {len(data):>10}')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from referral_system.counters import LocalCounterBuffer, get_counters
+from referral_system.models import ReferralLink
+from referral_system.stats import rebuild_agent_stats
+
+class Command(BaseCommand):
+    help = 'Compares buffered referral counters with the database and optionally flushes them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Flush buffered increments to the database after the check',
+        )
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Reset conversions to the actual number of leads for links that disagree',
+        )
+
+    def handle(self, *args, **options):
+        counters = get_counters()
+        pending = counters.pending()
+
+        if not pending:
+            self.stdout.write('No buffered increments visible to this process')
+            if isinstance(counters.buffer, LocalCounterBuffer):
+                self.stdout.write(self.style.WARNING(
+                    'REFERRAL_COUNTERS uses the local backend; buffers held by running workers '
+                    'are not visible here. Use the cache backend to inspect them.'
+                ))
+
+        # Show buffered totals next to the stored values
+        links = ReferralLink.objects.filter(pk__in=pending.keys()).only('code', 'clicks', 'visits', 'conversions')
+        for link in links:
+            fields = pending.get(str(link.pk), {})
+            parts = [
+                f"{field}={getattr(link, field)}+{fields.get(field, 0)}"
+                for field in ('clicks', 'visits', 'conversions')
+            ]
+            self.stdout.write(f"{link.code}: {', '.join(parts)}")
+
+        # Conversions can be checked against the leads that were actually captured
+        mismatched = 0
+        links = ReferralLink.objects.annotate(lead_count=Count('leads')).only('code', 'user_id', 'conversions')
+        for link in links:
+            buffered = pending.get(str(link.pk), {}).get('conversions', 0)
+            expected = link.conversions + buffered
+            if expected != link.lead_count:
+                mismatched += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{link.code}: conversions {link.conversions} (+{buffered} buffered) "
+                    f"but {link.lead_count} leads"
+                ))
+                if options['repair']:
+                    ReferralLink.objects.filter(pk=link.pk).update(conversions=max(0, link.lead_count - buffered))
+                    rebuild_agent_stats(link.user_id)
+
+        if mismatched:
+            action = 'Repaired' if options['repair'] else 'Found'
+            self.stdout.write(self.style.WARNING(f'{action} {mismatched} links with inconsistent conversions'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Buffered and stored conversions are consistent'))
+
+        if options['flush']:
+            flushed = counters.flush()
+            self.stdout.write(self.style.SUCCESS(f'Flushed counters for {flushed} links'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from referral_system.models import ReferralLink
+from referral_system.qr import prerender_link_qr, prune_stale_namespaces
+
+class Command(BaseCommand):
+    help = (
+        'Renders the QR code of every active referral link into the QR cache and deletes codes '
+        'rendered for a previous SITE_URL. Run it after changing SITE_URL.'
+    )
+
+    def handle(self, *args, **options):
+        removed = prune_stale_namespaces()
+        if removed:
+            self.stdout.write(f'Removed QR codes for {removed} previous SITE_URL values')
+
+        rendered = failed = 0
+        for link in ReferralLink.objects.filter(is_active=True).only('code').iterator(chunk_size=1000):
+            if prerender_link_qr(link):
+                rendered += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'QR codes cached for {rendered} links'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} links failed to render, see the log'))
@@ -0,0 +1,51 @@
+import time
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from referral_system.provisioning import ProvisioningError, iter_zip, parse_rows, provision_links, render_link_qrs
+from referral_system.qr import ERROR_LEVELS, CONTENT_TYPES, DEFAULT_ERROR_LEVEL
+
+class Command(BaseCommand):
+    help = 'Creates referral links for an agent from a CSV or JSON file and writes a ZIP of their QR codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Agent who will own the links')
+        parser.add_argument('file', help='CSV with a header row, or a .json array of link objects')
+        parser.add_argument('--output', help='ZIP file to write (default: <file>.zip)')
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='png')
+        parser.add_argument('--size', type=int, help='QR size in pixels')
+        parser.add_argument('--ecc', choices=list(ERROR_LEVELS), default=DEFAULT_ERROR_LEVEL)
+        parser.add_argument('--workers', type=int, help='QR rendering processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+
+        source = Path(options['file'])
+        if not source.is_file():
+            raise CommandError(f'{source} not found')
+        content_type = 'application/json' if source.suffix.lower() == '.json' else 'text/csv'
+        output = Path(options['output'] or source.with_suffix('.zip'))
+
+        try:
+            started = time.perf_counter()
+            links = provision_links(user, parse_rows(source.read_bytes(), content_type))
+        except ProvisioningError as e:
+            for error in e.errors:
+                self.stderr.write(error)
+            raise CommandError('No links were created')
+        created = time.perf_counter()
+
+        paths = render_link_qrs(links, options['format'], options['size'], options['ecc'], options['workers'])
+        rendered = time.perf_counter()
+
+        with open(output, 'wb') as f:
+            for chunk in iter_zip(links, paths, options['format']):
+                f.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(links)} links for {user.username} in {created - started:.2f}s, '
+            f'rendered QR codes in {rendered - created:.2f}s; wrote {output}'
+        ))
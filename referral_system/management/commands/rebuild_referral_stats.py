@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from referral_system.counters import flush_counters
+from referral_system.stats import reconcile_stats
+
+class Command(BaseCommand):
+    help = 'Recomputes the AgentStats/LinkStats rollup from leads and referral links and repairs rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drifted rows, do not rewrite them',
+        )
+
+    def handle(self, *args, **options):
+        # Buffered counter increments belong in both the links and the stats
+        flush_counters()
+
+        agents, links = reconcile_stats(fix=not options['check'])
+        if not agents and not links:
+            self.stdout.write(self.style.SUCCESS('Referral stats match the source tables'))
+            return
+
+        action = 'Found' if options['check'] else 'Rebuilt'
+        self.stdout.write(self.style.WARNING(
+            f'{action} {len(agents)} agent and {len(links)} link stats rows that had drifted'
+        ))
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from referral_system.clicks import flush_click_events, get_click_event_settings, purge_click_events, rollup_day
+from referral_system.models import ReferralClickDaily, ReferralClickEvent
+
+class Command(BaseCommand):
+    help = (
+        'Builds daily per-link click rollups from the raw click log, then deletes raw events '
+        'older than the retention period. Run it at least daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to (re)build, YYYY-MM-DD (default: last rolled-up day)')
+        parser.add_argument('--retention-days', type=int,
+                            help='Keep raw events this many days (default: REFERRAL_CLICK_EVENTS RETENTION_DAYS)')
+        parser.add_argument('--keep-raw', action='store_true', help='Skip the retention purge')
+
+    def handle(self, *args, **options):
+        # Clicks buffered by this process belong in the rollup too
+        flush_click_events()
+        today = timezone.localdate()
+
+        if options['since']:
+            start = parse_date(options['since'])
+            if start is None:
+                raise CommandError('--since must be a date (YYYY-MM-DD)')
+        else:
+            # Resume at the last rolled-up day (it may have been partial), or at the oldest event
+            start = ReferralClickDaily.objects.aggregate(day=Max('day'))['day']
+            if start is None:
+                oldest = ReferralClickEvent.objects.aggregate(at=Min('occurred_at'))['at']
+                start = timezone.localdate(oldest) if oldest else today
+
+        day = start
+        while day <= today:
+            links = rollup_day(day)
+            if links:
+                self.stdout.write(f'{day}: {links} links')
+            day += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up clicks from {start} to {today}'))
+
+        if options['keep_raw']:
+            return
+        retention_days = options['retention_days']
+        if retention_days is None:
+            retention_days = get_click_event_settings()['RETENTION_DAYS']
+        if retention_days < 1:
+            raise CommandError('--retention-days must be at least 1')
+        deleted = purge_click_events(retention_days, rolled_up_through=today)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} raw click events older than {retention_days} days'))
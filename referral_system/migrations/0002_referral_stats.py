@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('referral_system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentStats',
+            fields=[
+                ('leads_total', models.PositiveIntegerField(default=0)),
+                ('leads_new', models.PositiveIntegerField(default=0)),
+                ('leads_contacted', models.PositiveIntegerField(default=0)),
+                ('leads_quoted', models.PositiveIntegerField(default=0)),
+                ('leads_converted', models.PositiveIntegerField(default=0)),
+                ('leads_closed', models.PositiveIntegerField(default=0)),
+                ('leads_high', models.PositiveIntegerField(default=0)),
+                ('leads_medium', models.PositiveIntegerField(default=0)),
+                ('leads_low', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='referral_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('conversions', models.PositiveIntegerField(default=0)),
+                ('paid_conversions', models.PositiveIntegerField(default=0)),
+                ('earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LinkStats',
+            fields=[
+                ('leads_total', models.PositiveIntegerField(default=0)),
+                ('leads_new', models.PositiveIntegerField(default=0)),
+                ('leads_contacted', models.PositiveIntegerField(default=0)),
+                ('leads_quoted', models.PositiveIntegerField(default=0)),
+                ('leads_converted', models.PositiveIntegerField(default=0)),
+                ('leads_closed', models.PositiveIntegerField(default=0)),
+                ('leads_high', models.PositiveIntegerField(default=0)),
+                ('leads_medium', models.PositiveIntegerField(default=0)),
+                ('leads_low', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='referral_system.referrallink')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
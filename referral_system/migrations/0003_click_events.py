@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral_system', '0002_referral_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralClickDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('unique_visitors', models.PositiveIntegerField(default=0)),
+                ('ua_families', models.JSONField(default=dict, help_text='Clicks per user-agent family')),
+                ('sources', models.JSONField(default=dict, help_text='Clicks per traffic source')),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='click_days', to='referral_system.referrallink')),
+            ],
+            options={
+                'ordering': ['link', 'day'],
+                'unique_together': {('link', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferralClickEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('occurred_at', models.DateTimeField()),
+                ('ip_hash', models.CharField(blank=True, help_text='Keyed hash of the client IP, never the IP itself', max_length=16)),
+                ('ua_family', models.CharField(blank=True, max_length=10)),
+                ('source', models.CharField(blank=True, help_text='utm_source, or the referring host', max_length=64)),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='click_events', to='referral_system.referrallink')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['link', 'occurred_at'], name='click_link_time_idx'), models.Index(fields=['occurred_at'], name='click_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral_system', '0003_click_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralCodeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+                ('key_fingerprint', models.CharField(blank=True, help_text='Identifies the permutation key the codes were issued with', max_length=16)),
+            ],
+        ),
+    ]
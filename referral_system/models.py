@@ -1,9 +1,10 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.urls import reverse
 from decimal import Decimal
-import qrcode
 from io import BytesIO
 from django.core.files.uploadedfile import InMemoryUploadedFile
 import sys
@@ -95,52 +96,54 @@ class ReferralLink(models.Model):
             return request.build_absolute_uri(self.get_absolute_url())
         return f"{settings.SITE_URL}{self.get_absolute_url()}"
 
-    def get_reward_amount(self):
-        """Calculate reward amount based on referral type"""
-        if self.referral_type == 'business':
-            return Decimal('50.00')  # Higher reward for business partners
-        elif self.referral_type == 'customer':
-            return Decimal('25.00')  # Smaller reward for customers
-        else:
+    def get_reward_amount(self, state=None):
+        """Calculate the referrer's reward from the agent's payout rates (see rates.py)"""
+        if self.referral_type == 'agent':
             return Decimal('0.00')   # No reward for direct agent referrals
+        from .rates import resolve_rate
+        return resolve_rate(self.user_id, state or self.target_state, self.insurance_type)
 
     def generate_qr_code(self, request=None):
-        """Generate a QR code for this referral link"""
-        # Get the full URL for the referral link
-        url = self.generate_full_url(request)
-        
-        # Create QR code instance
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        
-        # Add data
-        qr.add_data(url)
-        qr.make(fit=True)
-        
-        # Create an image from the QR Code instance
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Create a BytesIO buffer to hold the image
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)  # Go to the start of the buffer
-        
-        return buffer
+        """Return the link's QR code as a PNG buffer (rendered once, see qr.py)"""
+        from .qr import cached_qr_path, link_qr_url
+        _, path = cached_qr_path(link_qr_url(self))
+        return BytesIO(path.read_bytes())
+
+    def deactivate(self):
+        """Stop accepting traffic on this link (the save also clears its cached resolution)"""
+        self.is_active = False
+        self.save(update_fields=['is_active'])
 
-    def increment_clicks(self):
-        """Increment the click count for this referral link"""
+    def increment_clicks(self, request=None):
+        """
+        Increment the click count for this referral link (buffered, see counters.py)
+        and, given the request, log the click event (see clicks.py)
+        """
+        from .counters import record_click
+        record_click(self.pk)
+        if request is not None:
+            from .clicks import record_click_event
+            record_click_event(self.pk, request)
         self.clicks += 1
-        self.save(update_fields=['clicks'])
         return self.clicks
 
+    def increment_visits(self):
+        """Increment the visit count for this referral link (buffered, see counters.py)"""
+        from .counters import record_visit
+        record_visit(self.pk)
+        self.visits += 1
+        return self.visits
+
     def increment_conversions(self):
-        """Increment the conversion count for this referral link"""
+        """
+        Credit one conversion for this referral link. Conversions are rare, so
+        they are written directly, as lead_capture.services.submit_lead does.
+        """
+        from .stats import apply_agent_delta
+        with transaction.atomic():
+            ReferralLink.objects.filter(pk=self.pk).update(conversions=F('conversions') + 1)
+            apply_agent_delta(self.user_id, {'conversions': 1})
         self.conversions += 1
-        self.save(update_fields=['conversions'])
         return self.conversions
 
     @property
@@ -259,7 +262,115 @@ class AgentRateOverride(models.Model):
     class Meta:
         unique_together = ('preference', 'state', 'insurance_type')
     
+    def clean(self):
+        # An override for every state and type is what default_rate is for
+        if not self.state and not self.insurance_type:
+            raise ValidationError("Choose a state, an insurance type or both; "
+                                  "the default rate applies to everything else.")
+    
     def __str__(self):
         state_name = dict(self.STATE_CHOICES).get(self.state, 'All States') if self.state else 'All States'
         insurance_name = dict(self.INSURANCE_TYPE_CHOICES).get(self.insurance_type, 'All Types') if self.insurance_type else 'All Types'
         return f"{state_name} - {insurance_name}: ${self.rate}"
+
+
+class LeadBreakdown(models.Model):
+    """Lead counts per status and per quality band (see Lead.quality_level)"""
+    leads_total = models.PositiveIntegerField(default=0)
+    
+    # Status counts (Lead.STATUS_CHOICES)
+    leads_new = models.PositiveIntegerField(default=0)
+    leads_contacted = models.PositiveIntegerField(default=0)
+    leads_quoted = models.PositiveIntegerField(default=0)
+    leads_converted = models.PositiveIntegerField(default=0)
+    leads_closed = models.PositiveIntegerField(default=0)
+    
+    # Quality bands: High >= 80, Medium >= 50, Low otherwise
+    leads_high = models.PositiveIntegerField(default=0)
+    leads_medium = models.PositiveIntegerField(default=0)
+    leads_low = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+
+class AgentStats(LeadBreakdown):
+    """Materialized dashboard totals for one agent, maintained by stats.py"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='referral_stats')
+    clicks = models.PositiveIntegerField(default=0)
+    visits = models.PositiveIntegerField(default=0)
+    conversions = models.PositiveIntegerField(default=0)
+    paid_conversions = models.PositiveIntegerField(default=0)
+    earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"Referral Stats for {self.user.username}"
+    
+    @property
+    def conversion_rate(self):
+        """Submissions per click, as a percentage"""
+        if self.clicks == 0:
+            return 0
+        return (self.conversions / self.clicks) * 100
+
+class LinkStats(LeadBreakdown):
+    """Materialized lead breakdown for one referral link (clicks and earnings live on the link)"""
+    link = models.OneToOneField(ReferralLink, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    
+    def __str__(self):
+        return f"Stats for {self.link.code}"
+
+class ReferralClickEvent(models.Model):
+    """One click on a referral link. Append-only; written in batches by clicks.py"""
+    id = models.BigAutoField(primary_key=True)
+    link = models.ForeignKey(ReferralLink, on_delete=models.CASCADE, related_name='click_events')
+    occurred_at = models.DateTimeField()
+    ip_hash = models.CharField(max_length=16, blank=True, help_text="Keyed hash of the client IP, never the IP itself")
+    ua_family = models.CharField(max_length=10, blank=True)
+    source = models.CharField(max_length=64, blank=True, help_text="utm_source, or the referring host")
+    
+    class Meta:
+        indexes = [
+            # Rollups and per-link time series scan one link's events by time
+            models.Index(fields=['link', 'occurred_at'], name='click_link_time_idx'),
+            # Retention deletes the oldest events across all links
+            models.Index(fields=['occurred_at'], name='click_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Click on {self.link_id} at {self.occurred_at}"
+
+class ReferralClickDaily(models.Model):
+    """Clicks per link per day, rebuilt from ReferralClickEvent by rollup_click_events"""
+    link = models.ForeignKey(ReferralLink, on_delete=models.CASCADE, related_name='click_days')
+    day = models.DateField()
+    clicks = models.PositiveIntegerField(default=0)
+    unique_visitors = models.PositiveIntegerField(default=0)
+    ua_families = models.JSONField(default=dict, help_text="Clicks per user-agent family")
+    sources = models.JSONField(default=dict, help_text="Clicks per traffic source")
+    
+    class Meta:
+        unique_together = ('link', 'day')
+        ordering = ['link', 'day']
+    
+    def __str__(self):
+        return f"{self.link_id} on {self.day}: {self.clicks} clicks"
+
+class ReferralCodeSequence(models.Model):
+    """High-water mark of the sequence numbers behind allocated referral codes (see codes.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+    key_fingerprint = models.CharField(max_length=16, blank=True,
+                                       help_text="Identifies the permutation key the codes were issued with")
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+class RateTableVersion(models.Model):
+    """Version stamp of the payout rates; bumping it makes every process recompile its rate table (see rates.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.version}"
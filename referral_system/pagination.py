@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """A cursor that was not produced by encode_cursor"""
+
+
+def encode_cursor(moment, pk):
+    """Opaque, URL-safe position of the row (moment, pk)"""
+    micros = (moment - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}-{pk}"
+
+
+def decode_cursor(cursor, pk_type=int):
+    try:
+        micros, pk = cursor.split('-', 1)
+        return _EPOCH + timedelta(microseconds=int(micros)), pk_type(pk)
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor '{cursor}'")
+
+
+class KeysetPage:
+    """One page of a keyset-paginated, newest-first queryset"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def keyset_page(queryset, cursor=None, page_size=50, field='created_at', pk_type=int):
+    """
+    Return the page of `queryset` after `cursor`, newest first on (field, pk).
+
+    Each page is one indexed range scan of page_size + 1 rows, so page 1000
+    costs the same as page 1 (OFFSET would scan every skipped row).
+    Raises InvalidCursor for a malformed cursor.
+    """
+    if cursor:
+        moment, pk = decode_cursor(cursor, pk_type)
+        queryset = queryset.filter(Q(**{f'{field}__lt': moment}) | Q(**{field: moment, 'pk__lt': pk}))
+
+    rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(rows, next_cursor)
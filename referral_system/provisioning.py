@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .codes import allocate_codes
+from .models import ReferralLink
+from .qr import DEFAULT_ERROR_LEVEL, link_qr_url, render_to_cache
+from .resolution import invalidate_codes
+
+logger = logging.getLogger(__name__)
+
+# Hard cap on links per file
+MAX_LINKS_PER_REQUEST = 1000
+
+# Cap for uploads through the web view, whose QR codes are rendered inside the
+# request; larger batches go through manage.py provision_links
+MAX_LINKS_PER_UPLOAD = 100
+
+# Below this many links the QR codes are rendered in-process; a pool's start-up costs more
+POOL_THRESHOLD = 50
+
+# Columns a provisioning file may set; ownership, code and counters are server-controlled
+LINK_FIELDS = (
+    'name', 'referral_type', 'partner_name', 'customer_name', 'customer_email',
+    'insurance_type', 'target_state', 'source', 'notes',
+)
+
+MANIFEST_COLUMNS = ('row', 'code', 'name', 'referral_type', 'url', 'qr_file', 'link_id')
+
+
+class ProvisioningError(ValueError):
+    """The provisioning file was rejected; `errors` lists every problem found"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors[:5]))
+        self.errors = errors
+
+
+def parse_rows(data, content_type, max_rows=MAX_LINKS_PER_REQUEST):
+    """Decode a CSV (with a header row) or JSON array body into a list of at most max_rows dicts"""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ProvisioningError(['File must be UTF-8 encoded'])
+
+    if content_type == 'application/json':
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise ProvisioningError([f'Invalid JSON: {e}'])
+        if not isinstance(rows, list):
+            raise ProvisioningError(['Expected a JSON array of links'])
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    if not rows:
+        raise ProvisioningError(['No links to create'])
+    if len(rows) > max_rows:
+        raise ProvisioningError([f'At most {max_rows} links per request'])
+    return rows
+
+
+def _compile_fields():
+    compiled = []
+    for name in LINK_FIELDS:
+        field = ReferralLink._meta.get_field(name)
+        choices = frozenset(value for value, _ in field.choices) if field.choices else None
+        compiled.append((name, field, choices))
+    return compiled
+
+_FIELDS = _compile_fields()
+
+
+def clean_link_row(row):
+    """Return (field values, errors) for one requested link"""
+    if not isinstance(row, dict):
+        return None, ['Each link must be an object']
+
+    values, errors = {}, []
+    for name, field, choices in _FIELDS:
+        value = row.get(name)
+        if value is None or str(value).strip() == '':
+            continue
+        value = str(value).strip()
+        if choices is not None and value not in choices:
+            errors.append(f'{name}: must be one of {", ".join(sorted(choices))}')
+            continue
+        if field.max_length and len(value) > field.max_length:
+            errors.append(f'{name}: longer than {field.max_length} characters')
+            continue
+        values[name] = value
+
+    if 'customer_email' in values:
+        try:
+            validate_email(values['customer_email'])
+        except ValidationError:
+            errors.append('customer_email: invalid address')
+    return values, errors
+
+
+def provision_links(user, rows):
+    """
+    Validate every row, then create all links in one transaction with a
+    single bulk INSERT. Nothing is created if any row is invalid.
+    Returns the links in row order.
+    """
+    cleaned, errors = [], []
+    for index, row in enumerate(rows, start=1):
+        values, row_errors = clean_link_row(row)
+        errors.extend(f'row {index}: {error}' for error in row_errors)
+        cleaned.append(values)
+    if errors:
+        raise ProvisioningError(errors)
+
+    with transaction.atomic():
+        # Allocated codes are unique by construction, so no existence checks
+        codes = allocate_codes(len(cleaned))
+        links = ReferralLink.objects.bulk_create([
+            ReferralLink(user=user, code=code, **values) for code, values in zip(codes, cleaned)
+        ])
+        # bulk_create sends no post_save; clear any cached "unknown code" answers
+        # once the links are visible to other requests
+        transaction.on_commit(lambda: invalidate_codes(codes))
+    logger.info(f"Provisioned {len(links)} referral links for {user}")
+    return links
+
+
+def render_link_qrs(links, fmt='png', size=None, error_level=DEFAULT_ERROR_LEVEL, workers=None):
+    """
+    Render each link's QR code into the QR cache, in a process pool for
+    large batches (rendering is CPU-bound). Returns the file paths in link order.
+    Web requests pass workers=1: a pool is for the management command, not
+    for a request worker.
+    """
+    jobs = [(link_qr_url(link), fmt, size, error_level) for link in links]
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) < POOL_THRESHOLD or workers == 1:
+        return [render_to_cache(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_to_cache, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+class _ZipStream:
+    """Write-only file object collecting what ZipFile writes, for streaming"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(links, paths, fmt='png'):
+    """
+    Yield a ZIP archive of the QR images plus manifest.csv, one file at a
+    time. PNGs are already compressed and are stored as-is.
+    """
+    compress_type = zipfile.ZIP_STORED if fmt == 'png' else zipfile.ZIP_DEFLATED
+    stream = _ZipStream()
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(MANIFEST_COLUMNS)
+
+    with zipfile.ZipFile(stream, 'w') as archive:
+        for index, (link, path) in enumerate(zip(links, paths), start=1):
+            qr_file = f'qr/{link.code}.{fmt}'
+            archive.write(path, qr_file, compress_type=compress_type)
+            writer.writerow([index, link.code, link.name, link.referral_type, link_qr_url(link), qr_file, link.pk])
+            yield stream.drain()
+        archive.writestr('manifest.csv', manifest.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+    yield stream.drain()
@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import qrcode
+from PIL import Image
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import quote_etag
+
+logger = logging.getLogger(__name__)
+
+# Rendered codes live under MEDIA_ROOT/qr/<SITE_URL namespace>/
+QR_CACHE_DIR = 'qr'
+
+ERROR_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+DEFAULT_BOX_SIZE = 10
+DEFAULT_ERROR_LEVEL = 'L'
+BORDER = 4
+
+# Largest image a client may request, in pixels per side
+MAX_SIZE = 4000
+MIN_SIZE = 64
+
+# Sizes that are rendered and cached. A requested size is rounded up to the
+# next one, so a link has a handful of cached files however sizes are probed.
+SIZES = (256, 512, 1024, 2400, MAX_SIZE)
+
+# A versioned image URL (?v=<key>) never changes content, so browsers may keep it for a year
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+
+class QRParamError(ValueError):
+    """Invalid QR code format, size or error level"""
+
+
+def snap_size(size):
+    """The smallest of SIZES that is at least `size` pixels"""
+    return next(allowed for allowed in SIZES if allowed >= size)
+
+
+def parse_qr_params(params):
+    """
+    Validate ?format=png|svg&size=<px>&ecc=L|M|Q|H into (fmt, size, error_level),
+    with the size snapped to one of SIZES
+    """
+    fmt = params.get('format', 'png').lower()
+    if fmt not in CONTENT_TYPES:
+        raise QRParamError(f"format must be one of {', '.join(CONTENT_TYPES)}")
+
+    size = params.get('size')
+    if size:
+        try:
+            size = int(size)
+        except ValueError:
+            raise QRParamError("size must be a whole number of pixels")
+        if not MIN_SIZE <= size <= MAX_SIZE:
+            raise QRParamError(f"size must be between {MIN_SIZE} and {MAX_SIZE} pixels")
+        size = snap_size(size)
+    else:
+        size = None
+
+    error_level = params.get('ecc', DEFAULT_ERROR_LEVEL).upper()
+    if error_level not in ERROR_LEVELS:
+        raise QRParamError(f"ecc must be one of {', '.join(ERROR_LEVELS)}")
+    return fmt, size, error_level
+
+
+def qr_key(url, fmt='png', size=None, error_level=DEFAULT_ERROR_LEVEL):
+    """Content address of a rendered code: the same inputs always render the same bytes"""
+    return hashlib.sha256(f'{url}|{fmt}|{size or 0}|{error_level}|{BORDER}'.encode()).hexdigest()
+
+
+def qr_matrix(url, error_level=DEFAULT_ERROR_LEVEL):
+    """Module matrix of the code, quiet zone included (True = dark)"""
+    qr = qrcode.QRCode(error_correction=ERROR_LEVELS[error_level], border=BORDER)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def render_png(matrix, size=None):
+    """
+    1-bit PNG with whole-pixel modules: the largest module size that fits in
+    `size` pixels (DEFAULT_BOX_SIZE when no size is given), so edges stay
+    sharp. Encoding cost grows with the pixel count; print sizes should use SVG.
+    """
+    modules = len(matrix)
+    box_size = max(1, size // modules) if size else DEFAULT_BOX_SIZE
+    image = Image.new('1', (modules, modules))
+    image.putdata([0 if dark else 1 for row in matrix for dark in row])
+    image = image.resize((modules * box_size, modules * box_size), Image.NEAREST)
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_svg(matrix, size=None):
+    """
+    SVG built straight from the matrix: one path of horizontal runs of dark
+    modules in a module-unit viewBox, so it scales to any print size.
+    """
+    modules = len(matrix)
+    pixels = size or modules * DEFAULT_BOX_SIZE
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < modules and row[x]:
+                x += 1
+            runs.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {modules} {modules}" '
+        f'width="{pixels}" height="{pixels}" shape-rendering="crispEdges">'
+        f'<rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(runs)}"/></svg>'
+    ).encode()
+
+
+def render_qr(url, fmt='png', size=None, error_level=DEFAULT_ERROR_LEVEL):
+    """Render a QR code for `url` and return the encoded image bytes"""
+    matrix = qr_matrix(url, error_level)
+    if fmt == 'svg':
+        return render_svg(matrix, size)
+    return render_png(matrix, size)
+
+
+def site_namespace():
+    """Cache directory name for the current SITE_URL; changing SITE_URL starts a fresh one"""
+    return hashlib.sha256(settings.SITE_URL.encode()).hexdigest()[:12]
+
+
+def cache_root():
+    return Path(settings.MEDIA_ROOT) / QR_CACHE_DIR
+
+
+def cached_qr_path(url, fmt='png', size=None, error_level=DEFAULT_ERROR_LEVEL):
+    """
+    Path of the rendered code, rendering it on a miss. Files are written to a
+    temporary name and renamed into place, so concurrent renders of the same
+    code never expose a partial file.
+    """
+    key = qr_key(url, fmt, size, error_level)
+    directory = cache_root() / site_namespace() / key[:2]
+    path = directory / f'{key}.{fmt}'
+    if path.exists():
+        return key, path
+
+    directory.mkdir(parents=True, exist_ok=True)
+    data = render_qr(url, fmt, size, error_level)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return key, path
+
+
+def render_to_cache(args):
+    """cached_qr_path for a process pool: takes (url, fmt, size, error_level), returns the path"""
+    url, fmt, size, error_level = args
+    return str(cached_qr_path(url, fmt, size, error_level)[1])
+
+
+def link_qr_url(link):
+    """The URL a link's QR code encodes: the canonical SITE_URL address shown next to it"""
+    return link.generate_full_url()
+
+
+def prerender_link_qr(link):
+    """Render the default QR code for a link so the first view is a cache hit"""
+    try:
+        return cached_qr_path(link_qr_url(link))[1]
+    except Exception as e:
+        logger.error(f"Error pre-rendering QR code for link {link.code}: {str(e)}")
+        return None
+
+
+def qr_response(request, url, fmt='png', size=None, error_level=DEFAULT_ERROR_LEVEL, filename=None):
+    """
+    FileResponse for a cached QR code with a strong ETag. A matching
+    If-None-Match gets a 304; a request carrying the current key as ?v= is
+    cacheable for a year.
+    """
+    key, path = cached_qr_path(url, fmt, size, error_level)
+    etag = quote_etag(key)
+
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=CONTENT_TYPES[fmt],
+                                as_attachment=filename is not None, filename=filename)
+    response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if request.GET.get('v') == key else REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def prune_stale_namespaces():
+    """Delete codes rendered for a previous SITE_URL; returns the number of directories removed"""
+    root = cache_root()
+    if not root.is_dir():
+        return 0
+    current = site_namespace()
+    removed = 0
+    for directory in root.iterdir():
+        if directory.is_dir() and directory.name != current:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Used when neither a PaymentRate nor an agent preference applies
+DEFAULT_PAYMENT_RATE = Decimal('25.00')
+
+# RateTableVersion row bumped whenever a rate, override or agent preference changes
+VERSION_NAME = 'payment_rates'
+
+# How often (seconds) a process re-reads the shared version row. Changes made
+# in the same process are picked up immediately through the local stamp.
+VERSION_CHECK_INTERVAL = 1.0
+
+# Seconds a compiled table is used at most, whatever the version row says
+MAX_TABLE_AGE = 300
+
+
+class RateTable:
+    """
+    Compiled payout rates.
+
+    Every lookup is a fixed number of dict probes, in precedence order:
+      1. agent override for (state, insurance type)
+      2. agent override for the state (all insurance types)
+      3. agent override for the insurance type (all states)
+      4. PaymentRate for (state, insurance type)
+      5. nationwide PaymentRate for the insurance type
+      6. agent default_rate
+      7. DEFAULT_PAYMENT_RATE
+    State '' stands for "all states"/nationwide and insurance type '' for
+    "all insurance types". An override needs a state or a type (see
+    AgentRateOverride.clean); the agent's default_rate covers the rest.
+    """
+
+    def __init__(self, base_rates, overrides, agent_defaults):
+        self.base_rates = base_rates          # {(state, insurance_type): rate}
+        self.overrides = overrides            # {(agent_id, state, insurance_type): rate}
+        self.agent_defaults = agent_defaults  # {agent_id: rate}
+
+    @classmethod
+    def load(cls):
+        """Build the table with one query per source model"""
+        from .models import AgentPaymentPreference, AgentRateOverride, PaymentRate
+
+        base_rates = {
+            (state or '', insurance_type): rate
+            for state, insurance_type, rate in PaymentRate.objects.filter(is_active=True)
+            .values_list('state', 'insurance_type', 'rate_amount')
+        }
+        overrides = {
+            (agent_id, state or '', insurance_type or ''): rate
+            for agent_id, state, insurance_type, rate in AgentRateOverride.objects.filter(is_active=True)
+            .values_list('preference__user_id', 'state', 'insurance_type', 'rate')
+        }
+        agent_defaults = dict(AgentPaymentPreference.objects.values_list('user_id', 'default_rate'))
+        return cls(base_rates, overrides, agent_defaults)
+
+    def resolve(self, agent_id, state, insurance_type):
+        """Return (rate, source) for a lead"""
+        state = (state or '').upper()
+        insurance_type = insurance_type or ''
+        overrides = self.overrides
+
+        if agent_id is not None and overrides:
+            if state and insurance_type:
+                rate = overrides.get((agent_id, state, insurance_type))
+                if rate is not None:
+                    return rate, 'specific_override'
+            if state:
+                rate = overrides.get((agent_id, state, ''))
+                if rate is not None:
+                    return rate, 'state_override'
+            if insurance_type:
+                rate = overrides.get((agent_id, '', insurance_type))
+                if rate is not None:
+                    return rate, 'type_override'
+
+        if state:
+            rate = self.base_rates.get((state, insurance_type))
+            if rate is not None:
+                return rate, 'state_rate'
+        rate = self.base_rates.get(('', insurance_type))
+        if rate is not None:
+            return rate, 'nationwide_rate'
+
+        rate = self.agent_defaults.get(agent_id)
+        if rate is not None:
+            return rate, 'agent_default'
+        return DEFAULT_PAYMENT_RATE, 'default'
+
+
+def _shared_version():
+    """The version row's value; every process compares it with the one its table was built at"""
+    from .models import RateTableVersion
+
+    return RateTableVersion.objects.filter(name=VERSION_NAME).values_list('version', flat=True).first() or 0
+
+
+def _bump_shared_version():
+    from .models import RateTableVersion
+
+    bump = RateTableVersion.objects.filter(name=VERSION_NAME)
+    if not bump.update(version=F('version') + 1):
+        _, created = RateTableVersion.objects.get_or_create(name=VERSION_NAME, defaults={'version': 1})
+        if not created:
+            bump.update(version=F('version') + 1)
+
+
+class CompiledRates:
+    """
+    One process's compiled table. It is rebuilt when this process
+    invalidated it, when the shared version row changed (read at most every
+    check_interval seconds) and, as a backstop, once it is max_age seconds old.
+    """
+
+    def __init__(self, check_interval=VERSION_CHECK_INTERVAL, max_age=MAX_TABLE_AGE):
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._table = None
+        self._version = None
+        self._built_at = 0.0
+        self._local_version = 0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._local_version += 1
+
+    def _stale(self, version, now):
+        return self._table is None or version != self._version or now - self._built_at >= self.max_age
+
+    def get(self):
+        """Return the table, rebuilding it when a version stamp changed or it expired"""
+        now = time.monotonic()
+        version = self._version
+        if self._table is None or now - self._last_check >= self.check_interval or \
+                version[0] != self._local_version:
+            self._last_check = now
+            version = (self._local_version, _shared_version())
+
+        if self._stale(version, now):
+            with self._lock:
+                if self._stale(version, now):
+                    self._table = RateTable.load()
+                    self._version = version
+                    self._built_at = time.monotonic()
+                    logger.info(f"Compiled payment rate table (version {version})")
+        return self._table
+
+
+_compiled = CompiledRates()
+
+
+def invalidate_rate_table():
+    """Bump the version stamps so every process rebuilds its table"""
+    _compiled.invalidate()
+    _bump_shared_version()
+
+
+def get_rate_table():
+    """Return this process's compiled table (see CompiledRates)"""
+    return _compiled.get()
+
+
+def resolve_rate(agent_id, state, insurance_type):
+    """Payout amount for a lead from this agent, state and insurance type"""
+    return get_rate_table().resolve(agent_id, state, insurance_type)[0]
@@ -0,0 +1,159 @@
+import hashlib
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import Http404
+
+# What the landing and form views need to know about a code
+ResolvedLink = namedtuple('ResolvedLink', 'id code user_id is_active insurance_type')
+
+DEFAULT_LINK_CACHE_SETTINGS = {
+    'CACHE_ALIAS': 'default',  # Use a shared cache so invalidations reach every worker
+    'TIMEOUT': 300,            # Seconds a resolved code is cached
+    'MISS_TIMEOUT': 30,        # Seconds an unknown code is cached
+    'LOCAL_TIMEOUT': 5,        # Cap on both when the cache is per-process (LocMemCache)
+}
+
+# Cached for codes with no link, so repeated probes skip the database
+_MISSING = 'missing'
+
+_FIELDS = ('id', 'code', 'user_id', 'is_active', 'insurance_type')
+
+
+def get_link_cache_settings():
+    """Merge REFERRAL_LINK_CACHE from settings over the defaults"""
+    options = dict(DEFAULT_LINK_CACHE_SETTINGS)
+    options.update(getattr(settings, 'REFERRAL_LINK_CACHE', {}))
+    return options
+
+
+class _Stats:
+    """Hit and miss counters for this process"""
+
+    NAMES = ('hits', 'negative_hits', 'misses', 'invalidations')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.NAMES, 0)
+
+    def reset(self):
+        with self._lock:
+            self.counts = dict.fromkeys(self.NAMES, 0)
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        lookups = counts['hits'] + counts['negative_hits'] + counts['misses']
+        counts['hit_rate'] = (counts['hits'] + counts['negative_hits']) / lookups if lookups else 0.0
+        return counts
+
+_stats = _Stats()
+
+
+def resolution_stats():
+    """{'hits', 'negative_hits', 'misses', 'invalidations', 'hit_rate'} since start or reset"""
+    return _stats.snapshot()
+
+
+def reset_resolution_stats():
+    _stats.reset()
+
+
+def _cache():
+    return caches[get_link_cache_settings()['CACHE_ALIAS']]
+
+
+def _timeouts():
+    """
+    (TIMEOUT, MISS_TIMEOUT). An invalidation only clears the cache of the
+    process that changed the link, so with a per-process cache other workers
+    would keep a deactivated or newly created link's old answer for the full
+    timeout; there both are capped at LOCAL_TIMEOUT.
+    """
+    options = get_link_cache_settings()
+    if isinstance(_cache(), LocMemCache):
+        return (min(options['TIMEOUT'], options['LOCAL_TIMEOUT']),
+                min(options['MISS_TIMEOUT'], options['LOCAL_TIMEOUT']))
+    return options['TIMEOUT'], options['MISS_TIMEOUT']
+
+
+def _key(code):
+    # Probed codes can be anything; only plain codes are used verbatim in the key
+    if code.isascii() and code.isalnum() and len(code) <= 50:
+        return f'referral_link_code:{code}'
+    return f'referral_link_code:h:{hashlib.sha256(code.encode()).hexdigest()}'
+
+
+def _store(code, row):
+    timeout, miss_timeout = _timeouts()
+    if row is None:
+        _cache().set(_key(code), _MISSING, miss_timeout)
+        return None
+    resolved = ResolvedLink(*row)
+    _cache().set(_key(code), tuple(resolved), timeout)
+    return resolved
+
+
+def _from_cache(cached):
+    if cached == _MISSING:
+        _stats.add('negative_hits')
+        return None
+    _stats.add('hits')
+    return ResolvedLink(*cached)
+
+
+def resolve_code(code):
+    """ResolvedLink for `code` (active or not), or None if no link has it"""
+    from .models import ReferralLink
+
+    cached = _cache().get(_key(code))
+    if cached is not None:
+        return _from_cache(cached)
+    _stats.add('misses')
+    return _store(code, ReferralLink.objects.filter(code=code).values_list(*_FIELDS).first())
+
+
+async def aresolve_code(code):
+    from .models import ReferralLink
+
+    cached = await _cache().aget(_key(code))
+    if cached is not None:
+        return _from_cache(cached)
+    _stats.add('misses')
+    return _store(code, await ReferralLink.objects.filter(code=code).values_list(*_FIELDS).afirst())
+
+
+def resolve_active_or_404(code):
+    """The active link for `code`, or Http404 (the replacement for get_object_or_404 on code)"""
+    resolved = resolve_code(code)
+    if resolved is None or not resolved.is_active:
+        raise Http404("No ReferralLink matches the given query.")
+    return resolved
+
+
+async def aresolve_active_or_404(code):
+    resolved = await aresolve_code(code)
+    if resolved is None or not resolved.is_active:
+        raise Http404("No ReferralLink matches the given query.")
+    return resolved
+
+
+def invalidate_codes(codes):
+    """
+    Forget cached resolutions, now and again when the current transaction
+    commits, so a request that read the old row meanwhile cannot keep it cached.
+    """
+    keys = [_key(code) for code in codes if code]
+    if not keys:
+        return
+    _cache().delete_many(keys)
+    _stats.add('invalidations')
+    transaction.on_commit(lambda: _cache().delete_many(keys))
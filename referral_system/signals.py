@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from .models import PaymentRate, AgentPaymentPreference, AgentRateOverride, ReferralLink
+from .qr import prerender_link_qr
+from .rates import invalidate_rate_table
+from .resolution import invalidate_codes
+from .stats import rebuild_agent_stats
+
+@receiver([post_save, post_delete], sender=PaymentRate)
+@receiver([post_save, post_delete], sender=AgentPaymentPreference)
+@receiver([post_save, post_delete], sender=AgentRateOverride)
+def rates_changed(sender, **kwargs):
+    """Invalidate the compiled payout rate table once the change is committed"""
+    transaction.on_commit(invalidate_rate_table)
+
+@receiver(post_delete, sender=ReferralLink)
+def link_deleted(sender, instance, **kwargs):
+    """Forget the code; the agent's click and earnings totals include the link, so recount them"""
+    invalidate_codes([instance.code])
+    user_id = instance.user_id
+    # After commit, when a cascading user delete has either finished or rolled back
+    transaction.on_commit(lambda: rebuild_agent_stats(user_id))
+
+@receiver(post_save, sender=ReferralLink)
+def link_saved(sender, instance, created, **kwargs):
+    """Drop the cached code resolution; pre-render a new link's QR code once it is committed"""
+    invalidate_codes([instance.code])
+    if created:
+        transaction.on_commit(lambda: prerender_link_qr(instance))
@@ -0,0 +1,200 @@
+import logging
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from lead_capture.models import Lead
+from .models import AgentStats, LinkStats, ReferralLink
+
+logger = logging.getLogger(__name__)
+
+# Lead.STATUS_CHOICES -> counter column
+STATUS_FIELDS = {
+    'new': 'leads_new',
+    'contacted': 'leads_contacted',
+    'quoted': 'leads_quoted',
+    'converted': 'leads_converted',
+    'closed': 'leads_closed',
+}
+
+# Lead.quality_level bands -> counter column
+QUALITY_FIELDS = {'High': 'leads_high', 'Medium': 'leads_medium', 'Low': 'leads_low'}
+
+BREAKDOWN_FIELDS = ['leads_total', *STATUS_FIELDS.values(), *QUALITY_FIELDS.values()]
+
+# Totals copied from the agent's referral links
+LINK_TOTAL_FIELDS = ('clicks', 'visits', 'conversions', 'paid_conversions', 'earnings')
+
+
+def quality_band(score):
+    """Same thresholds as Lead.quality_level"""
+    score = score or 0
+    if score >= 80:
+        return 'High'
+    elif score >= 50:
+        return 'Medium'
+    return 'Low'
+
+
+def lead_counts(status, score, amount=1):
+    """Counter columns a lead with this status and score contributes to"""
+    counts = Counter({'leads_total': amount, QUALITY_FIELDS[quality_band(score)]: amount})
+    if status in STATUS_FIELDS:
+        counts[STATUS_FIELDS[status]] += amount
+    return counts
+
+
+def _breakdown_aggregates():
+    aggregates = {'leads_total': Count('id')}
+    for status, field in STATUS_FIELDS.items():
+        aggregates[field] = Count('id', filter=Q(status=status))
+    aggregates['leads_high'] = Count('id', filter=Q(validation_score__gte=80))
+    aggregates['leads_medium'] = Count('id', filter=Q(validation_score__gte=50, validation_score__lt=80))
+    aggregates['leads_low'] = Count('id', filter=Q(validation_score__lt=50))
+    return aggregates
+
+
+def _link_total_aggregates():
+    return {
+        field: Coalesce(Sum(field), Decimal('0.00') if field == 'earnings' else 0)
+        for field in LINK_TOTAL_FIELDS
+    }
+
+
+def _apply(model, key, pk, counts, create_missing):
+    counts = {field: amount for field, amount in counts.items() if amount}
+    if not counts:
+        return
+    updated = model.objects.filter(**{key: pk}).update(
+        **{field: F(field) + amount for field, amount in counts.items()}
+    )
+    if not updated and create_missing:
+        # First change for this row: build it from the source tables, which
+        # already include the write this delta describes
+        if model is AgentStats:
+            rebuild_agent_stats(pk)
+        else:
+            rebuild_link_stats(pk)
+
+
+def apply_agent_delta(user_id, counts, create_missing=True):
+    """
+    Add `counts` ({column: amount}) to an agent's stats row in one UPDATE.
+
+    Call this after the source write, inside the same transaction, so the
+    rollup commits or rolls back with it.
+    """
+    if user_id:
+        _apply(AgentStats, 'user_id', user_id, counts, create_missing)
+
+
+def apply_link_delta(link_id, counts, create_missing=True):
+    """Add `counts` to a link's stats row (see apply_agent_delta)"""
+    if link_id:
+        _apply(LinkStats, 'link_id', link_id, counts, create_missing)
+
+
+def lead_changed(before, after, create_missing=True):
+    """
+    Move a lead's contribution from its old (agent, link, status, score) to
+    the new one. Either side may be None for a created or deleted lead.
+    """
+    agent_deltas, link_deltas = defaultdict(Counter), defaultdict(Counter)
+    for snapshot, sign in ((before, -1), (after, 1)):
+        if snapshot is None:
+            continue
+        agent_id, link_id, status, score = snapshot
+        counts = lead_counts(status, score, sign)
+        if agent_id:
+            agent_deltas[agent_id].update(counts)
+        if link_id:
+            link_deltas[link_id].update(counts)
+
+    for user_id, counts in agent_deltas.items():
+        apply_agent_delta(user_id, counts, create_missing)
+    for link_id, counts in link_deltas.items():
+        apply_link_delta(link_id, counts, create_missing)
+
+
+def _agent_values(user_id):
+    values = Lead.objects.filter(agent_id=user_id).aggregate(**_breakdown_aggregates())
+    values.update(ReferralLink.objects.filter(user_id=user_id).aggregate(**_link_total_aggregates()))
+    return values
+
+
+def rebuild_agent_stats(user_id):
+    """Recompute one agent's stats row from leads and referral links"""
+    with transaction.atomic():
+        if not User.objects.filter(pk=user_id).exists():
+            return None
+        stats, _ = AgentStats.objects.update_or_create(user_id=user_id, defaults=_agent_values(user_id))
+    return stats
+
+
+def rebuild_link_stats(link_id):
+    """Recompute one link's stats row from its leads"""
+    with transaction.atomic():
+        if not ReferralLink.objects.filter(pk=link_id).exists():
+            return None
+        values = Lead.objects.filter(referral_link_id=link_id).aggregate(**_breakdown_aggregates())
+        stats, _ = LinkStats.objects.update_or_create(link_id=link_id, defaults=values)
+    return stats
+
+
+def get_agent_stats(user):
+    """The agent's stats row, built on first use"""
+    try:
+        return AgentStats.objects.get(user=user)
+    except AgentStats.DoesNotExist:
+        return rebuild_agent_stats(user.pk)
+
+
+def _reconcile(model, key, fields, expected, fix):
+    """Compare stored rows with `expected` ({pk: values}); return the pks that drifted"""
+    stored = {row[key]: row for row in model.objects.values(key, *fields)}
+
+    drifted = []
+    for pk, values in expected.items():
+        row = stored.pop(pk, None)
+        if row is None or any(row[field] != value for field, value in values.items()):
+            drifted.append(pk)
+            if fix:
+                model.objects.update_or_create(**{key: pk}, defaults=values)
+    # Rows whose agent or link no longer has anything to count
+    for pk, row in stored.items():
+        if any(row[field] for field in fields):
+            drifted.append(pk)
+            if fix:
+                model.objects.filter(**{key: pk}).update(**{field: 0 for field in fields})
+    return drifted
+
+
+def reconcile_stats(fix=True):
+    """
+    Recompute every stats row with one grouped query per source table and
+    rewrite the rows that disagree. Returns (drifted agent ids, drifted link ids).
+    """
+    breakdown = _breakdown_aggregates()
+    empty_breakdown = {field: 0 for field in BREAKDOWN_FIELDS}
+    empty_totals = {field: Decimal('0.00') if field == 'earnings' else 0 for field in LINK_TOTAL_FIELDS}
+
+    agents = {}
+    for row in ReferralLink.objects.order_by().values('user_id').annotate(**_link_total_aggregates()):
+        agents.setdefault(row.pop('user_id'), {**empty_breakdown, **empty_totals}).update(row)
+    for row in Lead.objects.filter(agent__isnull=False).order_by().values('agent_id').annotate(**breakdown):
+        agents.setdefault(row.pop('agent_id'), {**empty_breakdown, **empty_totals}).update(row)
+
+    links = {pk: dict(empty_breakdown) for pk in ReferralLink.objects.values_list('pk', flat=True)}
+    for row in Lead.objects.filter(referral_link__isnull=False).order_by().values('referral_link_id').annotate(**breakdown):
+        links[row.pop('referral_link_id')].update(row)
+
+    with transaction.atomic():
+        drifted_agents = _reconcile(AgentStats, 'user_id', [*BREAKDOWN_FIELDS, *LINK_TOTAL_FIELDS], agents, fix)
+        drifted_links = _reconcile(LinkStats, 'link_id', BREAKDOWN_FIELDS, links, fix)
+    if drifted_agents or drifted_links:
+        logger.warning(f"Referral stats drifted for {len(drifted_agents)} agents and {len(drifted_links)} links")
+    return drifted_agents, drifted_links
@@ -1,3 +1,631 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from unittest import mock
+import django
+from PIL import Image
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import Http404
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from lead_capture.models import Lead
+from lead_validation.ingest import RowInserter
+from .clicks import ClickEventBuffer, rollup_day
+from .codes import CODE_LENGTH, SEQUENCE_NAME, CodeAllocator, code_for
+from .counters import CacheCounterBuffer, LocalCounterBuffer, ReferralCounters
+from .models import (
+    AgentPaymentPreference, AgentRateOverride, PaymentRate, ReferralClickDaily, ReferralClickEvent,
+    ReferralCodeSequence, ReferralLink,
+)
+from .provisioning import MAX_LINKS_PER_UPLOAD, ProvisioningError, parse_rows, provision_links
+from .qr import (
+    IMMUTABLE_CACHE_CONTROL, MAX_SIZE, MIN_SIZE, REVALIDATE_CACHE_CONTROL, cache_root, link_qr_url, parse_qr_params, qr_key,
+)
+from .rates import DEFAULT_PAYMENT_RATE, CompiledRates, RateTable
+from .resolution import (
+    ResolvedLink, reset_resolution_stats, resolution_stats, resolve_active_or_404, resolve_code,
+)
+from .stats import reconcile_stats
 
-# Create your tests here.
+
+class DashboardBudgetTests(TestCase):
+    """my_links and view_leads stay within a fixed query and time budget for a large agent"""
+    LINKS = 500
+    LEADS = 200_000
+    QUERY_BUDGET = 4  # session, user, stats row or link, one page
+    RENDER_BUDGET_SECONDS = 1.0
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='secret')
+        links = ReferralLink.objects.bulk_create([
+            ReferralLink(user=cls.agent, code=f'budget{i:04d}', name=f'Link {i}',
+                         clicks=10, conversions=2, earnings=Decimal('50.00'))
+            for i in range(cls.LINKS)
+        ])
+        cls.busy_link = links[0]
+
+        # Half of the leads land on one link; every lead carries a sizable validation blob
+        now = timezone.now()
+        details = {'ai_assessment': {'issues': ['x' * 200] * 10}, 'duplicate_check': {'is_duplicate': False}}
+        inserter = RowInserter(Lead)
+        for start in range(0, cls.LEADS, 20_000):
+            inserter.insert([
+                {
+                    'name': f'Lead {n}',
+                    'email': f'lead{n}@example.com',
+                    'phone': f'{2000000000 + n}',
+                    'insurance_type': 'auto',
+                    'referral_link_id': links[0].pk if n % 2 else links[n % cls.LINKS].pk,
+                    'created_at': now - timedelta(seconds=n),
+                }
+                for n in range(start, min(cls.LEADS, start + 20_000))
+            ], constants={'agent_id': cls.agent.id, 'updated_at': now, 'validation_details': details,
+                          'user_agent': 'Mozilla/5.0 ' * 20})
+        reconcile_stats()
+
+    def setUp(self):
+        self.client.force_login(self.agent)
+
+    def _timed_get(self, url, **params):
+        started = time.perf_counter()
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(url, params)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, self.RENDER_BUDGET_SECONDS)
+        return response
+
+    def test_my_links_budget(self):
+        response = self._timed_get(reverse('referral_system:my_links'))
+        stats = response.context['stats']
+        self.assertEqual(stats.clicks, 10 * self.LINKS)
+        self.assertEqual(stats.earnings, Decimal('50.00') * self.LINKS)
+        self.assertEqual(stats.leads_total, self.LEADS)
+
+        page = response.context['links']
+        self.assertTrue(page.has_next)
+        last = self._timed_get(reverse('referral_system:my_links'), cursor=page.next_cursor)
+        self.assertEqual(len(last.context['links']), 50)
+
+    def test_view_leads_budget(self):
+        url = reverse('referral_system:view_leads', args=[self.busy_link.id])
+        first = self._timed_get(url)
+        page = first.context['leads']
+        self.assertEqual(len(page), 50)
+        self.assertEqual(page.items[0].name, 'Lead 0')
+
+        # Walk deep into the link's leads; a keyset page costs the same anywhere
+        cursor = page.next_cursor
+        for _ in range(3):
+            response = self._timed_get(url, cursor=cursor)
+            cursor = response.context['leads'].next_cursor
+
+        deep = Lead.objects.filter(referral_link=self.busy_link).order_by('created_at', 'id').first()
+        self.assertLess(deep.created_at, response.context['leads'].items[-1].created_at)
+
+    def test_list_queries_skip_heavy_columns(self):
+        response = self._timed_get(reverse('referral_system:view_leads', args=[self.busy_link.id]))
+        lead = response.context['leads'].items[0]
+        self.assertEqual(lead.get_deferred_fields() & {'validation_details', 'user_agent'},
+                         {'validation_details', 'user_agent'})
+
+
+def _allocate_in_process(db_name, number):
+    """Pool task: allocate codes in a fresh process, as a separate web worker would"""
+    if connection.settings_dict['NAME'] != db_name:
+        connection.close()
+        connection.settings_dict['NAME'] = db_name
+    allocator = CodeAllocator(block_size=3 + number % 4)
+    try:
+        return [code for _ in range(CodeAllocatorStressTests.ROUNDS) for code in allocator.allocate(1)]
+    finally:
+        connection.close()
+
+
+class CodeAllocatorStressTests(TransactionTestCase):
+    """Codes stay unique when many workers allocate at once"""
+    WORKERS = 16
+    ROUNDS = 25
+
+    def test_concurrent_workers_never_share_a_code(self):
+        issued, errors = [], []
+        start = threading.Barrier(self.WORKERS)
+
+        def worker(number):
+            # One allocator per worker, as in separate processes
+            allocator = CodeAllocator(block_size=7)
+            try:
+                start.wait()
+                for round_ in range(self.ROUNDS):
+                    issued.extend(allocator.allocate(1 + (number + round_) % 5))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(issued), sum(1 + (n + r) % 5 for n in range(self.WORKERS) for r in range(self.ROUNDS)))
+        self.assertEqual(len(set(issued)), len(issued))
+        self.assertTrue(all(len(code) == CODE_LENGTH for code in issued))
+
+        # The codes are real links' codes with no further checks
+        agent = User.objects.create_user('stress')
+        ReferralLink.objects.bulk_create([ReferralLink(user=agent, code=code) for code in issued])
+
+    def test_processes_never_share_a_code(self):
+        # Spawned processes run their own allocators against the test database
+        context = multiprocessing.get_context('spawn')
+        db_name = connection.settings_dict['NAME']
+        with ProcessPoolExecutor(max_workers=4, mp_context=context, initializer=django.setup) as pool:
+            batches = list(pool.map(_allocate_in_process, [db_name] * 8, range(8)))
+
+        issued = [code for batch in batches for code in batch]
+        self.assertEqual(len(issued), 8 * self.ROUNDS)
+        self.assertEqual(len(set(issued)), len(issued))
+        # Their blocks came from this database's sequence
+        self.assertGreaterEqual(ReferralCodeSequence.objects.get(name=SEQUENCE_NAME).next_value, len(issued))
+
+    def test_permutation_is_a_bijection_on_a_sample(self):
+        codes = {code_for(n) for n in range(50_000)}
+        self.assertEqual(len(codes), 50_000)
+
+
+class RateTableTests(TestCase):
+    """A rate change reaches every process's compiled table"""
+
+    def test_other_process_sees_a_rate_change(self):
+        rate = PaymentRate.objects.create(state='', insurance_type='auto', rate_amount=Decimal('40.00'))
+        # Another process: its own table, reading the shared version row on every lookup
+        other = CompiledRates(check_interval=0)
+        self.assertEqual(other.get().resolve(None, 'NY', 'auto'), (Decimal('40.00'), 'nationwide_rate'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rate.rate_amount = Decimal('55.00')
+            rate.save()
+        self.assertEqual(other.get().resolve(None, 'NY', 'auto')[0], Decimal('55.00'))
+
+    def test_precedence(self):
+        agent, other_agent = 7, 8
+        base_rates = {('NY', 'auto'): Decimal('40.00'), ('', 'auto'): Decimal('30.00')}
+        overrides = {(agent, 'NY', 'auto'): Decimal('90.00'), (agent, 'NY', ''): Decimal('80.00'),
+                     (agent, '', 'auto'): Decimal('70.00')}
+        agent_defaults = {agent: Decimal('20.00')}
+        table = RateTable(base_rates, overrides, agent_defaults)
+
+        # Each override only covers its own scope
+        for agent_id, state, insurance_type, expected in [
+            (agent, 'ny', 'auto', (Decimal('90.00'), 'specific_override')),
+            (agent, 'NY', 'home', (Decimal('80.00'), 'state_override')),
+            (agent, 'CA', 'auto', (Decimal('70.00'), 'type_override')),
+            (other_agent, 'NY', 'auto', (Decimal('40.00'), 'state_rate')),
+            (other_agent, 'CA', 'auto', (Decimal('30.00'), 'nationwide_rate')),
+            (agent, 'CA', 'home', (Decimal('20.00'), 'agent_default')),
+            (None, 'CA', 'home', (DEFAULT_PAYMENT_RATE, 'default')),
+        ]:
+            self.assertEqual(table.resolve(agent_id, state, insurance_type), expected,
+                             (agent_id, state, insurance_type))
+
+        # For one lead, each level wins until it is removed, then the next one does
+        for source, rates, key, amount in [
+            ('specific_override', overrides, (agent, 'NY', 'auto'), Decimal('90.00')),
+            ('state_override', overrides, (agent, 'NY', ''), Decimal('80.00')),
+            ('type_override', overrides, (agent, '', 'auto'), Decimal('70.00')),
+            ('state_rate', base_rates, ('NY', 'auto'), Decimal('40.00')),
+            ('nationwide_rate', base_rates, ('', 'auto'), Decimal('30.00')),
+            ('agent_default', agent_defaults, agent, Decimal('20.00')),
+        ]:
+            self.assertEqual(table.resolve(agent, 'NY', 'auto'), (amount, source))
+            del rates[key]
+        self.assertEqual(table.resolve(agent, 'NY', 'auto'), (DEFAULT_PAYMENT_RATE, 'default'))
+
+    def test_loaded_overrides_need_a_scope(self):
+        preference = AgentPaymentPreference.objects.create(user=User.objects.create_user('agent'),
+                                                           default_rate=Decimal('20.00'))
+        AgentRateOverride.objects.create(preference=preference, state='NY', rate=Decimal('80.00'))
+        # Blank state is stored as NULL and loads as "all states"
+        AgentRateOverride.objects.create(preference=preference, state=None, insurance_type='auto',
+                                         rate=Decimal('70.00'))
+        table = RateTable.load()
+        self.assertEqual(table.resolve(preference.user_id, 'NY', 'home'), (Decimal('80.00'), 'state_override'))
+        self.assertEqual(table.resolve(preference.user_id, 'CA', 'auto'), (Decimal('70.00'), 'type_override'))
+        with self.assertRaises(ValidationError):
+            AgentRateOverride(preference=preference, state=None, insurance_type='', rate=Decimal('90.00')).full_clean()
+
+    def test_tables_expire(self):
+        stale = CompiledRates(check_interval=3600, max_age=0)
+        stale.get()
+        PaymentRate.objects.create(state='NY', insurance_type='home', rate_amount=Decimal('70.00'))
+        self.assertEqual(stale.get().resolve(None, 'NY', 'home'), (Decimal('70.00'), 'state_rate'))
+
+
+@override_settings(REFERRAL_COUNTERS={'BACKEND': 'cache', 'FLUSH_INTERVAL': 3600, 'FLUSH_THRESHOLD': 10 ** 6})
+class ReferralCounterTests(TestCase):
+    """Buffered increments reach the database exactly once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent')
+        cls.link = ReferralLink.objects.create(user=cls.agent, code='count1')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_local_buffer_keeps_a_running_total(self):
+        buffer = LocalCounterBuffer()
+        self.assertEqual([buffer.add('a', 'clicks', 1) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(buffer.add('b', 'visits', 2), 5)
+        drained = buffer.drain()
+        self.assertEqual(drained, {('a', 'clicks'): 3, ('b', 'visits'): 2})
+        self.assertEqual(buffer.add('a', 'clicks', 1), 1)
+        buffer.restore(drained)
+        self.assertEqual(buffer.add('a', 'clicks', 1), 7)
+
+    def test_concurrent_drains_claim_each_increment_once(self):
+        # Two processes sharing one cache
+        writer, drainers = CacheCounterBuffer('default'), [CacheCounterBuffer('default') for _ in range(2)]
+        claimed = []
+        stop = threading.Event()
+
+        def drain(buffer):
+            while not stop.is_set():
+                claimed.append(buffer.drain())
+            claimed.append(buffer.drain())
+
+        threads = [threading.Thread(target=drain, args=(buffer,)) for buffer in drainers]
+        for thread in threads:
+            thread.start()
+        for n in range(2000):
+            writer.add(f'link{n % 7}', 'clicks', 1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        claimed.append(drainers[0].drain())
+
+        self.assertEqual(sum(amount for pending in claimed for amount in pending.values()), 2000)
+
+    def test_drain_waits_for_another_drain(self):
+        buffer = CacheCounterBuffer('default')
+        buffer.add('link1', 'clicks', 3)
+        cache.add(CacheCounterBuffer.DRAIN_LOCK_KEY, 1)
+        self.assertEqual(buffer.drain(), {})
+        cache.delete(CacheCounterBuffer.DRAIN_LOCK_KEY)
+        self.assertEqual(buffer.drain(), {('link1', 'clicks'): 3})
+
+    def test_failed_registration_is_retried(self):
+        buffer = CacheCounterBuffer('default')
+        cache.add(CacheCounterBuffer.LOCK_KEY, 1)
+        with mock.patch('referral_system.counters.time.sleep'):
+            buffer.add('link1', 'clicks', 2)
+        cache.delete(CacheCounterBuffer.LOCK_KEY)
+        self.assertEqual(buffer.snapshot(), {})
+        self.assertEqual(buffer.drain(), {('link1', 'clicks'): 2})
+
+    def test_flushes_from_two_processes(self):
+        first, second = ReferralCounters(), ReferralCounters()
+        for counters in (first, second):
+            self.addCleanup(counters.stop)
+        for _ in range(5):
+            first.record(self.link.pk, 'clicks')
+        second.record(self.link.pk, 'conversions')
+        self.assertEqual(first.flush() + second.flush(), 1)
+        self.link.refresh_from_db()
+        self.assertEqual((self.link.clicks, self.link.conversions), (5, 1))
+        self.assertEqual((self.agent.referral_stats.clicks, self.agent.referral_stats.conversions), (5, 1))
+
+    def test_conversions_are_written_directly(self):
+        self.assertEqual(self.link.increment_conversions(), 1)
+        self.link.refresh_from_db()
+        self.assertEqual((self.link.conversions, self.agent.referral_stats.conversions), (1, 1))
+
+
+@override_settings(REFERRAL_COUNTERS={'FLUSH_INTERVAL': 0.05})
+class BackgroundCounterFlushTests(TransactionTestCase):
+    """Buffered counts reach the database without another request"""
+
+    def test_idle_process_flushes(self):
+        link = ReferralLink.objects.create(user=User.objects.create_user('agent'), code='idle01')
+        counters = ReferralCounters()
+        self.addCleanup(counters.stop)
+        counters._last_flush = time.monotonic()
+        counters.record(link.pk, 'clicks')
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            link.refresh_from_db()
+            if link.clicks:
+                break
+            time.sleep(0.02)
+        self.assertEqual((link.clicks, counters.pending()), (1, {}))
+
+
+class ClickEventBufferTests(TransactionTestCase):
+    """Flushes survive deleted links and a failing database"""
+
+    def setUp(self):
+        agent = User.objects.create_user('agent')
+        self.kept = ReferralLink.objects.create(user=agent, code='kept1')
+        self.deleted = ReferralLink.objects.create(user=agent, code='gone1')
+
+    def test_clicks_for_deleted_links_are_dropped(self):
+        buffer = ClickEventBuffer()
+        buffer.record(self.kept.pk, ip_address='10.0.0.1', user_agent='Mozilla/5.0 Firefox/120.0')
+        buffer.record(str(self.deleted.pk))
+        self.deleted.delete()
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.pending(), 0)
+        event = ReferralClickEvent.objects.get()
+        self.assertEqual((event.link_id, event.ua_family), (self.kept.pk, 'firefox'))
+
+    @override_settings(REFERRAL_CLICK_EVENTS={'FLUSH_THRESHOLD': 10 ** 6, 'MAX_PENDING': 3})
+    def test_requeued_clicks_are_bounded(self):
+        buffer = ClickEventBuffer()
+        for _ in range(5):
+            buffer.record(self.kept.pk)
+        with mock.patch.object(ReferralClickEvent.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending(), 3)
+        self.assertEqual(buffer.flush(), 3)
+
+
+class ClickRollupTests(TestCase):
+    """Daily rollups outlive the raw events they were built from"""
+
+    def test_rerun_keeps_days_whose_events_were_purged(self):
+        link = ReferralLink.objects.create(user=User.objects.create_user('agent'), code='roll01')
+        old_day = timezone.localdate() - timedelta(days=100)
+        old_click = timezone.make_aware(datetime.combine(old_day, dt_time(23, 30)))
+        first_kept_day = timezone.localdate() - timedelta(days=90)
+        ReferralClickEvent.objects.bulk_create([
+            ReferralClickEvent(link=link, occurred_at=old_click, ip_hash='a'),
+            ReferralClickEvent(link=link, occurred_at=old_click + timedelta(minutes=20), ip_hash='b'),
+            ReferralClickEvent(link=link, occurred_at=timezone.make_aware(datetime.combine(first_kept_day, dt_time.min)),
+                               ip_hash='a'),
+            ReferralClickEvent(link=link, occurred_at=timezone.now(), ip_hash='a'),
+        ])
+        call_command('rollup_click_events', since=str(old_day), retention_days=90, stdout=io.StringIO())
+        # The purge stops at a day boundary: the old day is gone entirely, the next one untouched
+        self.assertEqual(ReferralClickEvent.objects.count(), 2)
+
+        call_command('rollup_click_events', since=str(old_day), keep_raw=True, stdout=io.StringIO())
+        self.assertEqual(ReferralClickDaily.objects.get(link=link, day=old_day).clicks, 2)
+        self.assertEqual(rollup_day(old_day - timedelta(days=1)), 0)
+        self.assertEqual(ReferralClickDaily.objects.filter(link=link).count(), 3)
+
+
+class LeadExportTests(TestCase):
+    """Exports stream CSV or NDJSON and resume from their cursor"""
+
+    def setUp(self):
+        self.agent = User.objects.create_user('agent')
+        self.client.force_login(self.agent)
+        self.url = reverse('referral_system:export_leads')
+
+    def create_lead(self, name, **fields):
+        return Lead.objects.create(agent=self.agent, name=name, email=f'{name.lower()}@example.com',
+                                   phone='2125550199', insurance_type='auto', **fields)
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_cursor_exports_only_new_and_changed_leads(self):
+        first = self.create_lead('Ann')
+        self.create_lead('Bob')
+        response, body = self.export(columns='name')
+        self.assertEqual(body.splitlines(), ['name', 'Ann', 'Bob'])
+        cursor = response['X-Export-Cursor']
+
+        self.create_lead('Cal')
+        first.notes = 'called back'
+        first.save()
+        response, body = self.export(columns='name', cursor=cursor)
+        self.assertEqual(body.splitlines(), ['name', 'Cal', 'Ann'])
+
+        # Nothing new: the same cursor comes back
+        _, body = self.export(columns='name', cursor=response['X-Export-Cursor'])
+        self.assertEqual(body.splitlines(), ['name'])
+        self.assertEqual(self.client.get(self.url, {'cursor': 'bogus'}).status_code, 400)
+
+    def test_csv_neutralizes_formulas(self):
+        self.create_lead('=HYPERLINK("http://evil")', notes='+1 call', address='-5 Main St', state='CA')
+        self.create_lead('@SUM(A1)', notes='\tx', address='plain', validation_score=-1)
+        _, body = self.export(columns='name,notes,address,validation_score')
+        self.assertEqual(body.splitlines(), [
+            'name,notes,address,validation_score',
+            '"\'=HYPERLINK(""http://evil"")",\'+1 call,\'-5 Main St,0',
+            "'@SUM(A1),'\tx,plain,-1",
+        ])
+
+    def test_ndjson_keeps_values(self):
+        lead = self.create_lead('=1+1', notes='-x')
+        response, body = self.export(format='ndjson', columns='id,name,notes,created_at')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [
+            {'id': lead.id, 'name': '=1+1', 'notes': '-x', 'created_at': lead.created_at.isoformat()},
+        ])
+
+
+class BulkProvisioningTests(TestCase):
+    """Uploaded link files are created all or nothing and come back as a ZIP"""
+
+    def setUp(self):
+        self.agent = User.objects.create_user('agent')
+        self.client.force_login(self.agent)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.url = reverse('referral_system:bulk_provision_links')
+
+    def test_parse_rows(self):
+        csv_rows = parse_rows('﻿name,insurance_type\nSpring,auto\nFall,home\n'.encode(), 'text/csv')
+        self.assertEqual(csv_rows, [{'name': 'Spring', 'insurance_type': 'auto'}, {'name': 'Fall', 'insurance_type': 'home'}])
+        self.assertEqual(parse_rows(b'[{"name": "Spring"}]', 'application/json'), [{'name': 'Spring'}])
+        for data, content_type, error in [
+            (b'{"name": "Spring"}', 'application/json', 'Expected a JSON array of links'),
+            (b'[', 'application/json', 'Invalid JSON'),
+            (b'name\n', 'text/csv', 'No links to create'),
+            (b'\xff', 'text/csv', 'File must be UTF-8 encoded'),
+            (b'name\na\nb\nc\n', 'text/csv', 'At most 2 links per request'),
+        ]:
+            with self.assertRaises(ProvisioningError) as raised:
+                parse_rows(data, content_type, max_rows=2)
+            self.assertTrue(raised.exception.errors[0].startswith(error), raised.exception.errors)
+
+    def test_invalid_row_creates_nothing(self):
+        response = self.client.post(self.url, 'name,referral_type,customer_email\nSpring,customer,a@example.com\n'
+                                              'Fall,friend,not-an-email\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            'row 2: referral_type: must be one of agent, business, customer', 'row 2: customer_email: invalid address',
+        ])
+        self.assertFalse(ReferralLink.objects.exists())
+
+        rows = json.dumps([{'name': f'Link {n}'} for n in range(MAX_LINKS_PER_UPLOAD + 1)])
+        response = self.client.post(self.url, rows, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ReferralLink.objects.exists())
+
+    def test_zip_has_a_qr_per_link_and_a_manifest(self):
+        response = self.client.post(self.url + '?format=svg', 'name,insurance_type\nSpring,auto\nFall,home\n',
+                                    content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        links = list(ReferralLink.objects.filter(user=self.agent).order_by('name'))
+        self.assertEqual(sorted(archive.namelist()),
+                         sorted(['manifest.csv'] + [f'qr/{link.code}.svg' for link in links]))
+        self.assertTrue(archive.read(f'qr/{links[0].code}.svg').startswith(b'<svg '))
+
+        manifest = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        self.assertEqual([(row['row'], row['name']) for row in manifest], [('1', 'Spring'), ('2', 'Fall')])
+        fall = ReferralLink.objects.get(name='Fall')
+        self.assertEqual((manifest[1]['code'], manifest[1]['link_id'], manifest[1]['qr_file']),
+                         (fall.code, str(fall.pk), f'qr/{fall.code}.svg'))
+
+    def test_cached_codes_are_invalidated_after_commit(self):
+        with mock.patch('referral_system.provisioning.invalidate_codes') as invalidate:
+            with self.captureOnCommitCallbacks() as callbacks:
+                links = provision_links(self.agent, [{'name': 'Spring'}, {'name': 'Fall'}])
+            invalidate.assert_not_called()
+            for callback in callbacks:
+                callback()
+        invalidate.assert_called_once_with([link.code for link in links])
+
+
+class QRCodeTests(TestCase):
+    """QR images are served from the cache with validators and a bounded set of sizes"""
+
+    def setUp(self):
+        agent = User.objects.create_user('agent')
+        self.client.force_login(agent)
+        self.link = ReferralLink.objects.create(user=agent, code='qrcode1')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.url = reverse('referral_system:qr_code_image', args=[self.link.id])
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_etag_and_versioned_urls(self):
+        key = qr_key(link_qr_url(self.link))
+        response = self.client.get(self.url)
+        self.assertEqual((response['ETag'], response['Cache-Control']), (f'"{key}"', REVALIDATE_CACHE_CONTROL))
+        self.body(response)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"other", "{key}"')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], f'"{key}"')
+
+        self.assertEqual(self.client.get(self.url, {'v': key})['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(self.client.get(self.url, {'v': 'stale'})['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+
+    def test_png_and_svg(self):
+        png = self.client.get(self.url, {'size': 512})
+        self.assertEqual(png['Content-Type'], 'image/png')
+        image = Image.open(io.BytesIO(self.body(png)))
+        self.assertLessEqual(image.size[0], 512)
+        self.assertGreater(image.size[0], 256)
+
+        svg = self.client.get(reverse('referral_system:download_qr_code', args=[self.link.id]),
+                              {'format': 'svg', 'size': 1000, 'ecc': 'h'})
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertIn(f'filename="qr_code_{self.link.code}.svg"', svg['Content-Disposition'])
+        self.assertIn(b'width="1024" height="1024"', self.body(svg))
+
+        for params in ({'format': 'gif'}, {'size': 10}, {'size': 'big'}, {'ecc': 'X'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_requested_sizes_share_cached_files(self):
+        for size in range(MIN_SIZE, 1025, 37):
+            self.body(self.client.get(self.url, {'size': size}))
+        cached = [path for path in cache_root().rglob('*.png')]
+        self.assertEqual(len(cached), 3)  # 256, 512 and 1024
+        self.assertEqual(parse_qr_params({'size': '2401'})[1], MAX_SIZE)
+
+
+class LinkResolutionTests(TestCase):
+    """Codes resolve from the cache, unknown ones included, until the link changes"""
+
+    def setUp(self):
+        cache.clear()
+        reset_resolution_stats()
+        self.agent = User.objects.create_user('agent')
+
+    def test_unknown_codes_are_cached(self):
+        self.assertIsNone(resolve_code('nosuch1'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_code('nosuch1'))
+            with self.assertRaises(Http404):
+                resolve_active_or_404('nosuch1')
+        stats = resolution_stats()
+        self.assertEqual((stats['misses'], stats['negative_hits']), (1, 2))
+
+        # Creating the link replaces the cached "missing" answer
+        link = ReferralLink.objects.create(user=self.agent, code='nosuch1')
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_active_or_404('nosuch1').id, link.id)
+
+    def test_changes_invalidate_the_cached_link(self):
+        link = ReferralLink.objects.create(user=self.agent, code='cached1', insurance_type='home')
+        self.assertEqual(resolve_code('cached1'), ResolvedLink(link.id, 'cached1', self.agent.id, True, 'home'))
+        with self.assertNumQueries(0):
+            resolve_active_or_404('cached1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            link.deactivate()
+        with self.assertRaises(Http404):
+            resolve_active_or_404('cached1')
+        link.delete()
+        self.assertIsNone(resolve_code('cached1'))
+        self.assertGreaterEqual(resolution_stats()['invalidations'], 2)
+
+    def test_per_process_cache_keeps_entries_briefly(self):
+        ReferralLink.objects.create(user=self.agent, code='brief1')
+        with mock.patch.object(cache, 'set') as cache_set:
+            resolve_code('brief1')
+            resolve_code('brief2')
+        self.assertEqual([call.args[2] for call in cache_set.call_args_list], [5, 5])
+        with override_settings(REFERRAL_LINK_CACHE={'LOCAL_TIMEOUT': 3600}):
+            with mock.patch.object(cache, 'set') as cache_set:
+                resolve_code('brief3')
+        self.assertEqual(cache_set.call_args.args[2], 30)
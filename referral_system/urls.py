@@ -21,11 +21,17 @@ urlpatterns = [
     path('ref/<str:code>/', views.referral_landing, name='referral_landing'),
     path('generate-link/', views.generate_referral_link, name='generate_referral_link'),
     path('my-links/', views.my_links, name='my_links'),
+    path('links/bulk/', views.bulk_provision_links, name='bulk_provision_links'),
     path('disclaimer/', views.disclaimer, name='disclaimer'),
     path('links/<uuid:link_id>/qr/download/', views.download_qr_code, name='download_qr_code'),
     path('qr-code/<uuid:link_id>/', views.view_qr_code, name='view_qr_code'),
+    path('qr-code/<uuid:link_id>/image/', views.qr_code_image, name='qr_code_image'),
     path('leads/<uuid:link_id>/', views.view_leads, name='view_leads'),
+    path('leads/<uuid:link_id>/export/', views.export_link_leads, name='export_link_leads'),
+    path('leads/export/', views.export_leads, name='export_leads'),
     path('lead-details/<int:lead_id>/', views.lead_detail, name='lead_details'),
-    path('download-qr-code/<uuid:link_id>/', views.download_qr_code, name='download_qr_code'),
+    # Old download address, kept for bookmarks; reverse download_qr_code instead
+    path('download-qr-code/<uuid:link_id>/', views.download_qr_code, name='download_qr_code_legacy'),
+    path('link-cache-stats/', views.link_cache_stats, name='link_cache_stats'),
     path('payment-preferences/', views.payment_preferences, name='payment_preferences'),
 ]
@@ -1,34 +1,46 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
-import random
-import string
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from .models import ReferralLink, AgentPaymentPreference, AgentRateOverride
 from lead_capture.models import Lead
 from django.urls import reverse
-import qrcode
-import io
-import base64
 from django.contrib import messages
+from .codes import allocate_code
+from .counters import record_visit
+from .exports import ExportError, stream_leads
+from .pagination import InvalidCursor, keyset_page
+from .provisioning import (
+    MAX_LINKS_PER_UPLOAD, ProvisioningError, iter_zip, parse_rows, provision_links, render_link_qrs,
+)
+from .qr import QRParamError, link_qr_url, parse_qr_params, qr_key, qr_response
+from .resolution import resolution_stats, resolve_active_or_404
+from .stats import get_agent_stats
+import uuid
 
 # Create your views here.
 
-def generate_unique_code(length=8):
-    """Generate a random alphanumeric code of specified length"""
-    chars = string.ascii_letters + string.digits
-    while True:
-        code = ''.join(random.choice(chars) for _ in range(length))
-        if not ReferralLink.objects.filter(code=code).exists():
-            return code
+LINKS_PAGE_SIZE = 50
+LEADS_PAGE_SIZE = 50
+
+# Columns the list templates render; the rest (notably validation_details
+# and user_agent) stay in the database
+LINK_LIST_FIELDS = ('id', 'code', 'name', 'target_state', 'created_at', 'clicks',
+                    'conversions', 'earnings', 'is_active')
+LEAD_LIST_FIELDS = ('id', 'name', 'email', 'phone', 'insurance_type', 'created_at', 'validation_score')
+
+def generate_unique_code():
+    """Issue a new referral code; unique without querying the links (see codes.py)"""
+    return allocate_code()
 
 def referral_landing(request, code):
     """Landing page for referral links - now redirects to lead capture form"""
-    # Get the referral link
-    link = get_object_or_404(ReferralLink, code=code, is_active=True)
+    # Resolve the code (cached, including unknown codes, see resolution.py)
+    link = resolve_active_or_404(code)
+    record_visit(link.id)
     
     # Store referral info in session for attribution
     request.session['referral_code'] = code
-    request.session['referrer_id'] = str(link.user.id)
+    request.session['referrer_id'] = str(link.user_id)
     
     # Redirect to the lead capture form in the new app
     return redirect('lead_capture:lead_form', code=code)
@@ -88,25 +100,59 @@ def generate_referral_link(request):
 @login_required
 def my_links(request):
     """View all referral links for the logged-in user"""
-    links = ReferralLink.objects.filter(user=request.user).order_by('-created_at')
+    links = ReferralLink.objects.filter(user=request.user)
+    
+    # Dashboard totals come from the materialized stats row
+    stats = get_agent_stats(request.user)
+    
+    try:
+        page = keyset_page(links.only(*LINK_LIST_FIELDS), request.GET.get('cursor'),
+                           page_size=LINKS_PAGE_SIZE, pk_type=uuid.UUID)
+    except InvalidCursor:
+        return redirect('referral_system:my_links')
+    
+    return render(request, 'referral_system/my_links.html', {'links': page, 'stats': stats})
+
+@login_required
+def bulk_provision_links(request):
+    """
+    Create many referral links from an uploaded CSV or JSON file and return
+    a ZIP of their QR codes with a manifest.csv. The file may be posted as
+    the `file` form field or as a text/csv or application/json body;
+    format, size and ecc choose the QR output as for download_qr_code.
+    At most MAX_LINKS_PER_UPLOAD links, since the QR codes are rendered in
+    the request; manage.py provision_links takes larger files.
+    """
+    if request.method != 'POST':
+        return render(request, 'referral_system/bulk_links.html', {'max_links': MAX_LINKS_PER_UPLOAD})
     
-    # Calculate totals
-    total_clicks = sum(link.clicks for link in links)
-    total_conversions = sum(link.conversions for link in links)
-    total_earnings = sum(link.earnings for link in links)
+    try:
+        # Query string for API clients, form fields for the upload page
+        fmt, size, error_level = parse_qr_params({**request.POST.dict(), **request.GET.dict()})
+    except QRParamError as e:
+        return HttpResponseBadRequest(str(e))
     
-    # Calculate conversion rate
-    conversion_rate = 0
-    if total_clicks > 0:
-        conversion_rate = (total_conversions / total_clicks) * 100
+    upload = request.FILES.get('file')
+    if upload is not None:
+        data = upload.read()
+        content_type = 'application/json' if upload.name.lower().endswith('.json') else 'text/csv'
+    else:
+        data = request.body
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type not in ('text/csv', 'application/json'):
+            return JsonResponse({'error': f'Unsupported content type {content_type or "(none)"}; '
+                                          f'send text/csv or application/json'}, status=415)
     
-    # Add totals to links
-    links.total_clicks = total_clicks
-    links.total_conversions = total_conversions
-    links.conversion_rate = conversion_rate
-    links.total_earnings = total_earnings
+    try:
+        links = provision_links(request.user, parse_rows(data, content_type, max_rows=MAX_LINKS_PER_UPLOAD))
+    except ProvisioningError as e:
+        return JsonResponse({'error': 'No links were created', 'errors': e.errors}, status=400)
     
-    return render(request, 'referral_system/my_links.html', {'links': links})
+    # Rendered in this worker; the upload cap bounds the time it takes
+    paths = render_link_qrs(links, fmt, size, error_level, workers=1)
+    response = StreamingHttpResponse(iter_zip(links, paths, fmt), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="referral_links_{len(links)}.zip"'
+    return response
 
 # Add an alias for backward compatibility
 my_referral_links = my_links  # This ensures old references to my_referral_links still work
@@ -117,70 +163,67 @@ def disclaimer(request):
 
 @login_required
 def download_qr_code(request, link_id):
-    """Download QR code for a specific referral link"""
+    """Download QR code for a specific referral link (?format=png|svg&size=<px>&ecc=L|M|Q|H)"""
     link = get_object_or_404(ReferralLink, id=link_id, user=request.user)
-    
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(link.generate_full_url(request))
-    qr.make(fit=True)
-    
-    # Create QR code image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to BytesIO
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
-    # Create response
-    response = HttpResponse(buffer, content_type='image/png')
-    response['Content-Disposition'] = f'attachment; filename="qr_code_{link.code}.png"'
-    
-    return response
+    try:
+        fmt, size, error_level = parse_qr_params(request.GET)
+    except QRParamError as e:
+        return HttpResponseBadRequest(str(e))
+    return qr_response(request, link_qr_url(link), fmt, size, error_level,
+                       filename=f"qr_code_{link.code}.{fmt}")
+
+@login_required
+def qr_code_image(request, link_id):
+    """QR code image for a specific referral link, served from the QR cache"""
+    link = get_object_or_404(ReferralLink, id=link_id, user=request.user)
+    try:
+        fmt, size, error_level = parse_qr_params(request.GET)
+    except QRParamError as e:
+        return HttpResponseBadRequest(str(e))
+    return qr_response(request, link_qr_url(link), fmt, size, error_level)
 
 @login_required
 def view_qr_code(request, link_id):
     """View QR code for a specific referral link"""
     link = get_object_or_404(ReferralLink, id=link_id, user=request.user)
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(link.generate_full_url(request))
-    qr.make(fit=True)
-    
-    # Create QR code image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to BytesIO and encode as base64
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
-    qr_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    # Versioned image URL: the browser caches it until the encoded URL changes
+    qr_image_url = f"{reverse('referral_system:qr_code_image', args=[link.id])}?v={qr_key(link_qr_url(link))}"
     
     return render(request, 'referral_system/qr_code.html', {
         'link': link,
-        'qr_image': qr_image
+        'qr_image_url': qr_image_url
     })
 
 @login_required
 def view_leads(request, link_id):
     """View leads for a specific referral link"""
-    link = get_object_or_404(ReferralLink, id=link_id, user=request.user)
-    leads = Lead.objects.filter(referral_link=link).order_by('-created_at')
+    link = get_object_or_404(ReferralLink.objects.only('id', 'code', 'user_id'), id=link_id, user=request.user)
+    leads = Lead.objects.filter(referral_link=link).only(*LEAD_LIST_FIELDS)
     
-    return render(request, 'referral_system/view_leads.html', {'link': link, 'leads': leads})
+    try:
+        page = keyset_page(leads, request.GET.get('cursor'), page_size=LEADS_PAGE_SIZE)
+    except InvalidCursor:
+        return redirect('referral_system:view_leads', link_id=link.id)
+    
+    return render(request, 'referral_system/view_leads.html', {'link': link, 'leads': page})
+
+def _export_response(leads, request, filename):
+    try:
+        return stream_leads(leads, request.GET, filename)
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@login_required
+def export_link_leads(request, link_id):
+    """Stream the leads of one referral link as CSV or NDJSON"""
+    link = get_object_or_404(ReferralLink, id=link_id, user=request.user)
+    return _export_response(Lead.objects.filter(referral_link=link), request, f'leads_{link.code}')
+
+@login_required
+def export_leads(request):
+    """Stream all of the agent's leads as CSV or NDJSON"""
+    return _export_response(Lead.objects.filter(agent=request.user), request, 'leads')
 
 def lead_detail(request, lead_id):
     """View details of a specific lead"""
@@ -198,6 +241,13 @@ def lead_detail(request, lead_id):
     
     return render(request, 'referral_system/lead_details.html', {'lead': lead})
 
+@login_required
+def link_cache_stats(request):
+    """Referral code resolution cache counters for this worker process (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    return JsonResponse(resolution_stats())
+
 @login_required
 def payment_preferences(request):
     """View and update payment preferences"""
@@ -247,6 +297,9 @@ def payment_preferences(request):
             # Validate inputs
             if not rate or float(rate) <= 0:
                 messages.error(request, "Please enter a valid rate amount.")
+            elif not state and not insurance_type:
+                messages.error(request, "Please choose a state or an insurance type for the override "
+                                        "(your default rate applies to everything else).")
             else:
                 # Check if an override already exists
                 try: